@@ -4,20 +4,144 @@ Streamlit Dashboard for Calendar Time Tracker
 # fmt: off
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+from calendar import monthrange
 from datetime import datetime, timedelta
 import sys
 import os
+import time
+import hmac
+import ipaddress
+import pytz
+from googleapiclient.errors import HttpError
 
 # Add src directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from calendar_client import CalendarClient
-from metrics import TimeTracker
+from streamlit.web.server.websocket_headers import _get_websocket_headers
+from backend import Backend
+from cache import ttl_for_range
+from charting import auto_granularity, downsample, page_count
+from config import (AUTO_REFRESH_INTERVAL, MULTI_USER, PREFETCH_ENABLED, PROXY_SECRET,
+                    PROXY_SECRET_HEADER, PUSH_ADDRESS,
+                    STREAK_MIN_DEEP_WORK_HOURS, TABLE_PAGE_SIZE, TIMEZONE,
+                    TREND_COMPARISON_PERIODS, TREND_SHOWN_DAYS, TREND_WINDOWS, USER_HEADER)
+from incremental import IncrementalMetrics
+from instrumentation import perf
+from rate_limiter import RateLimitError
+from trends import DEEP_WORK, TOTAL, history_days, load_series
 # fmt: on
 
 
+# Views computed with TimeTracker.calculate_range_metrics
+RANGE_VIEWS = ["Quarterly", "Yearly", "Custom"]
+DEFAULT_GRANULARITY = {"Quarterly": 'week', "Yearly": 'month', "Custom": 'auto'}
+
+# Series longer than this many points (before downsampling) use WebGL traces
+SCATTERGL_THRESHOLD = 1000
+
+OVERLAP_POLICY_LABELS = {
+    'sum': "Count each event fully",
+    'priority': "Count once, by category priority",
+    'proportional': "Count once, split evenly"
+}
+
+
+def previous_year(date):
+    """Same date one year earlier, mapping Feb 29 to Feb 28"""
+    try:
+        return date.replace(year=date.year - 1)
+    except ValueError:
+        return date.replace(year=date.year - 1, day=28)
+
+
+@st.cache_resource
+def get_backend():
+    """Backend shared by every session of this server process"""
+    return Backend()
+
+
+def current_user():
+    """
+    ID of the user viewing the dashboard
+
+    Anyone reaching Streamlit directly could set USER_HEADER themselves,
+    so it is only trusted from the proxy: requests must carry PROXY_SECRET,
+    or without a secret Streamlit must listen on a loopback address only.
+
+    Returns:
+        None in single-user mode; in multi-user mode, the identity the
+        authenticating proxy passed in the USER_HEADER request header
+
+    Raises:
+        PermissionError: If the request did not come through the proxy
+    """
+    if not MULTI_USER:
+        return None
+
+    headers = {
+        name.lower(): value for name, value in (_get_websocket_headers() or {}).items()}
+    if PROXY_SECRET:
+        secret = headers.get(PROXY_SECRET_HEADER.lower(), '')
+        if not hmac.compare_digest(secret.encode(), PROXY_SECRET.encode()):
+            raise PermissionError(
+                f"Missing or wrong {PROXY_SECRET_HEADER} header: in multi-user mode the "
+                "dashboard only serves requests passed on by the authenticating proxy")
+    elif not listens_on_loopback():
+        raise PermissionError(
+            "Multi-user mode trusts the user named by the proxy, so either set "
+            "PROXY_SECRET in config.py or run Streamlit with "
+            "--server.address 127.0.0.1 behind a proxy on the same host")
+
+    user_id = headers.get(USER_HEADER.lower())
+    if not user_id:
+        raise PermissionError(
+            f"No {USER_HEADER} header: in multi-user mode the dashboard must run "
+            "behind a proxy that signs users in")
+    return user_id.strip().lower()
+
+
+def listens_on_loopback():
+    """Check whether Streamlit only accepts connections from this host"""
+    address = st.get_option('server.address')
+    if address == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(address).is_loopback
+    except (TypeError, ValueError):
+        # Unset (all interfaces) or a host name
+        return False
+
+
+def plot_chart(fig):
+    """Render a Plotly figure, timed as the 'render_chart' stage"""
+    with perf.stage('render_chart'):
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def line_trace(x, y, name, mode='lines'):
+    """Line trace of a series, downsampled and drawn with WebGL when long"""
+    scatter = go.Scattergl if len(y) > SCATTERGL_THRESHOLD else go.Scatter
+    x, y = downsample(list(x), list(y))
+    perf.count('chart_points', len(x))
+    return scatter(x=x, y=y, name=name, mode=mode)
+
+
+def set_perf_enabled():
+    """Apply the Performance checkbox to the process-wide instrumentation"""
+    perf.enabled = st.session_state.perf_enabled
+
+
+def show_table(df, key):
+    """Render a DataFrame one page of TABLE_PAGE_SIZE rows at a time"""
+    pages = page_count(len(df))
+    if pages > 1:
+        page = st.number_input(
+            f"Page (of {pages}, {len(df)} rows)", min_value=1, max_value=pages, key=key)
+        df = df.iloc[(page - 1) * TABLE_PAGE_SIZE:page * TABLE_PAGE_SIZE]
+    perf.count('table_rows', len(df))
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+
 # Page configuration
 st.set_page_config(
     page_title="Calendar Time Tracker",
@@ -26,17 +150,40 @@ st.set_page_config(
 )
 
 # Initialize session state
-if 'tracker' not in st.session_state:
-    try:
-        client = CalendarClient()
-        st.session_state.tracker = TimeTracker(client)
-        st.session_state.initialized = True
-    except FileNotFoundError as e:
-        st.session_state.initialized = False
-        st.session_state.error = str(e)
-    except Exception as e:
-        st.session_state.initialized = False
-        st.session_state.error = f"Error initializing: {str(e)}"
+# The user's client, event store, rollups, metrics cache and background
+# workers are shared with the user's other sessions through the backend;
+# a user closed by the backend in the meantime is reopened here
+try:
+    user = get_backend().user(current_user())
+    if st.session_state.get('user') is not user:
+        if 'live_metrics' in st.session_state:
+            st.session_state.pop('live_metrics').close()
+        st.session_state.pop('calendars', None)
+        st.session_state.user = user
+        st.session_state.tracker = user.tracker()
+        st.session_state.metrics_cache = user.cache
+
+        # Keeps recent periods warm once the first calculation has logged
+        # in, and syncs calendars when notified of changes instead of
+        # polling them
+        receiver = None
+        if PUSH_ADDRESS:
+            try:
+                receiver = get_backend().push_receiver()
+            except OSError as e:
+                st.session_state.push_error = f"Push receiver not started: {e}"
+        user.start_background(prefetch=PREFETCH_ENABLED, receiver=receiver)
+
+    st.session_state.initialized = True
+except PermissionError as e:
+    st.session_state.initialized = False
+    st.session_state.error = str(e)
+except FileNotFoundError as e:
+    st.session_state.initialized = False
+    st.session_state.error = str(e)
+except Exception as e:
+    st.session_state.initialized = False
+    st.session_state.error = f"Error initializing: {str(e)}"
 
 # Title
 st.title("📊 Calendar Time Tracker")
@@ -52,9 +199,13 @@ st.sidebar.header("Date Range Selection")
 
 view_type = st.sidebar.radio(
     "View Type",
-    ["Daily", "Weekly", "Monthly"]
+    ["Daily", "Weekly", "Monthly", "Quarterly", "Yearly", "Custom"]
 )
 
+# Years offered in the year selectors
+current_year = datetime.now().year
+years = list(range(current_year - 10, current_year + 2))
+
 if view_type == "Daily":
     selected_date = st.sidebar.date_input(
         "Select Date",
@@ -67,7 +218,7 @@ elif view_type == "Weekly":
         value=datetime.now() - timedelta(days=datetime.now().weekday())
     )
 
-else:  # Monthly
+elif view_type == "Monthly":
     col1, col2 = st.sidebar.columns(2)
     selected_month = col1.selectbox(
         "Month",
@@ -77,41 +228,251 @@ else:  # Monthly
     )
     selected_year = col2.selectbox(
         "Year",
-        range(2020, 2030),
-        index=datetime.now().year - 2020
+        years,
+        index=years.index(current_year)
+    )
+
+elif view_type == "Quarterly":
+    col1, col2 = st.sidebar.columns(2)
+    selected_quarter = col1.selectbox(
+        "Quarter",
+        [1, 2, 3, 4],
+        index=(datetime.now().month - 1) // 3,
+        format_func=lambda q: f"Q{q}"
+    )
+    selected_year = col2.selectbox(
+        "Year",
+        years,
+        index=years.index(current_year)
+    )
+
+elif view_type == "Yearly":
+    selected_year = st.sidebar.selectbox(
+        "Year",
+        years,
+        index=years.index(current_year)
+    )
+
+else:  # Custom
+    selected_date = st.sidebar.date_input(
+        "Start Date",
+        value=datetime.now() - timedelta(days=29)
+    )
+    custom_days = st.sidebar.number_input(
+        "Number of Days",
+        min_value=1,
+        max_value=3660,
+        value=30
+    )
+
+if view_type in RANGE_VIEWS:
+    granularity = st.sidebar.selectbox(
+        "Group By",
+        ['auto', 'day', 'week', 'month'],
+        index=['auto', 'day', 'week', 'month'].index(
+            DEFAULT_GRANULARITY[view_type]),
+        format_func=str.title,
+        help="Auto groups by day, week or month depending on the range length"
+    )
+    compare_previous_year = st.sidebar.checkbox("Compare with previous year")
+else:
+    granularity = None
+    compare_previous_year = False
+
+# Calendar selection
+# Listing calendars requires authentication, so until the first calculation
+# has authenticated only the tracked calendars are offered
+if 'calendars' not in st.session_state and st.session_state.tracker.client.authenticated:
+    try:
+        st.session_state.calendars = {
+            'primary' if cal.get('primary') else cal['id']: cal.get('summary', cal['id'])
+            for cal in st.session_state.tracker.client.list_calendars()
+        }
+    except Exception:
+        st.session_state.calendars = {'primary': 'Primary'}
+
+calendar_names = st.session_state.get('calendars') or {
+    cal: 'Primary' if cal == 'primary' else cal
+    for cal in st.session_state.tracker.calendar_ids
+}
+
+selected_calendars = st.sidebar.multiselect(
+    "Calendars",
+    list(calendar_names),
+    default=[
+        cal for cal in st.session_state.tracker.calendar_ids
+        if cal in calendar_names
+    ] or ['primary'],
+    format_func=lambda cal: calendar_names.get(cal, cal)
+)
+st.session_state.tracker.calendar_ids = selected_calendars or ['primary']
+
+# Overlap accounting; part of the tracker's config version, so cached
+# results for another policy are not reused
+st.session_state.tracker.overlap_policy = st.sidebar.selectbox(
+    "Overlapping Events",
+    list(OVERLAP_POLICY_LABELS),
+    index=list(OVERLAP_POLICY_LABELS).index(st.session_state.tracker.overlap_policy),
+    format_func=OVERLAP_POLICY_LABELS.get
+)
+
+# Date range covered by the selected view
+if view_type == "Daily":
+    range_start = datetime.combine(selected_date, datetime.min.time())
+    range_end = range_start
+elif view_type == "Weekly":
+    range_start = datetime.combine(selected_date, datetime.min.time())
+    range_end = range_start + timedelta(days=6)
+elif view_type == "Monthly":
+    range_start = datetime(selected_year, selected_month, 1)
+    range_end = datetime(
+        selected_year, selected_month, monthrange(selected_year, selected_month)[1])
+elif view_type == "Quarterly":
+    last_month = selected_quarter * 3
+    range_start = datetime(selected_year, last_month - 2, 1)
+    range_end = datetime(
+        selected_year, last_month, monthrange(selected_year, last_month)[1])
+elif view_type == "Yearly":
+    range_start = datetime(selected_year, 1, 1)
+    range_end = datetime(selected_year, 12, 31)
+else:  # Custom
+    range_start = datetime.combine(selected_date, datetime.min.time())
+    range_end = range_start + timedelta(days=int(custom_days) - 1)
+
+# Keep long ranges to a bounded number of periods
+if granularity == 'auto':
+    granularity = auto_granularity(range_start, range_end)
+
+# Today and this week can be kept current from synced changes
+today = datetime.combine(datetime.now(), datetime.min.time())
+this_week = [today - timedelta(days=today.weekday() - i) for i in range(7)]
+auto_refresh = (
+    (view_type == "Daily" and range_start == today)
+    or (view_type == "Weekly" and range_start == this_week[0])
+) and st.sidebar.checkbox(
+    "Auto-refresh",
+    help=f"Update from calendar changes every {AUTO_REFRESH_INTERVAL} seconds"
+)
+
+
+def compute_metrics(start=range_start, end=range_end):
+    tracker = st.session_state.tracker
+    if view_type == "Daily":
+        return tracker.calculate_daily_metrics(start)
+    elif view_type == "Weekly":
+        return tracker.calculate_weekly_metrics(start)
+    elif view_type == "Monthly":
+        return tracker.calculate_monthly_metrics(start.year, start.month)
+    else:
+        return tracker.calculate_range_metrics(start, end, granularity)
+
+
+def cached_metrics(start, end, compute=False):
+    """Get metrics for a range from the cache, computing them if requested"""
+    # Results are cached per view, range, calendars and category config
+    key = (
+        view_type,
+        start,
+        end,
+        granularity,
+        st.session_state.tracker.scope(),
+        st.session_state.tracker.config_version()
+    )
+    if not compute:
+        return st.session_state.metrics_cache.get(key)
+
+    return st.session_state.metrics_cache.get_or_compute(
+        key,
+        lambda: compute_metrics(start, end),
+        ttl_for_range(start, end),
+        start,
+        end
     )
 
+
+def show_metrics(compute=False):
+    """Load metrics for the selected view into the session state"""
+    metrics = cached_metrics(range_start, range_end, compute)
+    if metrics is None:
+        return False
+
+    comparison = None
+    if compare_previous_year:
+        comparison = cached_metrics(
+            previous_year(range_start), previous_year(range_end), compute)
+
+    st.session_state.current_metrics = metrics
+    st.session_state.comparison_metrics = comparison
+    st.session_state.view_type = view_type
+    return True
+
+
 # Calculate metrics button
 if st.sidebar.button("Calculate Metrics", type="primary"):
     with st.spinner("Fetching calendar data..."):
         try:
-            if view_type == "Daily":
-                metrics = st.session_state.tracker.calculate_daily_metrics(
-                    datetime.combine(selected_date, datetime.min.time())
-                )
-                st.session_state.current_metrics = metrics
-                st.session_state.view_type = "Daily"
-
-            elif view_type == "Weekly":
-                metrics = st.session_state.tracker.calculate_weekly_metrics(
-                    datetime.combine(selected_date, datetime.min.time())
-                )
-                st.session_state.current_metrics = metrics
-                st.session_state.view_type = "Weekly"
-
-            else:  # Monthly
-                metrics = st.session_state.tracker.calculate_monthly_metrics(
-                    selected_year, selected_month
-                )
-                st.session_state.current_metrics = metrics
-                st.session_state.view_type = "Monthly"
-
+            perf.reset()
+            with perf.stage('calculate'):
+                show_metrics(compute=True)
+            perf.write_log(view=view_type, start=range_start, end=range_end)
             st.success("Metrics calculated successfully!")
+        except FileNotFoundError as e:
+            st.error(str(e))
+            st.info("Please follow the setup instructions in SETUP.md to configure Google Calendar API access.")
+        except RateLimitError as e:
+            wait = f" in about {e.retry_after:.0f} seconds" if e.retry_after else " in a minute"
+            st.error(f"Google Calendar API quota exceeded. Please try again{wait}.")
+        except HttpError as e:
+            st.error(f"Google Calendar API error ({e.resp.status}): {e.reason}")
         except Exception as e:
             st.error(f"Error calculating metrics: {str(e)}")
+else:
+    # Show cached results immediately when switching views or dates
+    show_metrics()
+
+
+def show_live_metrics():
+    """Load today's or this week's metrics from the incremental window"""
+    tracker = st.session_state.tracker
+    if tracker.overlap_policy != 'sum':
+        st.sidebar.caption(
+            f"Auto-refresh needs \"{OVERLAP_POLICY_LABELS['sum']}\" for overlapping events")
+        return
+    if not tracker.client.authenticated:
+        st.sidebar.caption("Auto-refresh starts after the first calculation")
+        return
+
+    # Only changed events are applied on each refresh
+    live = st.session_state.get('live_metrics')
+    if live is None or not live.matches(tracker, this_week):
+        if live is not None:
+            live.close()
+        live = st.session_state.live_metrics = IncrementalMetrics(tracker, this_week)
+
+    try:
+        live.refresh(AUTO_REFRESH_INTERVAL)
+    except RateLimitError:
+        st.sidebar.warning("Google Calendar API quota exceeded; showing the last update")
+    except HttpError as e:
+        st.sidebar.warning(f"Google Calendar API error ({e.resp.status}); showing the last update")
+
+    if view_type == "Daily":
+        st.session_state.current_metrics = live.daily_metrics(range_start)
+    else:
+        st.session_state.current_metrics = live.weekly_metrics()
+    st.session_state.comparison_metrics = None
+    st.session_state.view_type = view_type
+
+
+if auto_refresh:
+    show_live_metrics()
 
 # Display metrics if available
 if 'current_metrics' in st.session_state:
+    # Plotly is only loaded once there is something to chart
+    import plotly.express as px
+    import plotly.graph_objects as go
+
     metrics = st.session_state.current_metrics
 
     # Display date range
@@ -120,9 +481,12 @@ if 'current_metrics' in st.session_state:
     elif st.session_state.view_type == "Weekly":
         st.subheader(
             f"Weekly Metrics: {metrics['start_date'].strftime('%b %d')} - {metrics['end_date'].strftime('%b %d, %Y')}")
-    else:
+    elif st.session_state.view_type == "Monthly":
         st.subheader(
             f"Monthly Metrics: {datetime(metrics['year'], metrics['month'], 1).strftime('%B %Y')}")
+    else:
+        st.subheader(
+            f"{st.session_state.view_type} Metrics: {metrics['start_date'].strftime('%b %d, %Y')} - {metrics['end_date'].strftime('%b %d, %Y')}")
 
     # Key metrics row
     col1, col2, col3, col4 = st.columns(4)
@@ -157,6 +521,12 @@ if 'current_metrics' in st.session_state:
                 "Avg Daily Deep Work",
                 f"{avg_daily:.2f} hrs"
             )
+        elif st.session_state.view_type in RANGE_VIEWS:
+            avg_daily = metrics['deep_work_hours'] / len(metrics['daily_metrics'])
+            st.metric(
+                "Avg Daily Deep Work",
+                f"{avg_daily:.2f} hrs"
+            )
 
     st.divider()
 
@@ -193,7 +563,7 @@ if 'current_metrics' in st.session_state:
                 names='Category',
                 title='Time Distribution'
             )
-            st.plotly_chart(fig, use_container_width=True)
+            plot_chart(fig)
 
     # Daily breakdown for weekly/monthly views
     if st.session_state.view_type in ["Weekly", "Monthly"] and 'daily_metrics' in metrics:
@@ -236,40 +606,276 @@ if 'current_metrics' in st.session_state:
                 x='Week', y='Avg Hours/Day', color='Category', barmode='group',
                 title='7-Day Avg Hours per Day by Category'
             )
-            st.plotly_chart(fig2, use_container_width=True)
-            st.dataframe(weekly_df, use_container_width=True, hide_index=True)
+            plot_chart(fig2)
+            show_table(weekly_df, 'weekly_table_page')
 
         st.divider()
         st.subheader("Daily Breakdown")
 
         # Line chart
         fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=daily_df['Date'],
-            y=daily_df['Total Hours'],
-            name='Total Hours',
-            mode='lines+markers'
-        ))
-        fig.add_trace(go.Scatter(
-            x=daily_df['Date'],
-            y=daily_df['Deep Work'],
-            name='Deep Work Hours',
-            mode='lines+markers'
-        ))
+        fig.add_trace(line_trace(
+            daily_df['Date'], daily_df['Total Hours'], 'Total Hours', 'lines+markers'))
+        fig.add_trace(line_trace(
+            daily_df['Date'], daily_df['Deep Work'], 'Deep Work Hours', 'lines+markers'))
         fig.update_layout(
             title='Daily Time Tracking',
             xaxis_title='Date',
             yaxis_title='Hours',
             hovermode='x unified'
         )
-        st.plotly_chart(fig, use_container_width=True)
+        plot_chart(fig)
 
         # Daily table
-        st.dataframe(daily_df, use_container_width=True, hide_index=True)
+        show_table(daily_df, 'daily_table_page')
+
+    # Period breakdown for quarter, year and custom views
+    if st.session_state.view_type in RANGE_VIEWS:
+        st.divider()
+        st.subheader(f"Breakdown by {metrics['granularity'].title()}")
+
+        period_df = pd.DataFrame([
+            {
+                'Period': period['label'],
+                'Total Hours': period['total_hours'],
+                'Deep Work': period['deep_work_hours'],
+                **period['category_hours']
+            }
+            for period in metrics['periods']
+        ])
+
+        # Long ranges are downsampled, so the chart's size stays bounded
+        fig = go.Figure()
+        fig.add_trace(line_trace(period_df['Period'], period_df['Total Hours'], 'Total Hours'))
+        fig.add_trace(line_trace(period_df['Period'], period_df['Deep Work'], 'Deep Work Hours'))
+        fig.update_layout(
+            title=f"{metrics['granularity'].title()} Time Tracking",
+            xaxis_title=metrics['granularity'].title(),
+            yaxis_title='Hours',
+            hovermode='x unified'
+        )
+        plot_chart(fig)
+        show_table(period_df, 'period_table_page')
+
+        comparison = st.session_state.get('comparison_metrics')
+        if comparison:
+            st.divider()
+            st.subheader(
+                f"Year-over-Year: {comparison['start_date'].strftime('%b %d, %Y')} - {comparison['end_date'].strftime('%b %d, %Y')}")
+
+            col1, col2 = st.columns(2)
+            col1.metric(
+                "Total Tracked Time",
+                f"{metrics['total_hours']:.1f} hrs",
+                f"{metrics['total_hours'] - comparison['total_hours']:+.1f} hrs"
+            )
+            col2.metric(
+                "Deep Work Time",
+                f"{metrics['deep_work_hours']:.1f} hrs",
+                f"{metrics['deep_work_hours'] - comparison['deep_work_hours']:+.1f} hrs"
+            )
+
+            categories = sorted(
+                set(metrics['category_hours']) | set(comparison['category_hours']))
+            yoy_df = pd.DataFrame([
+                {'Category': cat, 'Period': label, 'Hours': result['category_hours'].get(cat, 0)}
+                for label, result in [('Previous Year', comparison), ('Selected', metrics)]
+                for cat in categories
+            ])
+            fig = px.bar(
+                yoy_df, x='Category', y='Hours', color='Period', barmode='group',
+                title='Hours by Category vs. Previous Year'
+            )
+            plot_chart(fig)
+
+            # Periods are aligned by position within the range
+            fig = go.Figure()
+            for label, result in [('Selected', metrics), ('Previous Year', comparison)]:
+                fig.add_trace(line_trace(
+                    range(1, len(result['periods']) + 1),
+                    [period['deep_work_hours'] for period in result['periods']],
+                    label
+                ))
+            fig.update_layout(
+                title=f"Deep Work per {metrics['granularity'].title()}",
+                xaxis_title=f"{metrics['granularity'].title()} of Range",
+                yaxis_title='Hours',
+                hovermode='x unified'
+            )
+            plot_chart(fig)
 
 else:
     st.info("👈 Select a date range and click 'Calculate Metrics' to view your time tracking data")
 
+
+def trend_series():
+    """Get the Trends panel's DailySeries from the cache, loading it on a miss"""
+    tracker = st.session_state.tracker
+    days = history_days(TREND_SHOWN_DAYS)
+    start = today - timedelta(days=days - 1)
+    key = ('Trends', today, days, tracker.scope(), tracker.config_version())
+    return st.session_state.metrics_cache.get_or_compute(
+        key,
+        lambda: load_series(tracker, today, days),
+        ttl_for_range(start, today),
+        start,
+        today
+    )
+
+
+def comparison_delta(comparison):
+    """st.metric delta of a DailySeries.compare result"""
+    if comparison['change'] is None:
+        return None
+    return f"{comparison['change']:+.1f} hrs vs. avg of {len(comparison['previous'])}"
+
+
+# Trends (collapsible); every comparison and rolling value comes from
+# prefix sums over the cached daily aggregates
+with st.expander("📈 Trends"):
+    if st.checkbox("Show trends",
+                   help=f"Comparisons, rolling averages and streaks up to today "
+                        f"(last {TREND_SHOWN_DAYS} days charted)"):
+        import plotly.graph_objects as go
+
+        series = None
+        try:
+            series = trend_series()
+        except FileNotFoundError as e:
+            st.error(str(e))
+        except RateLimitError as e:
+            wait = f" in about {e.retry_after:.0f} seconds" if e.retry_after else " in a minute"
+            st.error(f"Google Calendar API quota exceeded. Please try again{wait}.")
+        except HttpError as e:
+            st.error(f"Google Calendar API error ({e.resp.status}): {e.reason}")
+        except Exception as e:
+            st.error(f"Error calculating trends: {str(e)}")
+
+        if series is not None:
+            end = len(series) - 1
+            longest_window = max(TREND_WINDOWS)
+
+            # This week so far against the same weekdays of earlier weeks
+            week_days = today.weekday() + 1
+            week_deep = series.compare(DEEP_WORK, end, week_days, step=7)
+            week_total = series.compare(TOTAL, end, week_days, step=7)
+            window_deep = series.compare(DEEP_WORK, end, longest_window)
+            streaks = series.streaks(last_day_open=True)
+
+            st.write(f"**This week vs. the same days of the last {TREND_COMPARISON_PERIODS} weeks**")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Deep Work this week", f"{week_deep['current']:.1f} hrs",
+                        comparison_delta(week_deep))
+            col2.metric("Tracked this week", f"{week_total['current']:.1f} hrs",
+                        comparison_delta(week_total))
+            col3.metric(f"Deep Work last {longest_window} days", f"{window_deep['current']:.1f} hrs",
+                        comparison_delta(window_deep))
+            col4.metric(
+                "Deep Work streak (days)", streaks['current'],
+                help=f"Consecutive days with at least {STREAK_MIN_DEEP_WORK_HOURS} hours of deep "
+                     "work; today counts once it gets there")
+            if streaks['longest']:
+                st.caption(
+                    f"Longest streak: {streaks['longest']} days "
+                    f"({streaks['longest_start']:%b %d} – {streaks['longest_end']:%b %d, %Y})")
+
+            # Rolling averages over the charted days
+            shown = slice(max(0, len(series) - TREND_SHOWN_DAYS), len(series))
+            dates = [date.strftime('%Y-%m-%d') for date in series.dates[shown]]
+            fig = go.Figure()
+            fig.add_trace(line_trace(
+                dates, series.values[DEEP_WORK][shown], 'Deep Work (daily)', 'markers'))
+            for window in TREND_WINDOWS:
+                fig.add_trace(line_trace(
+                    dates, series.rolling_mean(DEEP_WORK, window)[shown], f'{window}-day average'))
+            fig.update_layout(
+                title='Deep Work Hours per Day',
+                xaxis_title='Date',
+                yaxis_title='Hours',
+                hovermode='x unified'
+            )
+            plot_chart(fig)
+
+            # Categories this week against their baseline
+            category_rows = []
+            for category in series.categories:
+                comparison = series.compare(category, end, week_days, step=7)
+                category_rows.append({
+                    'Category': category,
+                    'This Week': round(comparison['current'], 2),
+                    f'Avg of Last {len(comparison["previous"])} Weeks': (
+                        None if comparison['baseline'] is None else round(comparison['baseline'], 2)),
+                    'Change': None if comparison['change'] is None else round(comparison['change'], 2)
+                })
+            if category_rows:
+                show_table(pd.DataFrame(category_rows), 'trend_table_page')
+
+# Performance section (collapsible)
+with st.expander("⏱️ Performance"):
+    # Instrumentation is process-wide, so the checkbox shows the current
+    # setting and only changes it when clicked; otherwise every session's
+    # rerun would write back its own stale value
+    st.session_state.perf_enabled = perf.enabled
+    st.checkbox(
+        "Record timings and counters (all sessions)",
+        key='perf_enabled',
+        on_change=set_perf_enabled,
+        help="Applies to every session of this server. Stages are timed from "
+             "the last 'Calculate Metrics' click in any session."
+    )
+
+    snapshot = perf.snapshot()
+    if snapshot['stages']:
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'Stage': name,
+                    'Calls': stage['calls'],
+                    'Total (ms)': round(stage['total_s'] * 1000, 2),
+                    'Self (ms)': round(stage['self_s'] * 1000, 2),
+                    'Max (ms)': round(stage['max_s'] * 1000, 2)
+                }
+                for name, stage in snapshot['stages'].items()
+            ]).sort_values('Total (ms)', ascending=False),
+            hide_index=True,
+            use_container_width=True
+        )
+        col1, col2 = st.columns(2)
+        col1.write("**Counters**")
+        col1.json(snapshot['counters'])
+        col2.write("**Hit rates**")
+        col2.json({name: f"{rate:.0%}" for name, rate in snapshot['hit_rates'].items()})
+    elif perf.enabled:
+        st.info("Click 'Calculate Metrics' to record timings")
+
+    st.write("**API rate limiter** (since startup)")
+    st.json(st.session_state.tracker.client.rate_limiter.stats())
+
+    if st.session_state.user.scheduler is not None:
+        st.write("**Background prefetch**")
+        st.json(st.session_state.user.scheduler.status())
+
+    if st.session_state.user.push is not None:
+        st.write("**Push notifications**")
+        st.json(st.session_state.user.push.status())
+    elif 'push_error' in st.session_state:
+        st.warning(st.session_state.push_error)
+
+    st.write("**Shared backend** (all sessions)")
+    st.json({
+        'this_user_cache': st.session_state.metrics_cache.stats(),
+        **get_backend().stats()
+    })
+
+    if 'live_metrics' in st.session_state:
+        st.write("**Auto-refresh**")
+        live = st.session_state.live_metrics
+        st.json({
+            'days': f"{live.days[0]:%Y-%m-%d} to {live.days[-1]:%Y-%m-%d}",
+            'tracked_events': len(live.events),
+            'applied_changes': live.applied
+        })
+
 # Debug section (collapsible)
 with st.expander("🔍 Debug: View Color Mappings"):
     st.write(
@@ -304,3 +910,27 @@ with st.expander("🔍 Debug: View Color Mappings"):
             """)
         else:
             st.warning("No events found for this date")
+
+    debug_time = st.time_input("What was I doing at", value=datetime.min.time())
+
+    if st.button("Show Activity"):
+        start = datetime.combine(debug_date, datetime.min.time())
+        index = st.session_state.tracker.activity_index(
+            start, start + timedelta(days=1))
+        moment = pytz.timezone(TIMEZONE).localize(
+            datetime.combine(debug_date, debug_time))
+
+        active = index.at(moment.timestamp())
+        if active:
+            st.dataframe(pd.DataFrame(active), use_container_width=True)
+        else:
+            st.warning("No events at this time")
+
+# Rerun for the next auto-refresh; counting down in one second steps keeps
+# the page responsive to input in the meantime
+if auto_refresh:
+    countdown = st.sidebar.empty()
+    for remaining in range(AUTO_REFRESH_INTERVAL, 0, -1):
+        countdown.caption(f"Next refresh in {remaining}s")
+        time.sleep(1)
+    st.rerun()
@@ -0,0 +1,234 @@
+"""
+Offline benchmark suite for Calendar Time Tracker
+
+Times TimeTracker metrics against synthetic calendars served by
+FakeCalendarService, so no credentials or network access are needed, and
+the cold import time of the app's modules.
+Results are written as JSON and can be compared against a previous run
+to catch regressions.
+
+Usage:
+    python benchmarks/bench_metrics.py --size medium --output results.json
+    python benchmarks/bench_metrics.py --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from calendar_client import CalendarClient  # noqa: E402
+from event_store import EventStore  # noqa: E402
+from fake_calendar import FakeCalendarService, generate_calendar  # noqa: E402
+from metrics import TimeTracker  # noqa: E402
+
+# Synthetic calendar sizes
+SIZES = {
+    'small': {'calendars': 1, 'days': 120, 'events_per_day': 4},
+    'medium': {'calendars': 3, 'days': 400, 'events_per_day': 8},
+    'large': {'calendars': 12, 'days': 1100, 'events_per_day': 12},
+}
+
+START_DATE = datetime(2024, 1, 1)
+
+# Modules whose cold import time is tracked; heavy dependencies should be
+# loaded on first use rather than at import
+IMPORT_MODULES = ['calendar_client', 'metrics', 'frame_metrics', 'event_store',
+                  'rollups', 'cache']
+
+# Run in a fresh interpreter per measurement so nothing is already imported
+IMPORT_SCRIPT = '''
+import sys, time
+sys.path[:0] = [{root!r}, {src!r}]
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+'''
+
+
+def build_service(size, all_day_ratio, overlap_ratio, timezones, latency):
+    """Create a fake service with synthetic calendars of the given size"""
+    params = SIZES[size]
+    calendars = {}
+    for i in range(params['calendars']):
+        calendar_id = 'primary' if i == 0 else f'calendar{i}'
+        calendars[calendar_id] = generate_calendar(
+            days=params['days'],
+            start_date=START_DATE,
+            events_per_day=params['events_per_day'],
+            all_day_ratio=all_day_ratio,
+            overlap_ratio=overlap_ratio,
+            timezones=timezones,
+            seed=i,
+            id_prefix=f'{calendar_id}-'
+        )
+    return FakeCalendarService(calendars, latency=latency)
+
+
+def build_cases(size):
+    """Benchmark cases as (name, function taking a tracker) pairs"""
+    days = SIZES[size]['days']
+    middle = START_DATE + timedelta(days=days // 2)
+    week_start = middle - timedelta(days=middle.weekday())
+    range_end = START_DATE + timedelta(days=days - 1)
+
+    return [
+        ('daily', lambda tracker: tracker.calculate_daily_metrics(middle)),
+        ('weekly', lambda tracker: tracker.calculate_weekly_metrics(week_start)),
+        ('monthly', lambda tracker: tracker.calculate_monthly_metrics(
+            middle.year, middle.month)),
+        ('range_week', lambda tracker: tracker.calculate_range_metrics(
+            START_DATE, range_end, 'week')),
+    ]
+
+
+def time_case(function, tracker, service, repeat):
+    """Run a case repeat times, returning timings and API requests per run"""
+    timings = []
+    requests_before = service.request_count
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(tracker)
+        timings.append(time.perf_counter() - started)
+
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'requests_per_run': (service.request_count - requests_before) / repeat
+    }
+
+
+def time_import(module, repeat):
+    """Measure the cold import time of a module in fresh interpreters"""
+    script = IMPORT_SCRIPT.format(
+        root=ROOT, src=os.path.join(ROOT, 'src'), module=module)
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', script],
+            check=True, capture_output=True, text=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'requests_per_run': 0
+    }
+
+
+def run(args):
+    service = build_service(
+        args.size, args.all_day_ratio, args.overlap_ratio,
+        args.timezones, args.latency)
+    calendar_ids = list(service.calendars)
+    cases = build_cases(args.size)
+    results = {}
+
+    if not args.skip_imports:
+        for module in IMPORT_MODULES:
+            name = f'import/{module}'
+            results[name] = time_import(module, args.repeat)
+            print(f"{name:<28} {results[name]['median_s'] * 1000:10.2f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EventStore(os.path.join(tmp, 'events.db'))
+        sources = {
+            'api': CalendarClient(service=service),
+            'store': CalendarClient(event_store=store, service=service),
+        }
+        # Warm the store so store cases measure reads, not the initial sync
+        for calendar_id in calendar_ids:
+            sources['store'].sync(calendar_id)
+
+        for source, client in sources.items():
+            for engine in ('python', 'pandas'):
+                tracker = TimeTracker(client, calendar_ids, engine=engine)
+                for case, function in cases:
+                    name = f'{case}/{source}/{engine}'
+                    results[name] = time_case(
+                        function, tracker, service, args.repeat)
+                    print(f"{name:<28} {results[name]['median_s'] * 1000:10.2f} ms"
+                          f"  {results[name]['requests_per_run']:6.1f} requests")
+
+        store.conn.close()
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': args.size,
+        'params': dict(
+            SIZES[args.size],
+            all_day_ratio=args.all_day_ratio,
+            overlap_ratio=args.overlap_ratio,
+            timezones=args.timezones,
+            latency=args.latency,
+            repeat=args.repeat
+        ),
+        'results': results
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print cases slower than the baseline; return True if any regressed"""
+    regressed = False
+    for name, result in report['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous or not previous['median_s']:
+            continue
+
+        ratio = result['median_s'] / previous['median_s']
+        if ratio > 1 + threshold:
+            regressed = True
+            print(f"REGRESSION {name}: {ratio:.2f}x slower than baseline")
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', choices=SIZES, default='medium')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--all-day-ratio', type=float, default=0.05)
+    parser.add_argument('--overlap-ratio', type=float, default=0.1)
+    parser.add_argument('--timezones', nargs='+',
+                        default=['America/New_York', 'UTC', 'Europe/Berlin'])
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Simulated seconds per API request')
+    parser.add_argument('--skip-imports', action='store_true',
+                        help='Do not measure module import times')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown before a case counts as regressed')
+    args = parser.parse_args()
+
+    report = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,11 +21,134 @@ COLOR_CATEGORIES = {
     # etc.
 }
 
+# Calendars to track
+# Use 'primary' for your main calendar; other IDs are shown in the dashboard sidebar
+TRACKED_CALENDARS = ['primary']
+
+# Per-calendar category mapping, checked before COLOR_CATEGORIES
+# Keys are (calendar ID, color ID); a color ID of '*' matches every event on that calendar
+CALENDAR_CATEGORIES = {
+    # ('team@group.calendar.google.com', '*'): 'Work',
+    # ('family@group.calendar.google.com', '11'): 'Wasted Time',
+}
+
+# Categorization rules, checked in order before CALENDAR_CATEGORIES and COLOR_CATEGORIES
+# The first matching rule wins; a rule has a 'category' and any of these conditions:
+#   'keywords': words or phrases found in the event title (case-insensitive, whole words)
+#   'pattern': regular expression searched in the event title (case-insensitive)
+#   'calendar': calendar ID the event is on
+#   'color': color ID of the event (None for events without a color)
+# A rule has either 'keywords' or a 'pattern', not both
+CATEGORY_RULES = [
+    # {'keywords': ['standup', 'sprint planning', '1:1'], 'category': 'Work'},
+    # {'pattern': r'\b(gym|run|yoga)\b', 'color': None, 'category': 'Personal Development'},
+    # {'calendar': 'family@group.calendar.google.com', 'keywords': ['groceries'], 'category': 'Chores & Misc'},
+]
+
 # Deep work categories
 DEEP_WORK_CATEGORIES = ['Work', 'Personal Projects']
 
+# How time covered by several events at once is counted
+# 'sum' adds up event durations, so overlapping events are counted twice;
+# 'priority' gives overlapping time to the category listed first in CATEGORY_PRIORITY;
+# 'proportional' splits overlapping time evenly between the overlapping events
+OVERLAP_POLICY = 'sum'
+
+# Category order for the 'priority' overlap policy; unlisted categories rank last
+CATEGORY_PRIORITY = ['Work', 'Personal Projects', 'Personal Development',
+                     'Wasted Time', 'Chores & Misc']
+
+# Hours counted per day for all-day events (0 to ignore them)
+ALL_DAY_EVENT_HOURS = 8.0
+
+# Metrics engine for multi-day ranges
+# 'python' aggregates event by event; 'pandas' uses vectorized groupby operations
+METRICS_ENGINE = 'python'
+
 # Default timezone
 TIMEZONE = 'America/New_York'  # Update to your timezone
 
 # Google Calendar API settings
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+EVENTS_PAGE_SIZE = 2500  # Events per API result page (API maximum)
+MAX_FETCH_WORKERS = 8  # Calendars fetched concurrently
+USE_BATCH_REQUESTS = True  # Combine multi-calendar fetches into HTTP batch requests
+
+# Local event store
+# Events are cached in this SQLite file and kept current with incremental sync
+EVENT_STORE_PATH = 'events.db'
+EVENT_STORE_SYNC_INTERVAL = 300  # Seconds between incremental syncs
+
+# Push notifications
+# Public HTTPS URL forwarding to the local receiver (e.g. through a reverse proxy
+# or tunnel); None keeps polling every EVENT_STORE_SYNC_INTERVAL instead
+PUSH_ADDRESS = None
+PUSH_HOST = '127.0.0.1'  # Interface the local receiver listens on
+PUSH_PORT = 8765  # Port the local receiver listens on
+PUSH_PATH = '/calendar/notifications'  # URL path notifications are posted to
+PUSH_CHANNEL_TTL = 7 * 24 * 3600  # Requested channel lifetime in seconds
+PUSH_RENEW_MARGIN = 3600  # Renew channels this many seconds before they expire
+PUSH_FALLBACK_INTERVAL = 6 * 3600  # Seconds between safety syncs of watched calendars
+
+# History archive
+# Month-partitioned event history for offline analysis (see src/archive.py)
+ARCHIVE_PATH = 'archive'
+# 'arrow' (Arrow IPC, memory-mapped and read without decoding) or
+# 'parquet' (compressed, readable by most data tools)
+ARCHIVE_FORMAT = 'arrow'
+
+# Dashboard auto-refresh
+# Today's and this week's metrics are updated from synced changes at this interval
+AUTO_REFRESH_INTERVAL = 30  # Seconds
+
+# Dashboard charts and tables
+# 'Auto' grouping uses the finest of day, week and month with at most this many periods
+AUTO_GRANULARITY_MAX_PERIODS = 120
+CHART_MAX_POINTS = 500  # Longer chart lines are downsampled (LTTB) to this many points
+TABLE_PAGE_SIZE = 100  # Table rows sent to the browser per page
+
+# Trends
+TREND_SHOWN_DAYS = 182  # Days shown in the Trends panel's rolling charts
+TREND_WINDOWS = [7, 28]  # Rolling average windows in days
+TREND_COMPARISON_PERIODS = 4  # Earlier periods averaged into the comparison baseline
+STREAK_MIN_DEEP_WORK_HOURS = 2  # Deep work hours a day needs to extend a streak
+
+# Dashboard metrics cache
+METRICS_CACHE_SIZE = 64  # Maximum cached results of a standalone MetricsCache
+METRICS_CACHE_TTL_PAST = 24 * 3600  # Seconds to keep results for past periods
+METRICS_CACHE_TTL_CURRENT = 60  # Seconds to keep results that include today
+
+# Performance instrumentation
+PERF_ENABLED = False  # Record per-stage timings and counters; the dashboard toggle is global
+PERF_LOG_PATH = None  # e.g. 'perf_log.jsonl' to append a JSON record per calculation
+
+# Async client
+ASYNC_MAX_CONCURRENCY = 16  # Maximum concurrent API requests (one keep-alive connection each)
+
+# API rate limiting
+RATE_LIMIT_QPS = 10  # Sustained API calls per second, shared by all clients in the process
+RATE_LIMIT_BURST = 20  # Calls allowed back to back before pacing kicks in
+RATE_LIMIT_MAX_RETRIES = 5  # Retries for rate limit (403/429), 5xx and connection errors
+RATE_LIMIT_BACKOFF_BASE = 0.5  # Seconds; the retry delay doubles per attempt (with full jitter)
+RATE_LIMIT_BACKOFF_MAX = 32  # Upper bound for a single retry delay in seconds
+
+# Background prefetch
+PREFETCH_ENABLED = True  # Keep recent periods warm while the dashboard runs
+PREFETCH_INTERVAL = 300  # Seconds between background syncs
+PREFETCH_WINDOWS = ['today', 'this_week', 'this_month', 'previous_week', 'previous_month']
+
+# Multi-user backend
+# Serve several users from one dashboard process, each with their own Google
+# account. The dashboard does not sign users in itself: run it behind an
+# authenticating reverse proxy that passes the user's identity in USER_HEADER.
+# USER_HEADER is only trusted from that proxy: set PROXY_SECRET and have the
+# proxy send it in PROXY_SECRET_HEADER, or, without a secret, let Streamlit
+# listen on a loopback address only (server.address = "127.0.0.1") with the
+# proxy on the same host. Otherwise the dashboard refuses to serve anyone.
+MULTI_USER = False
+USER_HEADER = 'X-Forwarded-Email'  # Request header naming the signed-in user
+PROXY_SECRET = None  # Shared secret the proxy sends with every request
+PROXY_SECRET_HEADER = 'X-Proxy-Secret'  # Request header carrying PROXY_SECRET
+USER_DATA_DIR = 'users'  # Per-user token files and event stores (USER_DATA_DIR/<user>/)
+BACKEND_MAX_USERS = 50  # Users kept open at once; the least recently active are closed
+BACKEND_CACHE_SIZE = 2000  # Cached results shared by all users, least recently used dropped
@@ -0,0 +1,88 @@
+"""
+Standalone prefetch daemon for Calendar Time Tracker
+
+Keeps the local event store and daily rollups up to date, so the dashboard
+loads today, this week and this month (and the previous week and month)
+from warm data. With PUSH_ADDRESS set in config.py, calendars are synced
+when the API notifies a change instead of on every run.
+
+Usage:
+    python prefetch.py               # run until interrupted
+    python prefetch.py --once        # single sync and prefetch
+"""
+
+import argparse
+import signal
+import sys
+import os
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from calendar_client import CalendarClient  # noqa: E402
+from event_store import EventStore  # noqa: E402
+from metrics import TimeTracker  # noqa: E402
+from push import PushSync  # noqa: E402
+from rollups import RollupStore  # noqa: E402
+from scheduler import PrefetchScheduler  # noqa: E402
+from config import PREFETCH_INTERVAL, PUSH_ADDRESS, TRACKED_CALENDARS  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--interval', type=float, default=PREFETCH_INTERVAL,
+                        help='Seconds between runs')
+    parser.add_argument('--calendars', nargs='+', default=TRACKED_CALENDARS,
+                        help='Calendar IDs to keep warm')
+    parser.add_argument('--once', action='store_true',
+                        help='Run a single sync and prefetch, then exit')
+    args = parser.parse_args()
+
+    event_store = EventStore()
+    client = CalendarClient(event_store=event_store)
+    # Log in up front rather than from the scheduler thread
+    client.authenticate()
+    tracker = TimeTracker(
+        client, args.calendars, rollups=RollupStore(event_store))
+    scheduler = PrefetchScheduler(tracker, interval=args.interval)
+
+    if args.once:
+        changed = scheduler.run_once()
+        print(f"Synced {changed} changed events in {scheduler.last_duration:.2f}s")
+        return 0
+
+    def shutdown(signum, frame):
+        print("Stopping...")
+        scheduler.stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    push = None
+    if PUSH_ADDRESS:
+        push = PushSync(client, args.calendars)
+        push.start()
+        print(f"Receiving push notifications at {push.receiver.url} (via {PUSH_ADDRESS})")
+
+    print(f"Prefetching every {args.interval:.0f}s; press Ctrl+C to stop")
+    scheduler.start()
+    last_error = last_push_error = None
+    while scheduler.running:
+        # Wake up regularly so signals are handled promptly
+        scheduler.thread.join(1.0)
+        if scheduler.last_error and scheduler.last_error != last_error:
+            print(f"Prefetch failed: {scheduler.last_error}")
+        last_error = scheduler.last_error
+        if push is not None:
+            if push.last_error and push.last_error != last_push_error:
+                print(f"Push sync failed: {push.last_error}")
+            last_push_error = push.last_error
+    scheduler.stop()
+    if push is not None:
+        # Close the channels so the API stops sending notifications
+        push.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+Headless batch report generator for Calendar Time Tracker
+
+Computes per-period metrics for many accounts in parallel, one worker
+process per account, and writes them as CSV, JSON or Parquet. Each account
+uses its own token file and runs isolated from the others: a failing
+account is reported without affecting the rest.
+
+Usage:
+    python report.py --account alice=tokens/alice.pickle --login
+    python report.py --account alice=tokens/alice.pickle --weeks 4 --output weekly.csv
+    python report.py --accounts accounts.json --start 2024-01-01 --end 2024-03-31 \\
+        --granularity month --output q1.parquet
+    python report.py --accounts accounts.json --start 2020-01-01 --end 2024-12-31 \\
+        --archive history --export
+    python report.py --accounts accounts.json --start 2020-01-01 --end 2024-12-31 \\
+        --granularity month --archive history --output history.csv
+
+accounts.json lists accounts as
+    [{"name": "alice", "token": "tokens/alice.pickle", "calendars": ["primary"]}]
+where "calendars" is optional and defaults to TRACKED_CALENDARS.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from calendar_client import CalendarClient  # noqa: E402
+from metrics import PERIOD_KEYS, TimeTracker  # noqa: E402
+from config import TRACKED_CALENDARS  # noqa: E402
+
+# Columns preceding the per-category hour columns
+BASE_COLUMNS = ['account', 'period', 'start_date', 'end_date', 'days',
+                'deep_work_hours', 'total_hours']
+
+FORMATS = ('csv', 'json', 'parquet')
+
+
+def load_accounts(args):
+    """Collect accounts from --accounts and --account arguments"""
+    accounts = []
+    if args.accounts:
+        with open(args.accounts) as f:
+            accounts.extend(json.load(f))
+
+    for spec in args.account or []:
+        name, sep, token = spec.partition('=')
+        if not sep:
+            raise ValueError(f"Expected NAME=TOKEN_PATH, got: {spec}")
+        accounts.append({'name': name, 'token': token})
+
+    names = [account['name'] for account in accounts]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate account names: {', '.join(sorted(duplicates))}")
+    return accounts
+
+
+def report_range(args, today=None):
+    """
+    Get the date range to report on
+
+    Returns:
+        Tuple of (start, end) datetimes, end inclusive: --start/--end if
+        given, otherwise the last --weeks complete weeks (Monday to Sunday)
+    """
+    if args.start:
+        start = datetime.strptime(args.start, '%Y-%m-%d')
+        end = datetime.strptime(args.end, '%Y-%m-%d') if args.end else start
+        if end < start:
+            raise ValueError("--end is before --start")
+        return start, end
+
+    today = datetime.combine(today or datetime.now(), datetime.min.time())
+    this_monday = today - timedelta(days=today.weekday())
+    return this_monday - timedelta(weeks=args.weeks), this_monday - timedelta(days=1)
+
+
+def run_account(account, start, end, granularity, fake=False, archive_dir=None):
+    """
+    Compute the report rows of one account (runs in a worker process)
+
+    Args:
+        account: Account dictionary with name, token and optional calendars
+        start: First day of the report
+        end: Last day of the report (inclusive)
+        granularity: 'day', 'week' or 'month'
+        fake: Serve synthetic calendars instead of calling the API
+        archive_dir: Read events from the account's archive in this
+            directory instead of the API
+
+    Returns:
+        Dictionary with the account name, its rows, the seconds taken and
+        an error message (None on success)
+    """
+    started = time.perf_counter()
+    calendar_ids = account.get('calendars') or TRACKED_CALENDARS
+
+    try:
+        tracker = TimeTracker(
+            _client(account, start, end, calendar_ids, fake), calendar_ids,
+            archive=_archive(account, archive_dir) if archive_dir else None)
+        metrics = tracker.calculate_range_metrics(start, end, granularity)
+
+        rows = []
+        for period in metrics['periods']:
+            row = {
+                'account': account['name'],
+                'period': period['label'],
+                'start_date': period['period_start'].strftime('%Y-%m-%d'),
+                'end_date': period['period_end'].strftime('%Y-%m-%d'),
+                'days': period['days'],
+                'deep_work_hours': period['deep_work_hours'],
+                'total_hours': period['total_hours']
+            }
+            row.update(period['category_hours'])
+            rows.append(row)
+        error = None
+    except Exception as e:
+        rows = []
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        'account': account['name'],
+        'rows': rows,
+        'seconds': time.perf_counter() - started,
+        'error': error
+    }
+
+
+def export_account(account, start, end, archive_dir, fake=False):
+    """
+    Export the events of one account to its archive (runs in a worker process)
+
+    Args:
+        account: Account dictionary with name, token and optional calendars
+        start: Day in the first month to export
+        end: Day in the last month to export
+        archive_dir: Directory holding one archive per account
+        fake: Serve synthetic calendars instead of calling the API
+
+    Returns:
+        Dictionary with the account name, the number of events written,
+        the seconds taken and an error message (None on success)
+    """
+    started = time.perf_counter()
+    calendar_ids = account.get('calendars') or TRACKED_CALENDARS
+
+    try:
+        tracker = TimeTracker(_client(account, start, end, calendar_ids, fake), calendar_ids)
+        events = _archive(account, archive_dir).export(tracker, start, end)
+        error = None
+    except Exception as e:
+        events = 0
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        'account': account['name'],
+        'rows': [],
+        'events': events,
+        'seconds': time.perf_counter() - started,
+        'error': error
+    }
+
+
+def write_rows(rows, path, output_format):
+    """
+    Write report rows
+
+    Category columns follow the base columns in alphabetical order; a
+    category an account did not track in a period is written as 0.
+    """
+    categories = sorted({key for row in rows for key in row} - set(BASE_COLUMNS))
+    columns = BASE_COLUMNS + categories
+    rows = [{column: row.get(column, 0) for column in columns} for row in rows]
+
+    if output_format == 'csv':
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    elif output_format == 'json':
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+    else:
+        # Only needed for Parquet output
+        import pandas as pd
+        pd.DataFrame(rows, columns=columns).to_parquet(path, index=False)
+
+
+def login(accounts):
+    """Run the browser login flow for each account and store its token"""
+    for account in accounts:
+        print(f"Logging in {account['name']} (token: {account['token']})")
+        CalendarClient(token_path=account['token']).authenticate()
+
+
+def _client(account, start, end, calendar_ids, fake):
+    """CalendarClient of an account; it only authenticates on first API use"""
+    if fake:
+        return CalendarClient(service=_fake_service(account, start, end, calendar_ids))
+    return CalendarClient(token_path=account['token'], interactive=False)
+
+
+def _archive(account, archive_dir):
+    """EventArchive of an account"""
+    # pyarrow is only loaded when archives are used
+    from archive import EventArchive
+    return EventArchive(os.path.join(archive_dir, account['name']))
+
+
+def _fake_service(account, start, end, calendar_ids):
+    """Synthetic calendars for an account, stable across runs"""
+    from fake_calendar import FakeCalendarService, generate_calendar
+
+    days = (end - start).days + 1
+    seed = zlib.crc32(account['name'].encode())
+    return FakeCalendarService({
+        calendar_id: generate_calendar(
+            days=days, start_date=start, seed=seed + i,
+            id_prefix=f'{calendar_id}-')
+        for i, calendar_id in enumerate(calendar_ids)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('\n\n', 1)[1]
+    )
+    parser.add_argument('--accounts', help='JSON file listing accounts')
+    parser.add_argument('--account', action='append', metavar='NAME=TOKEN_PATH',
+                        help='Add an account (repeatable)')
+    parser.add_argument('--login', action='store_true',
+                        help='Log in each account interactively and save its token')
+    parser.add_argument('--weeks', type=int, default=1,
+                        help='Report on the last N complete weeks (default: 1)')
+    parser.add_argument('--start', help='First day (YYYY-MM-DD); overrides --weeks')
+    parser.add_argument('--end', help='Last day (YYYY-MM-DD, inclusive)')
+    parser.add_argument('--granularity', choices=list(PERIOD_KEYS), default='week')
+    parser.add_argument('--output', default='report.csv',
+                        help='Output file; the format follows its extension')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='Output format (default: from --output)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes (default: all cores)')
+    parser.add_argument('--archive', metavar='DIR',
+                        help='Read events from per-account archives in DIR (DIR/<name>) '
+                             'instead of the API')
+    parser.add_argument('--export', action='store_true',
+                        help='Export the range (whole months) to the --archive archives '
+                             'instead of reporting')
+    parser.add_argument('--fake', action='store_true',
+                        help='Use synthetic calendars instead of the API (for trying out)')
+    args = parser.parse_args()
+
+    accounts = load_accounts(args)
+    if not accounts:
+        parser.error("No accounts given; use --accounts or --account")
+
+    if args.login:
+        login(accounts)
+        return 0
+
+    if args.export and not args.archive:
+        parser.error("--export requires --archive")
+
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    if not args.export and output_format not in FORMATS:
+        parser.error(f"Unknown output format: {output_format}; use --format")
+
+    start, end = report_range(args)
+    workers = max(1, min(args.workers, len(accounts)))
+    if args.export:
+        task = (export_account, start, end, args.archive, args.fake)
+        print(f"Exporting {start:%Y-%m} to {end:%Y-%m} to {args.archive} "
+              f"for {len(accounts)} accounts on {workers} processes")
+    else:
+        task = (run_account, start, end, args.granularity, args.fake, args.archive)
+        print(f"Reporting {start:%Y-%m-%d} to {end:%Y-%m-%d} by {args.granularity} "
+              f"for {len(accounts)} accounts on {workers} processes")
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(task[0], account, *task[1:]) for account in accounts]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['error']:
+                status = result['error']
+            elif args.export:
+                status = f"{result['events']} events"
+            else:
+                status = f"{len(result['rows'])} periods"
+            print(f"  {result['account']:<24} {result['seconds']:8.2f}s  {status}")
+    elapsed = time.perf_counter() - started
+
+    results.sort(key=lambda result: result['account'])
+    rows = [row for result in results for row in result['rows']]
+    if args.export:
+        print(f"Archived {sum(result['events'] for result in results)} events in {args.archive}")
+    else:
+        write_rows(rows, args.output, output_format)
+        print(f"Wrote {len(rows)} rows to {args.output}")
+
+    if args.export:
+        items, unit = sum(result['events'] for result in results), 'events'
+    else:
+        items, unit = len(rows), 'rows'
+    failed = [result for result in results if result['error']]
+    busy = sum(result['seconds'] for result in results)
+    print(f"{len(accounts) - len(failed)}/{len(accounts)} accounts in {elapsed:.2f}s: "
+          f"{len(accounts) / elapsed:.2f} accounts/s, {items / elapsed:.1f} {unit}/s, "
+          f"{busy / elapsed:.1f}x parallel speedup")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Month-partitioned columnar archive of calendar history
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytz
+from events import CompactEvent
+from config import ARCHIVE_PATH, ARCHIVE_FORMAT, TIMEZONE
+
+# Archive columns; the string columns are dictionary encoded
+SCHEMA = pa.schema([
+    ('start', pa.float64()),
+    ('end', pa.float64()),
+    ('all_day', pa.bool_()),
+    ('calendar_id', pa.dictionary(pa.int32(), pa.string())),
+    ('color_id', pa.dictionary(pa.int32(), pa.string())),
+    ('category', pa.dictionary(pa.int32(), pa.string())),
+    ('summary', pa.dictionary(pa.int32(), pa.string())),
+])
+
+# Columns needed to rebuild CompactEvents; summary only if rules use it
+COMPACT_COLUMNS = ['start', 'end', 'all_day', 'calendar_id', 'color_id', 'summary']
+
+FILE_EXTENSIONS = {'arrow': 'arrow', 'parquet': 'parquet'}
+
+METADATA_FILE = 'archive.json'
+
+
+class EventArchive:
+    """
+    Event history stored as one columnar file per local month
+
+    Each partition holds the events starting in its month, sorted by start,
+    as UTC epoch seconds plus calendar, color, category and title. The
+    archive's metadata records the time span of every partition, so a range
+    query only opens the partitions it overlaps, and only reads the columns
+    it asks for. Arrow IPC partitions are memory-mapped and used in place;
+    Parquet partitions are smaller but decoded on read.
+
+    Events are re-categorized with the reading TimeTracker's configuration,
+    so changing the category mappings does not require a new export.
+    """
+
+    def __init__(self, path=ARCHIVE_PATH, format=ARCHIVE_FORMAT):
+        """
+        Args:
+            path: Archive directory, created on the first export
+            format: 'arrow' or 'parquet'; used for partitions written from
+                now on, existing partitions are read in their own format
+        """
+        if format not in FILE_EXTENSIONS:
+            raise ValueError(f"Unknown archive format: {format}")
+
+        self.path = path
+        self.format = format
+        self.local_tz = pytz.timezone(TIMEZONE)
+        self.partitions = self._load_metadata()
+
+    def months(self):
+        """Get the archived months as sorted 'YYYY-MM' strings"""
+        return sorted(self.partitions)
+
+    def export(self, tracker, start_date, end_date):
+        """
+        Archive the events of every month from start_date to end_date
+
+        Whole months are exported, replacing their existing partitions, so
+        exporting the current month again later brings it up to date.
+        Events are fetched month by month through the tracker's client.
+
+        Args:
+            tracker: TimeTracker whose client and calendars are archived
+            start_date: datetime in the first month
+            end_date: datetime in the last month
+
+        Returns:
+            Number of events written
+        """
+        client = tracker.client
+        written = 0
+
+        for month_start, month_end in _months(start_date, end_date):
+            low = self.local_tz.localize(month_start).timestamp()
+            high = self.local_tz.localize(month_end).timestamp()
+            events = client.get_events_multi(month_start, month_end, tracker.calendar_ids)
+
+            rows = []
+            for event, compact in zip(events, tracker.compact_events(events)):
+                # Events starting in an earlier month belong to its partition
+                if low <= compact.start < high:
+                    rows.append((
+                        compact.start,
+                        compact.end,
+                        compact.all_day,
+                        compact.calendar_id,
+                        client.get_event_color(event),
+                        tracker.categories.name(compact.category_id),
+                        event.get('summary', '')
+                    ))
+            rows.sort(key=lambda row: row[0])
+
+            self._write_partition(month_start.strftime('%Y-%m'), rows)
+            written += len(rows)
+
+        self._save_metadata()
+        return written
+
+    def read(self, start_date, end_date, columns=None, calendar_ids=None):
+        """
+        Read the archived events overlapping a range
+
+        Uses the same rule as the API's timeMin/timeMax filter: an event is
+        returned if it ends after start_date and starts before end_date.
+
+        Args:
+            start_date: datetime (naive datetimes are in TIMEZONE)
+            end_date: datetime (naive datetimes are in TIMEZONE)
+            columns: Names of the columns to return (default: all)
+            calendar_ids: Only return events of these calendars
+
+        Returns:
+            pyarrow Table with one chunk per partition read, ordered by
+            start within each partition
+        """
+        low = self._timestamp(start_date)
+        high = self._timestamp(end_date)
+        columns = list(columns or SCHEMA.names)
+        needed = list(dict.fromkeys(
+            columns + ['start', 'end'] + (['calendar_id'] if calendar_ids else [])))
+
+        tables = []
+        for month in self.months():
+            info = self.partitions[month]
+            if info['rows'] == 0 or info['max_end'] <= low or info['min_start'] >= high:
+                continue
+
+            table = self._read_partition(info, needed)
+            mask = pc.and_(pc.greater(table['end'], low), pc.less(table['start'], high))
+            if calendar_ids:
+                mask = pc.and_(mask, pc.is_in(
+                    table['calendar_id'].cast(pa.string()),
+                    value_set=pa.array(list(calendar_ids), pa.string())))
+            tables.append(table.filter(mask).select(columns))
+
+        if not tables:
+            return pa.schema([SCHEMA.field(name) for name in columns]).empty_table()
+        return pa.concat_tables(tables)
+
+    def compact_events(self, tracker, start_date, end_date):
+        """
+        Get the archived events of a tracker's calendars as CompactEvents
+
+        Args:
+            tracker: TimeTracker whose calendars and category table to use
+            start_date: datetime (naive datetimes are in TIMEZONE)
+            end_date: datetime (naive datetimes are in TIMEZONE)
+
+        Yields:
+            CompactEvent per archived event overlapping the range
+        """
+        columns = COMPACT_COLUMNS if tracker.rules.uses_summary else COMPACT_COLUMNS[:-1]
+        table = self.read(start_date, end_date, columns, tracker.calendar_ids)
+
+        for batch in table.to_batches():
+            values = [batch.column(name).to_pylist() for name in columns]
+            if len(values) < len(COMPACT_COLUMNS):
+                values.append([None] * batch.num_rows)
+            for start, end, all_day, calendar_id, color_id, summary in zip(*values):
+                yield CompactEvent(
+                    start, end, all_day,
+                    tracker.category_id(calendar_id, color_id, summary),
+                    calendar_id
+                )
+
+    def _write_partition(self, month, rows):
+        """Write one month's rows, replacing its previous partition"""
+        directory = os.path.join(self.path, f'month={month}')
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, f'events.{FILE_EXTENSIONS[self.format]}')
+
+        columns = list(zip(*rows)) if rows else [[] for _ in SCHEMA.names]
+        table = pa.table([
+            pa.array(values, pa.float64()) if i < 2 else
+            pa.array(values, pa.bool_()) if i == 2 else
+            pa.array(values, pa.string()).dictionary_encode()
+            for i, values in enumerate(columns)
+        ], names=SCHEMA.names).cast(SCHEMA)
+
+        # Write next to the old partition and swap it in, so readers never
+        # see a partly written file
+        temporary = filename + '.tmp'
+        if self.format == 'arrow':
+            with pa.OSFile(temporary, 'wb') as sink:
+                with pa.ipc.new_file(sink, SCHEMA) as writer:
+                    writer.write_table(table)
+        else:
+            pq.write_table(table, temporary)
+        os.replace(temporary, filename)
+
+        previous = self.partitions.get(month)
+        if previous and previous['file'] != os.path.relpath(filename, self.path):
+            os.remove(os.path.join(self.path, previous['file']))
+
+        self.partitions[month] = {
+            'file': os.path.relpath(filename, self.path),
+            'format': self.format,
+            'rows': len(rows),
+            'min_start': min((row[0] for row in rows), default=None),
+            'max_end': max((row[1] for row in rows), default=None),
+            'exported_at': datetime.now(pytz.utc).isoformat()
+        }
+
+    def _read_partition(self, info, columns):
+        """Read columns of a partition"""
+        filename = os.path.join(self.path, info['file'])
+        if info['format'] == 'arrow':
+            # The table's buffers point into the mapped file, which stays
+            # mapped for as long as the table is alive
+            return pa.ipc.open_file(pa.memory_map(filename)).read_all().select(columns)
+
+        dictionary_columns = [name for name in columns
+                              if pa.types.is_dictionary(SCHEMA.field(name).type)]
+        return pq.read_table(filename, columns=columns, memory_map=True,
+                             read_dictionary=dictionary_columns)
+
+    def _load_metadata(self):
+        try:
+            with open(os.path.join(self.path, METADATA_FILE)) as f:
+                return json.load(f)['partitions']
+        except FileNotFoundError:
+            return {}
+
+    def _save_metadata(self):
+        filename = os.path.join(self.path, METADATA_FILE)
+        os.makedirs(self.path, exist_ok=True)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump({'timezone': TIMEZONE, 'partitions': self.partitions}, f, indent=2)
+        os.replace(filename + '.tmp', filename)
+
+    def _timestamp(self, date):
+        """Epoch seconds of a datetime, localizing naive ones to TIMEZONE"""
+        if date.tzinfo is None:
+            date = self.local_tz.localize(date)
+        return date.timestamp()
+
+
+def _months(start_date, end_date):
+    """(month start, next month start) naive datetimes from start_date to end_date"""
+    month = datetime(start_date.year, start_date.month, 1)
+    last = datetime(end_date.year, end_date.month, 1)
+    while month <= last:
+        following = (month + timedelta(days=32)).replace(day=1)
+        yield month, following
+        month = following
@@ -0,0 +1,230 @@
+"""
+asyncio interface to the Google Calendar API client
+"""
+
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from calendar_client import CalendarClient
+from metrics import TimeTracker
+from config import ASYNC_MAX_CONCURRENCY, METRICS_ENGINE
+
+
+class AsyncCalendarClient:
+    """
+    Async variant of CalendarClient
+
+    Requests run on a dedicated pool of max_concurrency worker threads.
+    Each worker keeps its own authorized keep-alive HTTP connection (see
+    CalendarClient._execute), so the pool doubles as a connection pool and
+    bounds the number of requests in flight. Awaiting callers never block
+    the event loop or the thread that owns it.
+    """
+
+    def __init__(self, client=None, max_concurrency=ASYNC_MAX_CONCURRENCY):
+        """
+        Args:
+            client: CalendarClient to wrap (default: a new client, which
+                authenticates on first use from a worker thread)
+            max_concurrency: Maximum number of concurrent API requests
+        """
+        self.client = client or CalendarClient()
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='calendar-http')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the worker pool"""
+        self._executor.shutdown(wait=False)
+
+    async def get_events(self, start_date, end_date, calendar_id='primary'):
+        """
+        Fetch events for a date range
+
+        Args:
+            start_date: datetime object for start of range (naive, will be converted to local timezone)
+            end_date: datetime object for end of range (naive, will be converted to local timezone)
+            calendar_id: Calendar ID (default: 'primary')
+
+        Returns:
+            List of event dictionaries
+        """
+        return [event async for event in self.iter_events(start_date, end_date, calendar_id)]
+
+    async def iter_events(self, start_date, end_date, calendar_id='primary'):
+        """
+        Yield events for a date range as each result page arrives
+
+        Args:
+            start_date: datetime object for start of range
+            end_date: datetime object for end of range
+            calendar_id: Calendar ID (default: 'primary')
+
+        Yields:
+            Event dictionaries ordered by start time
+        """
+        if self.client.event_store is not None:
+            # Store reads and syncs are blocking disk and API work
+            events = await self._run(
+                self.client.get_events, start_date, end_date, calendar_id)
+            for event in events:
+                yield event
+            return
+
+        start_utc, end_utc = self.client._to_utc_range(start_date, end_date)
+        params = self.client._list_params(start_utc, end_utc, calendar_id)
+
+        page_token = None
+        while True:
+            # Building the request can authenticate (token file, refresh,
+            # consent flow), so it runs on a worker thread as well
+            page = await self._run(self._list_page, params, page_token)
+
+            for event in page.get('items', []):
+                event['calendarId'] = calendar_id
+                yield event
+
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    async def get_events_multi(self, start_date, end_date, calendar_ids):
+        """
+        Fetch events from several calendars concurrently
+
+        Args:
+            start_date: datetime object for start of range
+            end_date: datetime object for end of range
+            calendar_ids: List of calendar IDs
+
+        Returns:
+            List of event dictionaries from all calendars, ordered by start time
+        """
+        results = await asyncio.gather(*[
+            self.get_events(start_date, end_date, calendar_id)
+            for calendar_id in calendar_ids
+        ])
+
+        # Each calendar is already ordered by start time
+        return list(heapq.merge(
+            *results, key=lambda event: self.get_event_bounds(event)[0]))
+
+    async def list_calendars(self):
+        """List all available calendars"""
+        return await self._run(self.client.list_calendars)
+
+    def get_event_duration(self, event):
+        """Calculate duration of an event in hours"""
+        return self.client.get_event_duration(event)
+
+    def get_event_color(self, event):
+        """Get the color ID of an event"""
+        return self.client.get_event_color(event)
+
+    def get_event_calendar(self, event):
+        """Get the ID of the calendar an event was fetched from"""
+        return self.client.get_event_calendar(event)
+
+    def get_event_bounds(self, event):
+        """Get timezone-aware start and end datetimes of an event"""
+        return self.client.get_event_bounds(event)
+
+    def _list_page(self, params, page_token):
+        request = self.client.service.events().list(pageToken=page_token, **params)
+        return self.client._execute(request)
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(function, *args))
+
+
+class AsyncTimeTracker:
+    """
+    Async variant of TimeTracker
+
+    Events for the requested window are fetched for all tracked calendars
+    concurrently, then aggregated by a TimeTracker on a worker thread, so
+    many windows can be awaited together, e.g. with asyncio.gather.
+    """
+
+    def __init__(self, async_client, calendar_ids=None, engine=METRICS_ENGINE):
+        self.client = async_client
+        self.tracker = TimeTracker(async_client.client, calendar_ids, engine)
+
+    async def calculate_daily_metrics(self, date):
+        """Calculate metrics for a single day"""
+        start = datetime.combine(date, datetime.min.time())
+        return await self._calculate(
+            start, start + timedelta(days=1), 'calculate_daily_metrics', date)
+
+    async def calculate_weekly_metrics(self, start_date):
+        """Calculate metrics for a week starting from start_date"""
+        start = datetime.combine(start_date, datetime.min.time())
+        return await self._calculate(
+            start, start + timedelta(days=7), 'calculate_weekly_metrics', start_date)
+
+    async def calculate_monthly_metrics(self, year, month):
+        """Calculate metrics for a specific month"""
+        start = datetime(year, month, 1)
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+        return await self._calculate(
+            start, end, 'calculate_monthly_metrics', year, month)
+
+    async def calculate_range_metrics(self, start_date, end_date, granularity='day'):
+        """Calculate metrics for an arbitrary date range"""
+        start = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+        return await self._calculate(
+            start, end, 'calculate_range_metrics', start_date, end_date, granularity)
+
+    async def _calculate(self, start, end, method, *args):
+        events = await self.client.get_events_multi(
+            start, end, self.tracker.calendar_ids)
+
+        tracker = TimeTracker(
+            _PrefetchedClient(self.client.client, events),
+            self.tracker.calendar_ids,
+            self.tracker.engine
+        )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, getattr(tracker, method), *args)
+
+
+class _PrefetchedClient:
+    """CalendarClient stand-in answering queries from already fetched events"""
+
+    event_store = None
+
+    def __init__(self, client, events):
+        self.client = client
+        self.events = events
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def iter_events(self, start_date, end_date, calendar_id='primary'):
+        return iter(self.get_events_multi(start_date, end_date, [calendar_id]))
+
+    def get_events(self, start_date, end_date, calendar_id='primary'):
+        return self.get_events_multi(start_date, end_date, [calendar_id])
+
+    def get_events_multi(self, start_date, end_date, calendar_ids, max_workers=None):
+        start_utc, end_utc = self.client._to_utc_range(start_date, end_date)
+        calendar_ids = set(calendar_ids)
+
+        selected = []
+        for event in self.events:
+            if self.client.get_event_calendar(event) not in calendar_ids:
+                continue
+            event_start, event_end = self.client.get_event_bounds(event)
+            if event_end > start_utc and event_start < end_utc:
+                selected.append(event)
+        return selected
@@ -0,0 +1,285 @@
+"""
+Shared backend serving several users from one process
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from cache import MetricsCache
+from calendar_client import CalendarClient
+from event_store import EventStore
+from metrics import TimeTracker
+from push import PushSync, WebhookReceiver
+from rollups import RollupStore
+from scheduler import PrefetchScheduler
+from config import (BACKEND_CACHE_SIZE, BACKEND_MAX_USERS, EVENT_STORE_PATH, TRACKED_CALENDARS,
+                    USER_DATA_DIR)
+
+# User IDs name directories, so only these characters are allowed
+USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._@+-]{0,127}$')
+
+# Files of single-user mode (user None), in the working directory
+LOCAL_TOKEN_PATH = 'token.pickle'
+
+
+class UserStorage:
+    """
+    Per-user token files and event stores
+
+    Every user gets a directory of their own, USER_DATA_DIR/<user>/, holding
+    token.pickle and events.db, so users never read or overwrite each
+    other's tokens or events. User None is the single local user, whose
+    files stay where single-user mode has always kept them.
+    """
+
+    def __init__(self, path=USER_DATA_DIR):
+        """
+        Args:
+            path: Directory holding one directory per user
+        """
+        self.path = path
+
+    def user_dir(self, user_id):
+        """Directory of a user, created if missing; raises ValueError for unsafe IDs"""
+        if not isinstance(user_id, str) or not USER_ID_PATTERN.match(user_id) or '..' in user_id:
+            raise ValueError(f"Invalid user ID: {user_id!r}")
+        directory = os.path.join(self.path, user_id)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def token_path(self, user_id):
+        """Token file of a user"""
+        if user_id is None:
+            return LOCAL_TOKEN_PATH
+        return os.path.join(self.user_dir(user_id), 'token.pickle')
+
+    def store_path(self, user_id):
+        """Event store file of a user"""
+        if user_id is None:
+            return EVENT_STORE_PATH
+        return os.path.join(self.user_dir(user_id), 'events.db')
+
+    def has_token(self, user_id):
+        """Check whether a user has logged in"""
+        return os.path.exists(self.token_path(user_id))
+
+    def users(self):
+        """IDs of the users with a token, sorted"""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(
+            name for name in os.listdir(self.path)
+            if USER_ID_PATTERN.match(name)
+            and os.path.exists(os.path.join(self.path, name, 'token.pickle'))
+        )
+
+
+class UserContext:
+    """
+    Everything the backend keeps for one user
+
+    The client, event store and rollups are shared by all of the user's
+    sessions, so each calendar is synced once however many sessions are
+    open; sessions create their own TimeTracker with tracker(), as
+    trackers hold per-session calendar and overlap settings.
+    """
+
+    def __init__(self, user_id, client, cache):
+        """
+        Args:
+            user_id: User ID, or None for the single local user
+            client: CalendarClient with the user's token and event store
+            cache: CachePartition of the shared metrics cache
+        """
+        self.user_id = user_id
+        self.client = client
+        self.event_store = client.event_store
+        self.rollups = RollupStore(self.event_store)
+        self.cache = cache
+        self.scheduler = None
+        self.push = None
+        self.lock = threading.Lock()
+
+        # Synced changes drop the cached results of the days they touch
+        self.event_store.subscribe(cache.invalidate_events)
+
+    def tracker(self, calendar_ids=None):
+        """Create a TimeTracker over the user's client and rollups"""
+        return TimeTracker(self.client, calendar_ids, rollups=self.rollups)
+
+    def start_background(self, prefetch=False, receiver=None):
+        """
+        Start the user's background workers if not running yet
+
+        They wait until one of the user's sessions has authenticated, and
+        follow TRACKED_CALENDARS rather than any session's selection, as
+        sessions viewing different calendars would otherwise keep
+        switching them (and reopening push channels) on every rerun.
+
+        Args:
+            prefetch: Start a PrefetchScheduler
+            receiver: Shared WebhookReceiver; starts a PushSync on it
+        """
+        with self.lock:
+            if prefetch and self.scheduler is None:
+                self.scheduler = PrefetchScheduler(self.tracker(), wait_for_auth=True)
+                self.scheduler.start()
+            if receiver is not None and self.push is None:
+                self.push = PushSync(
+                    self.client, TRACKED_CALENDARS, receiver=receiver, wait_for_auth=True)
+                self.push.start()
+
+    def close(self):
+        """Stop the background workers, drop the user's cached results and close the event store"""
+        with self.lock:
+            if self.scheduler is not None:
+                self.scheduler.stop()
+            if self.push is not None:
+                self.push.stop()
+        self.event_store.unsubscribe(self.rollups.invalidate)
+        self.event_store.unsubscribe(self.cache.invalidate_events)
+        self.cache.invalidate()
+        # Only once the workers have stopped, as they write to the store
+        self.event_store.close()
+
+
+class Backend:
+    """
+    Process-wide registry of per-user contexts
+
+    A user's context (client, event store, rollups, background workers) is
+    created on first use and shared by all of the user's sessions. At most
+    max_users contexts are kept; opening another closes the least recently
+    used one, whose sessions get a fresh context on their next use. All
+    users share one metrics cache, partitioned by user and bounded as a
+    whole, and one webhook receiver for push notifications.
+    """
+
+    def __init__(self, storage=None, max_users=BACKEND_MAX_USERS, cache_size=BACKEND_CACHE_SIZE,
+                 service_factory=None):
+        """
+        Args:
+            storage: UserStorage (default: one in USER_DATA_DIR)
+            max_users: Maximum number of open user contexts
+            cache_size: Maximum cached results across all users
+            service_factory: Function returning a prebuilt Calendar API
+                service for a user ID, e.g. a FakeCalendarService for
+                offline testing (default: authenticate with the user's token)
+        """
+        self.storage = storage or UserStorage()
+        self.max_users = max_users
+        self.cache = MetricsCache(cache_size)
+        self.service_factory = service_factory
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+        self.receiver = None
+        self.closing = {}
+        self.opened = 0
+        self.closed = 0
+
+    def user(self, user_id=None):
+        """
+        Get a user's context, creating it on first use
+
+        Args:
+            user_id: User ID, or None for the single local user, who may log
+                in interactively; other users need an existing token
+
+        Returns:
+            UserContext
+        """
+        while True:
+            with self.lock:
+                context = self.users.get(user_id)
+                if context is not None:
+                    self.users.move_to_end(user_id)
+                    return context
+
+                # A context evicted moments ago may still be closing, and its
+                # workers writing to the store the new one would open
+                closing = self.closing.get(user_id)
+                if closing is None:
+                    context = self.users[user_id] = self._open(user_id)
+                    while len(self.users) > self.max_users:
+                        self._close_later(self.users.popitem(last=False)[1])
+                    return context
+            closing.join()
+
+    def push_receiver(self):
+        """Shared WebhookReceiver, started on first use; raises OSError if its port is taken"""
+        with self.lock:
+            if self.receiver is None:
+                receiver = WebhookReceiver(self._dispatch)
+                receiver.start()
+                self.receiver = receiver
+            return self.receiver
+
+    def stats(self):
+        """Get the open users and cache counters"""
+        with self.lock:
+            users = [user_id or '(local)' for user_id in self.users]
+        return {
+            'open_users': users,
+            'opened': self.opened,
+            'closed': self.closed,
+            'cache': self.cache.stats()
+        }
+
+    def close(self):
+        """Close every user context and the receiver"""
+        with self.lock:
+            contexts = list(self.users.values())
+            self.users.clear()
+            receiver, self.receiver = self.receiver, None
+        for context in contexts:
+            context.close()
+        with self.lock:
+            closing = list(self.closing.values())
+        for thread in closing:
+            thread.join()
+        if receiver is not None:
+            receiver.stop()
+
+    def _open(self, user_id):
+        """Create a user's context (lock held)"""
+        service = self.service_factory(user_id) if self.service_factory else None
+        client = CalendarClient(
+            event_store=EventStore(self.storage.store_path(user_id)),
+            service=service,
+            token_path=self.storage.token_path(user_id),
+            interactive=user_id is None
+        )
+        self.opened += 1
+        return UserContext(user_id, client, self.cache.partition(user_id))
+
+    def _close_later(self, context):
+        """
+        Close an evicted context on a background thread (lock held)
+
+        Stopping workers can wait on a run or on API calls, so it happens
+        off the requesting thread; user() waits for it before reopening
+        the same user.
+        """
+        def close():
+            try:
+                context.close()
+            finally:
+                with self.lock:
+                    del self.closing[context.user_id]
+
+        thread = threading.Thread(target=close, name='backend-close', daemon=True)
+        self.closing[context.user_id] = thread
+        self.closed += 1
+        thread.start()
+
+    def _dispatch(self, headers):
+        """Pass a notification to the PushSync owning its channel"""
+        with self.lock:
+            pushes = [context.push for context in self.users.values()
+                      if context.push is not None]
+        for push in pushes:
+            status = push.handle_notification(headers)
+            if status != 404:
+                return status
+        return 404
@@ -0,0 +1,273 @@
+"""
+In-memory cache for computed metrics
+"""
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import pytz
+from instrumentation import perf
+from config import (METRICS_CACHE_SIZE, METRICS_CACHE_TTL_CURRENT, METRICS_CACHE_TTL_PAST,
+                    TIMEZONE)
+
+
+def ttl_for_range(start_date, end_date, now=None):
+    """
+    Choose a cache TTL for a date range
+
+    Ranges that ended before today can only change through edits to past
+    events and get the long TTL; ranges including today or later get the
+    short one.
+
+    Args:
+        start_date: First day of the range
+        end_date: Last day of the range (inclusive)
+        now: Current datetime (default: datetime.now())
+
+    Returns:
+        TTL in seconds
+    """
+    today = (now or datetime.now()).date()
+    if _to_date(end_date) < today:
+        return METRICS_CACHE_TTL_PAST
+    return METRICS_CACHE_TTL_CURRENT
+
+
+class MetricsCache:
+    """
+    Bounded LRU cache with per-entry TTL
+
+    Entries remember the date range they cover so changes to specific days
+    can invalidate only the affected results. Concurrent get_or_compute
+    calls for the same missing key compute it once.
+    """
+
+    def __init__(self, max_entries=METRICS_CACHE_SIZE, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # Key to _Flight of the computations in progress
+        self.in_flight = {}
+
+    def get(self, key):
+        """Get a cached value, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                perf.count('metrics_cache_misses')
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            perf.count('metrics_cache_hits')
+            return entry[0]
+
+    def put(self, key, value, ttl, start_date=None, end_date=None):
+        """
+        Store a value
+
+        Args:
+            key: Hashable cache key
+            value: Value to store
+            ttl: Time to live in seconds
+            start_date: First day covered by the value, for invalidation
+            end_date: Last day covered by the value (inclusive)
+        """
+        span = None
+        if start_date is not None:
+            span = (_to_date(start_date), _to_date(end_date or start_date))
+
+        with self.lock:
+            self.entries[key] = (value, self.clock() + ttl, span)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute, ttl, start_date=None, end_date=None):
+        """
+        Get a cached value, computing and storing it on a miss
+
+        While one caller computes a key, other callers of the same key wait
+        for its result (or exception) instead of computing it again.
+        """
+        value = self.get(key)
+        if value is None:
+            value = self._compute_once(key, compute, ttl, start_date, end_date)
+        return value
+
+    def _compute_once(self, key, compute, ttl, start_date, end_date):
+        """Compute and store a missing key, or wait for the caller computing it"""
+        with self.lock:
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = _Flight()
+
+        if not leader:
+            perf.count('metrics_cache_shared_computes')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.put(key, flight.value, ttl, start_date, end_date)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            flight.done.set()
+
+    def partition(self, name):
+        """Get a CachePartition of this cache"""
+        return CachePartition(self, name)
+
+    def invalidate(self, start_date=None, end_date=None, partition=None):
+        """
+        Drop cached values
+
+        Without dates every entry is dropped; otherwise only entries whose
+        range overlaps [start_date, end_date], and entries without a range,
+        are dropped.
+
+        Args:
+            start_date: First day of the changed range
+            end_date: Last day of the changed range (inclusive)
+            partition: Only drop entries of this CachePartition name
+        """
+        with self.lock:
+            if start_date is None and partition is None:
+                self.entries.clear()
+                return
+
+            if start_date is not None:
+                start, end = _to_date(start_date), _to_date(end_date or start_date)
+            for key, (_, _, span) in list(self.entries.items()):
+                if partition is not None and not _in_partition(key, partition):
+                    continue
+                if (start_date is None or span is None
+                        or (span[0] <= end and start <= span[1])):
+                    del self.entries[key]
+
+    def invalidate_events(self, calendar_id, intervals, partition=None):
+        """
+        Drop cached values covering any local day touched by changed events
+
+        Registered as an event store listener (see EventStore.subscribe),
+        so a sync only drops the results its changes can affect.
+
+        Args:
+            calendar_id: Calendar the changes belong to
+            intervals: List of (start_ts, end_ts) epoch second tuples
+            partition: Only drop entries of this CachePartition name
+        """
+        local_tz = pytz.timezone(TIMEZONE)
+        days = set()
+        for start_ts, end_ts in intervals:
+            day = datetime.fromtimestamp(start_ts, local_tz).date()
+            last_day = datetime.fromtimestamp(end_ts, local_tz).date()
+            while day <= last_day:
+                days.add(day)
+                day += timedelta(days=1)
+        days = sorted(days)
+
+        with self.lock:
+            for key, (_, _, span) in list(self.entries.items()):
+                if partition is not None and not _in_partition(key, partition):
+                    continue
+                if span is not None:
+                    i = bisect.bisect_left(days, span[0])
+                    if i == len(days) or days[i] > span[1]:
+                        continue
+                del self.entries[key]
+                perf.count('metrics_cache_invalidations')
+
+    def stats(self):
+        """Get hit/miss counters and the current size"""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries)
+            }
+
+
+class CachePartition:
+    """
+    One user's share of a MetricsCache
+
+    Keys are stored as (name, key), so partitions never see or invalidate
+    each other's entries, while all partitions share the cache's LRU bound:
+    the entries of idle users are the first to go.
+    """
+
+    def __init__(self, cache, name):
+        self.cache = cache
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get a cached value, or None if missing or expired"""
+        value = self.cache.get((self.name, key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value, ttl, start_date=None, end_date=None):
+        """Store a value (see MetricsCache.put)"""
+        self.cache.put((self.name, key), value, ttl, start_date, end_date)
+
+    def get_or_compute(self, key, compute, ttl, start_date=None, end_date=None):
+        """Get a cached value, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = self.cache._compute_once(
+                (self.name, key), compute, ttl, start_date, end_date)
+        return value
+
+    def invalidate(self, start_date=None, end_date=None):
+        """Drop this partition's cached values (see MetricsCache.invalidate)"""
+        self.cache.invalidate(start_date, end_date, partition=self.name)
+
+    def invalidate_events(self, calendar_id, intervals):
+        """Event store listener dropping this partition's affected values"""
+        self.cache.invalidate_events(calendar_id, intervals, partition=self.name)
+
+    def stats(self):
+        """Get this partition's hit/miss counters and size"""
+        with self.cache.lock:
+            size = sum(1 for key in self.cache.entries if _in_partition(key, self.name))
+        return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+
+class _Flight:
+    """A computation in progress in MetricsCache.get_or_compute"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _in_partition(key, name):
+    return isinstance(key, tuple) and len(key) == 2 and key[0] == name
+
+
+def _to_date(value):
+    return value.date() if isinstance(value, datetime) else value
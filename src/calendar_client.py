@@ -2,50 +2,159 @@
 Google Calendar API client
 """
 
+import heapq
 import os
 import pickle
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pytz
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from config import SCOPES, TIMEZONE
+from googleapiclient.errors import HttpError
+from instrumentation import perf
+from rate_limiter import (rate_limiter as default_rate_limiter, is_rate_limit_error,
+                          is_retryable)
+from config import (SCOPES, TIMEZONE, EVENTS_PAGE_SIZE, EVENT_STORE_SYNC_INTERVAL,
+                    MAX_FETCH_WORKERS, USE_BATCH_REQUESTS, PUSH_CHANNEL_TTL,
+                    PUSH_FALLBACK_INTERVAL)
+
+# Partial response projection for events().list; TimeTracker only needs
+# these fields, and the event store additionally uses id and status
+EVENT_LIST_FIELDS = (
+    'nextPageToken,nextSyncToken,'
+    'items(id,status,summary,colorId,start,end)'
+)
+
+# The Calendar API accepts at most 50 calls per batch request
+BATCH_MAX_REQUESTS = 50
+
+
+def event_bounds(event, local_tz):
+    """
+    Get timezone-aware start and end datetimes of an event
+
+    All-day events are bounded by local midnight of their start and end dates.
+
+    Args:
+        event: Event dictionary from Google Calendar API
+        local_tz: pytz timezone used for all-day events
+
+    Returns:
+        Tuple of (start, end) datetimes
+    """
+    start = event['start'].get('dateTime', event['start'].get('date'))
+    end = event['end'].get('dateTime', event['end'].get('date'))
+
+    if 'T' not in start:
+        return (
+            local_tz.localize(datetime.fromisoformat(start)),
+            local_tz.localize(datetime.fromisoformat(end))
+        )
+
+    return (
+        datetime.fromisoformat(start.replace('Z', '+00:00')),
+        datetime.fromisoformat(end.replace('Z', '+00:00'))
+    )
 
 
 class CalendarClient:
-    def __init__(self):
-        self.service = None
-        self.authenticate()
+    def __init__(self, event_store=None, service=None, rate_limiter=None,
+                 token_path='token.pickle', interactive=True):
+        """
+        Args:
+            event_store: Optional EventStore to answer queries from
+            service: Prebuilt Calendar API service; skips authentication
+                (used with fake_calendar.FakeCalendarService). Without one,
+                authentication happens on the first API call.
+            rate_limiter: RateLimiter for API calls (default: the
+                process-wide limiter shared by all clients)
+            token_path: File storing the account's access and refresh tokens
+            interactive: Start the browser login flow when there is no
+                valid token; if False, authentication fails instead
+        """
+        self._service = service
+        self.credentials = None
+        self.token_path = token_path
+        self.interactive = interactive
+        self.event_store = event_store
+        self.rate_limiter = rate_limiter or default_rate_limiter
+
+        # Calendars kept current by push notifications (see push.PushSync)
+        self.watched_calendars = set()
+
+        # Each worker thread gets its own HTTP connection, since httplib2
+        # connections cannot be shared between threads
+        self._local = threading.local()
+
+        # Authentication is deferred until the service is first used, so
+        # creating a client (and answering queries from the event store's
+        # cache) costs no token or discovery loading
+        self._auth_lock = threading.Lock()
+
+        # One lock per calendar, so concurrent callers wait for a running
+        # sync instead of starting their own
+        self._sync_locks = {}
+        self._sync_locks_lock = threading.Lock()
+
+    @property
+    def service(self):
+        """Calendar API service, authenticating on first use"""
+        if self._service is None:
+            with self._auth_lock:
+                if self._service is None:
+                    self.authenticate()
+        return self._service
+
+    @property
+    def authenticated(self):
+        """Whether the service has been built"""
+        return self._service is not None
 
     def authenticate(self):
         """Authenticate with Google Calendar API"""
-        creds = None
+        # The Google auth and discovery stack is only needed here
+        from google.auth.transport.requests import Request
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from googleapiclient.discovery import build
 
-        # Token file stores the user's access and refresh tokens
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
-                creds = pickle.load(token)
+        with perf.stage('auth'):
+            creds = None
 
-        # If there are no (valid) credentials available, let the user log in
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                if not os.path.exists('credentials.json'):
-                    raise FileNotFoundError(
-                        "credentials.json not found. Please follow the setup instructions "
-                        "in SETUP.md to create Google Calendar API credentials."
+            # Token file stores the user's access and refresh tokens
+            if os.path.exists(self.token_path):
+                with open(self.token_path, 'rb') as token:
+                    creds = pickle.load(token)
+
+            # If there are no (valid) credentials available, let the user log in
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                elif not self.interactive:
+                    raise RuntimeError(
+                        f"No valid token in {self.token_path}; "
+                        "log in interactively once to create it."
                     )
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
+                else:
+                    if not os.path.exists('credentials.json'):
+                        raise FileNotFoundError(
+                            "credentials.json not found. Please follow the setup instructions "
+                            "in SETUP.md to create Google Calendar API credentials."
+                        )
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        'credentials.json', SCOPES)
+                    creds = flow.run_local_server(port=0)
 
-            # Save the credentials for the next run
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
+                # Save the credentials for the next run
+                self._save_token(creds)
 
-        self.service = build('calendar', 'v3', credentials=creds)
+            self.credentials = creds
+
+            # Use the discovery document bundled with google-api-python-client
+            # instead of fetching it over the network on every start
+            self._service = build(
+                'calendar', 'v3', credentials=creds,
+                static_discovery=True, cache_discovery=False)
 
     def get_events(self, start_date, end_date, calendar_id='primary'):
         """
@@ -59,6 +168,206 @@ class CalendarClient:
         Returns:
             List of event dictionaries
         """
+        return list(self.iter_events(start_date, end_date, calendar_id))
+
+    def iter_events(self, start_date, end_date, calendar_id='primary'):
+        """
+        Yield events from Google Calendar for a date range
+
+        Follows nextPageToken across all result pages and yields the events
+        of each page as soon as it arrives, so callers can start processing
+        before the last page is downloaded.
+
+        Args:
+            start_date: datetime object for start of range (naive, will be converted to local timezone)
+            end_date: datetime object for end of range (naive, will be converted to local timezone)
+            calendar_id: Calendar ID (default: 'primary')
+
+        Yields:
+            Event dictionaries ordered by start time
+        """
+        start_utc, end_utc = self._to_utc_range(start_date, end_date)
+
+        if self.event_store is not None:
+            self.ensure_synced(calendar_id)
+            with perf.stage('store_query'):
+                events = self.event_store.get_events(
+                    calendar_id, start_utc.timestamp(), end_utc.timestamp())
+            for event in events:
+                event['calendarId'] = calendar_id
+                yield event
+            return
+
+        pages = self._iter_pages(
+            **self._list_params(start_utc, end_utc, calendar_id))
+        for page in pages:
+            for event in page.get('items', []):
+                event['calendarId'] = calendar_id
+                yield event
+
+    def get_events_multi(self, start_date, end_date, calendar_ids,
+                         max_workers=MAX_FETCH_WORKERS):
+        """
+        Fetch events from several calendars in parallel
+
+        Each calendar is fetched on a bounded thread pool, so the total
+        latency is set by the slowest calendar rather than the sum of all.
+
+        Args:
+            start_date: datetime object for start of range
+            end_date: datetime object for end of range
+            calendar_ids: List of calendar IDs
+            max_workers: Maximum number of concurrent fetches
+
+        Returns:
+            List of event dictionaries from all calendars, ordered by start time
+        """
+        if len(calendar_ids) == 1:
+            return self.get_events(start_date, end_date, calendar_ids[0])
+
+        if self.event_store is None and USE_BATCH_REQUESTS:
+            results = self.get_events_batch([
+                (start_date, end_date, calendar_id)
+                for calendar_id in calendar_ids
+            ])
+            return list(heapq.merge(
+                *results, key=lambda event: self.get_event_bounds(event)[0]))
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(calendar_ids))) as pool:
+            results = list(pool.map(
+                lambda calendar_id: self.get_events(
+                    start_date, end_date, calendar_id),
+                calendar_ids
+            ))
+
+        # Each calendar is already ordered by start time
+        return list(heapq.merge(
+            *results, key=lambda event: self.get_event_bounds(event)[0]))
+
+    def get_events_batch(self, queries):
+        """
+        Fetch several calendars or date windows with HTTP batch requests
+
+        Up to BATCH_MAX_REQUESTS list calls share one HTTP round trip.
+        Queries with more pages are continued in follow-up batches until
+        every query is complete.
+
+        Args:
+            queries: List of (start_date, end_date, calendar_id) tuples
+
+        Returns:
+            List of event lists, one per query, each ordered by start time
+        """
+        results = [[] for _ in queries]
+        pending = {}
+        for i, (start_date, end_date, calendar_id) in enumerate(queries):
+            start_utc, end_utc = self._to_utc_range(start_date, end_date)
+            pending[str(i)] = self._list_params(start_utc, end_utc, calendar_id)
+
+        attempt = 0
+        while pending:
+            request_ids = list(pending)[:BATCH_MAX_REQUESTS]
+            errors = []
+            retried = []
+            completed = []
+
+            def callback(request_id, response, exception):
+                if exception is not None and is_retryable(exception):
+                    # Leave the query pending for the next round
+                    self.rate_limiter.record_error(exception, adapt=False)
+                    retried.append(exception)
+                    return
+
+                params = pending.pop(request_id)
+                completed.append(request_id)
+                if exception is not None:
+                    errors.append(exception)
+                    return
+
+                for event in response.get('items', []):
+                    event['calendarId'] = params['calendarId']
+                    results[int(request_id)].append(event)
+
+                page_token = response.get('nextPageToken')
+                if page_token:
+                    pending[request_id] = dict(params, pageToken=page_token)
+
+            batch = self.service.new_batch_http_request(callback=callback)
+            for request_id in request_ids:
+                request = self.service.events().list(**pending[request_id])
+                self._count_bytes(request)
+                batch.add(request, request_id=request_id)
+            perf.count('batched_requests', len(request_ids))
+            self._execute(batch, cost=len(request_ids))
+
+            if errors:
+                raise errors[0]
+
+            # Individual calls in a batch are throttled separately; only
+            # rounds without any progress count towards the retry limit
+            if retried:
+                if any(is_rate_limit_error(e) for e in retried):
+                    self.rate_limiter.slow_down()
+                attempt = 1 if completed else attempt + 1
+                if attempt > self.rate_limiter.max_retries:
+                    self.rate_limiter.fail(retried[0])
+                self.rate_limiter.backoff(attempt, retried[0])
+            else:
+                attempt = 0
+
+        return results
+
+    def sync(self, calendar_id='primary'):
+        """
+        Bring the local event store up to date for a calendar
+
+        The first call downloads every event; later calls pass the stored
+        syncToken so only added, changed, cancelled and deleted events are
+        transferred. An expired token (HTTP 410) triggers a full resync.
+
+        Args:
+            calendar_id: Calendar ID (default: 'primary')
+
+        Returns:
+            Number of changed events applied to the store
+        """
+        with self._sync_lock(calendar_id):
+            return self._sync(calendar_id)
+
+    def _sync(self, calendar_id):
+        """Sync a calendar with its sync lock held"""
+        sync_token = self.event_store.get_sync_token(calendar_id)
+
+        params = {
+            'calendarId': calendar_id,
+            'singleEvents': True,
+            'maxResults': EVENTS_PAGE_SIZE,
+            'fields': EVENT_LIST_FIELDS
+        }
+        if sync_token:
+            params['syncToken'] = sync_token
+
+        items = []
+        try:
+            for page in self._iter_pages(**params):
+                items.extend(page.get('items', []))
+        except HttpError as e:
+            if e.resp.status == 410 and sync_token:
+                # Sync token expired, start over with a full sync
+                self.event_store.clear_calendar(calendar_id)
+                return self._sync(calendar_id)
+            raise
+
+        self.event_store.apply_changes(
+            calendar_id,
+            items,
+            page.get('nextSyncToken'),
+            full_sync=sync_token is None
+        )
+        return len(items)
+
+    def _to_utc_range(self, start_date, end_date):
+        """Convert a range of naive local or aware datetimes to UTC"""
         # Convert naive datetime to timezone-aware
         local_tz = pytz.timezone(TIMEZONE)
 
@@ -74,23 +383,123 @@ class CalendarClient:
             end_date_aware = end_date
 
         # Convert to UTC for API query
-        start_utc = start_date_aware.astimezone(pytz.utc)
-        end_utc = end_date_aware.astimezone(pytz.utc)
+        return (
+            start_date_aware.astimezone(pytz.utc),
+            end_date_aware.astimezone(pytz.utc)
+        )
 
-        # Convert to RFC3339 format
-        time_min = start_utc.isoformat()
-        time_max = end_utc.isoformat()
+    def _list_params(self, start_utc, end_utc, calendar_id):
+        """Build events().list parameters for a time range query"""
+        return {
+            'calendarId': calendar_id,
+            # Convert to RFC3339 format
+            'timeMin': start_utc.isoformat(),
+            'timeMax': end_utc.isoformat(),
+            'singleEvents': True,
+            'orderBy': 'startTime',
+            'maxResults': EVENTS_PAGE_SIZE,
+            'fields': EVENT_LIST_FIELDS
+        }
 
-        events_result = self.service.events().list(
-            calendarId=calendar_id,
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+    def _iter_pages(self, **params):
+        """Yield every result page of an events().list query"""
+        page_token = None
+        while True:
+            page = self._execute(self.service.events().list(
+                pageToken=page_token, **params))
+            yield page
+
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    def sync_due(self, calendar_id='primary', max_age=EVENT_STORE_SYNC_INTERVAL):
+        """
+        Check whether a calendar was last synced more than max_age seconds ago
+
+        Calendars in watched_calendars are synced when a push notification
+        arrives, so they are only due after PUSH_FALLBACK_INTERVAL.
+        """
+        if calendar_id in self.watched_calendars:
+            max_age = max(max_age, PUSH_FALLBACK_INTERVAL)
+        last_synced = self.event_store.get_last_synced(calendar_id)
+        return last_synced is None or time.time() - last_synced >= max_age
+
+    def ensure_synced(self, calendar_id='primary', max_age=EVENT_STORE_SYNC_INTERVAL):
+        """
+        Sync a calendar if it is due (see sync_due)
+
+        Callers arriving while another thread syncs the calendar wait for
+        that sync and use its result instead of fetching again.
+        """
+        if self.sync_due(calendar_id, max_age):
+            with self._sync_lock(calendar_id):
+                if self.sync_due(calendar_id, max_age):
+                    with perf.stage('sync'):
+                        perf.count('synced_events', self._sync(calendar_id))
+
+    def _sync_lock(self, calendar_id):
+        """Lock serializing the syncs of a calendar"""
+        with self._sync_locks_lock:
+            lock = self._sync_locks.get(calendar_id)
+            if lock is None:
+                lock = self._sync_locks[calendar_id] = threading.Lock()
+            return lock
+
+    def _execute(self, request, cost=1):
+        """
+        Execute an API request under the rate limit, with retries
+
+        Args:
+            request: API request or batch request
+            cost: Number of API calls the request counts as against quota
+
+        Returns:
+            Response of the request
+        """
+        self._count_bytes(request)
+        return self.rate_limiter.call(lambda: self._execute_once(request), cost)
+
+    def _execute_once(self, request):
+        """Execute an API request on the calling thread's HTTP connection"""
+        perf.count('api_calls')
+
+        with perf.stage('api_request'):
+            if self.credentials is None:
+                return request.execute()
+
+            http = getattr(self._local, 'http', None)
+            if http is None:
+                import httplib2
+                from google_auth_httplib2 import AuthorizedHttp
+                http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+                self._local.http = http
 
-        events = events_result.get('items', [])
-        return events
+            return request.execute(http=http)
+
+    def _count_bytes(self, request):
+        """Count response body bytes of a request while instrumentation is on"""
+        postproc = getattr(request, 'postproc', None)
+        if not perf.enabled or postproc is None:
+            return
+
+        def counting_postproc(resp, content):
+            perf.count('bytes_received', len(content))
+            return postproc(resp, content)
+
+        request.postproc = counting_postproc
+
+    def get_event_bounds(self, event):
+        """
+        Get timezone-aware start and end datetimes of an event
+
+        Args:
+            event: Event dictionary from Google Calendar API
+
+        Returns:
+            Tuple of (start, end) datetimes
+        """
+        return event_bounds(event, pytz.timezone(TIMEZONE))
 
     def get_event_duration(self, event):
         """
@@ -122,6 +531,26 @@ class CalendarClient:
 
         return datetime.fromisoformat(start.replace('Z', '+00:00'))
 
+    def _save_token(self, creds):
+        """
+        Write the token file, creating its directory if needed
+
+        The token goes to a uniquely named temporary file in the same
+        directory first and then replaces the token file at once, so a
+        concurrent reader never sees a partial token and concurrent logins
+        never write to the same temporary file.
+        """
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.token-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as token:
+                pickle.dump(creds, token)
+            os.replace(temp_path, self.token_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
     def get_event_color(self, event):
         """
         Get the color ID of an event
@@ -134,7 +563,50 @@ class CalendarClient:
         """
         return event.get('colorId', None)
 
+    def get_event_calendar(self, event):
+        """
+        Get the ID of the calendar an event was fetched from
+
+        Args:
+            event: Event dictionary returned by get_events
+
+        Returns:
+            Calendar ID string
+        """
+        return event.get('calendarId', 'primary')
+
     def list_calendars(self):
         """List all available calendars"""
-        calendar_list = self.service.calendarList().list().execute()
+        calendar_list = self._execute(self.service.calendarList().list())
         return calendar_list.get('items', [])
+
+    def watch_events(self, calendar_id, channel_id, address, token, ttl=PUSH_CHANNEL_TTL):
+        """
+        Open a push notification channel for changes to a calendar's events
+
+        Args:
+            calendar_id: Calendar to watch
+            channel_id: Unique ID of the new channel
+            address: HTTPS URL notifications are POSTed to
+            token: Secret sent back with every notification of the channel
+            ttl: Requested channel lifetime in seconds; the API may shorten it
+
+        Returns:
+            Channel dictionary with 'id', 'resourceId' and 'expiration'
+            (milliseconds since the epoch, as a string)
+        """
+        return self._execute(self.service.events().watch(
+            calendarId=calendar_id,
+            body={
+                'id': channel_id,
+                'type': 'web_hook',
+                'address': address,
+                'token': token,
+                'params': {'ttl': str(int(ttl))}
+            }
+        ))
+
+    def stop_channel(self, channel_id, resource_id):
+        """Close a push notification channel opened by watch_events"""
+        self._execute(self.service.channels().stop(
+            body={'id': channel_id, 'resourceId': resource_id}))
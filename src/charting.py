@@ -0,0 +1,112 @@
+"""
+Resolution and payload reduction for long dashboard ranges
+"""
+
+from config import AUTO_GRANULARITY_MAX_PERIODS, CHART_MAX_POINTS, TABLE_PAGE_SIZE
+
+# Granularities from finest to coarsest, with their approximate length in days
+GRANULARITY_DAYS = [('day', 1), ('week', 7), ('month', 30.44)]
+
+
+def auto_granularity(start_date, end_date, max_periods=AUTO_GRANULARITY_MAX_PERIODS):
+    """
+    Choose the finest granularity that keeps a range to max_periods periods
+
+    Args:
+        start_date: First day of the range
+        end_date: Last day of the range (inclusive)
+        max_periods: Maximum number of periods
+
+    Returns:
+        'day', 'week' or 'month'; 'month' if even months exceed max_periods
+    """
+    days = (end_date - start_date).days + 1
+    for granularity, length in GRANULARITY_DAYS:
+        if days / length <= max_periods:
+            return granularity
+    return GRANULARITY_DAYS[-1][0]
+
+
+def lttb_indices(values, threshold):
+    """
+    Select points of a series with Largest-Triangle-Three-Buckets
+
+    The first and last points are kept; the points in between are split
+    into threshold - 2 buckets, and each bucket keeps the point forming the
+    largest triangle with the point kept before it and the average of the
+    next bucket. Peaks and dips survive, unlike with plain averaging or
+    striding. Points are assumed evenly spaced.
+
+    Args:
+        values: Sequence of numbers
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted list of the indices to keep
+    """
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    buckets = threshold - 2
+    indices = [0]
+    previous = 0
+
+    for bucket in range(buckets):
+        # Bucket bounds in integer arithmetic, so the last bucket ends
+        # exactly before the last point
+        start = bucket * (n - 2) // buckets + 1
+        end = (bucket + 1) * (n - 2) // buckets + 1
+        next_end = min((bucket + 2) * (n - 2) // buckets + 1, n)
+
+        # Average point of the next bucket (the last point for the last bucket)
+        average_x = (end + next_end - 1) / 2
+        average_y = sum(values[end:next_end]) / (next_end - end)
+
+        previous_y = values[previous]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            # Twice the triangle's area; the factor does not change the maximum
+            area = abs((previous - average_x) * (values[i] - previous_y)
+                       - (previous - i) * (average_y - previous_y))
+            if area > best_area:
+                best, best_area = i, area
+
+        indices.append(best)
+        previous = best
+
+    indices.append(n - 1)
+    return indices
+
+
+def downsample(x, y, max_points=CHART_MAX_POINTS):
+    """
+    Reduce a chart series to at most max_points points with LTTB
+
+    Points whose y value is None (e.g. the first days of a rolling mean)
+    are dropped before downsampling, as LTTB needs numbers.
+
+    Args:
+        x: List of x values
+        y: List of y values, None where there is no value
+        max_points: Maximum number of points; None keeps every point
+
+    Returns:
+        Tuple of (x, y) lists
+    """
+    if max_points is None or len(y) <= max_points:
+        return list(x), list(y)
+
+    if any(value is None for value in y):
+        kept = [i for i, value in enumerate(y) if value is not None]
+        x, y = [x[i] for i in kept], [y[i] for i in kept]
+        if len(y) <= max_points:
+            return x, y
+
+    indices = lttb_indices(y, max_points)
+    return [x[i] for i in indices], [y[i] for i in indices]
+
+
+def page_count(rows, page_size=TABLE_PAGE_SIZE):
+    """Number of pages needed to show rows table rows (at least 1)"""
+    return max(1, -(-rows // page_size))
@@ -0,0 +1,234 @@
+"""
+Persistent local event store backed by SQLite
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import pytz
+from calendar_client import event_bounds
+from config import EVENT_STORE_PATH, TIMEZONE
+
+
+class EventStore:
+    """
+    On-disk copy of calendar events kept current with incremental sync
+
+    Events are stored per calendar together with their start and end as
+    UTC epoch seconds, so range queries are answered from an index without
+    contacting the API. Each calendar also keeps the syncToken returned by
+    its last sync.
+    """
+
+    def __init__(self, path=EVENT_STORE_PATH):
+        self.path = path
+        self.local_tz = pytz.timezone(TIMEZONE)
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.event_listeners = []
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    calendar_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    start_ts REAL NOT NULL,
+                    end_ts REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (calendar_id, event_id)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE INDEX IF NOT EXISTS events_by_start
+                ON events (calendar_id, start_ts)
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    calendar_id TEXT PRIMARY KEY,
+                    sync_token TEXT,
+                    last_synced REAL
+                )
+            ''')
+
+    def subscribe(self, callback):
+        """
+        Register a callback for store changes
+
+        The callback is called as callback(calendar_id, intervals) after
+        changes are applied, where intervals is a list of (start_ts, end_ts)
+        tuples covering the old and new times of every changed event.
+        """
+        self.listeners.append(callback)
+
+    def subscribe_events(self, callback):
+        """
+        Register a callback for changed events
+
+        The callback is called as callback(calendar_id, changes) after
+        changes are applied, where changes is a list of (old, new) tuples of
+        event dictionaries: old is None for added events and new is None for
+        removed ones.
+        """
+        self.event_listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        """Remove a callback registered with subscribe or subscribe_events"""
+        for listeners in (self.listeners, self.event_listeners):
+            if callback in listeners:
+                listeners.remove(callback)
+
+    def close(self):
+        """Close the database connection; the store cannot be used afterwards"""
+        with self.lock:
+            self.conn.close()
+
+    def get_sync_token(self, calendar_id):
+        """Get the stored syncToken for a calendar, or None"""
+        row = self._sync_state(calendar_id)
+        return row[0] if row else None
+
+    def get_last_synced(self, calendar_id):
+        """Get the epoch time of the last sync of a calendar, or None"""
+        row = self._sync_state(calendar_id)
+        return row[1] if row else None
+
+    def get_events(self, calendar_id, start_ts, end_ts):
+        """
+        Get stored events overlapping a time range
+
+        Uses the same rule as the API's timeMin/timeMax filter: an event is
+        returned if it ends after start_ts and starts before end_ts.
+
+        Args:
+            calendar_id: Calendar ID
+            start_ts: Range start as epoch seconds
+            end_ts: Range end as epoch seconds
+
+        Returns:
+            List of event dictionaries ordered by start time
+        """
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT data FROM events
+                WHERE calendar_id = ? AND start_ts < ? AND end_ts > ?
+                ORDER BY start_ts, end_ts
+            ''', (calendar_id, end_ts, start_ts)).fetchall()
+
+        return [json.loads(data) for data, in rows]
+
+    def apply_changes(self, calendar_id, events, sync_token, full_sync=False):
+        """
+        Apply a batch of events returned by a sync
+
+        Cancelled events are removed; every other event is inserted or
+        replaced. A full sync replaces all stored events of the calendar.
+
+        Args:
+            calendar_id: Calendar ID
+            events: List of event dictionaries from the API
+            sync_token: nextSyncToken returned by the API
+            full_sync: Whether events is the complete calendar contents
+
+        Returns:
+            List of (start_ts, end_ts) intervals touched by the changes
+        """
+        intervals = []
+        # (old data, new event) pairs, only collected for event listeners
+        changes = []
+        track_events = bool(self.event_listeners)
+
+        with self.lock, self.conn:
+            if full_sync:
+                for start_ts, end_ts, data in self.conn.execute(
+                        'SELECT start_ts, end_ts, data FROM events WHERE calendar_id = ?',
+                        (calendar_id,)):
+                    intervals.append((start_ts, end_ts))
+                    if track_events:
+                        changes.append((data, None))
+                self.conn.execute(
+                    'DELETE FROM events WHERE calendar_id = ?', (calendar_id,))
+
+            for event in events:
+                old = None
+                if not full_sync:
+                    old = self.conn.execute('''
+                        SELECT start_ts, end_ts, data FROM events
+                        WHERE calendar_id = ? AND event_id = ?
+                    ''', (calendar_id, event['id'])).fetchone()
+                    if old:
+                        intervals.append(old[:2])
+
+                cancelled = event.get('status') == 'cancelled'
+                if track_events and (old or not cancelled):
+                    changes.append((old[2] if old else None, None if cancelled else event))
+
+                if cancelled:
+                    self.conn.execute('''
+                        DELETE FROM events
+                        WHERE calendar_id = ? AND event_id = ?
+                    ''', (calendar_id, event['id']))
+                    continue
+
+                start, end = event_bounds(event, self.local_tz)
+                start_ts, end_ts = start.timestamp(), end.timestamp()
+                intervals.append((start_ts, end_ts))
+
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO events
+                    (calendar_id, event_id, start_ts, end_ts, data)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (calendar_id, event['id'], start_ts, end_ts,
+                      json.dumps(event)))
+
+            self.conn.execute('''
+                INSERT OR REPLACE INTO sync_state
+                (calendar_id, sync_token, last_synced)
+                VALUES (?, ?, ?)
+            ''', (calendar_id, sync_token, time.time()))
+
+        if intervals:
+            for callback in self.listeners:
+                callback(calendar_id, intervals)
+        if changes:
+            self._notify_events(calendar_id, changes)
+
+        return intervals
+
+    def clear_calendar(self, calendar_id):
+        """Remove all stored events and sync state of a calendar"""
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                'SELECT start_ts, end_ts, data FROM events WHERE calendar_id = ?',
+                (calendar_id,)
+            ).fetchall()
+            self.conn.execute(
+                'DELETE FROM events WHERE calendar_id = ?', (calendar_id,))
+            self.conn.execute(
+                'DELETE FROM sync_state WHERE calendar_id = ?', (calendar_id,))
+
+        if rows:
+            intervals = [row[:2] for row in rows]
+            for callback in self.listeners:
+                callback(calendar_id, intervals)
+            self._notify_events(calendar_id, [(row[2], None) for row in rows])
+
+    def _notify_events(self, calendar_id, changes):
+        """Call the event listeners with (old data, new event) pairs"""
+        if not self.event_listeners:
+            return
+
+        changes = [
+            (json.loads(old) if old is not None else None, new)
+            for old, new in changes
+        ]
+        for callback in list(self.event_listeners):
+            callback(calendar_id, changes)
+
+    def _sync_state(self, calendar_id):
+        with self.lock:
+            return self.conn.execute(
+                'SELECT sync_token, last_synced FROM sync_state WHERE calendar_id = ?',
+                (calendar_id,)
+            ).fetchone()
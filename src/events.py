@@ -0,0 +1,83 @@
+"""
+Compact parsed event representation
+"""
+
+from config import ALL_DAY_EVENT_HOURS, DEEP_WORK_CATEGORIES
+
+# Duration counted for all-day events
+ALL_DAY_HOURS = ALL_DAY_EVENT_HOURS
+
+
+class CategoryTable:
+    """
+    Interns category names as small integer ids
+
+    Ids are assigned in order of first use and stay stable for the lifetime
+    of the table, so per-day totals can be kept in id-keyed dicts and only
+    mapped back to names for output.
+    """
+
+    def __init__(self, deep_work_categories=DEEP_WORK_CATEGORIES):
+        self.deep_work_categories = set(deep_work_categories)
+        self.names = []
+        self.ids = {}
+        self.deep_work = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        """Get the id of a category name, assigning one if needed"""
+        category_id = self.ids.get(name)
+        if category_id is None:
+            category_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.deep_work.append(name in self.deep_work_categories)
+        return category_id
+
+    def name(self, category_id):
+        """Get the category name of an id"""
+        return self.names[category_id]
+
+    def is_deep_work(self, category_id):
+        """Check whether a category id counts as deep work"""
+        return self.deep_work[category_id]
+
+
+class CompactEvent:
+    """
+    Event reduced to the fields metrics need
+
+    Times are parsed once from the API's strings into UTC epoch seconds;
+    all-day events span local midnight to local midnight. Instances use
+    __slots__ and take a fraction of the memory of the API's nested dicts.
+    """
+
+    __slots__ = ('start', 'end', 'all_day', 'category_id', 'calendar_id')
+
+    def __init__(self, start, end, all_day, category_id, calendar_id):
+        """
+        Args:
+            start: Start as UTC epoch seconds (float)
+            end: End as UTC epoch seconds (float)
+            all_day: Whether the event is an all-day event
+            category_id: Category id from a CategoryTable
+            calendar_id: ID of the calendar the event belongs to
+        """
+        self.start = start
+        self.end = end
+        self.all_day = all_day
+        self.category_id = category_id
+        self.calendar_id = calendar_id
+
+    @property
+    def duration(self):
+        """Duration in hours, counting all-day events as ALL_DAY_HOURS"""
+        if self.all_day:
+            return ALL_DAY_HOURS
+        return (self.end - self.start) / 3600
+
+    def __repr__(self):
+        return (f"CompactEvent(start={self.start}, end={self.end}, "
+                f"all_day={self.all_day}, category_id={self.category_id}, "
+                f"calendar_id={self.calendar_id!r})")
@@ -0,0 +1,392 @@
+"""
+Offline stand-in for the Google Calendar API service
+
+Implements the parts of the discovery-based service that CalendarClient
+uses (events().list, events().watch, channels().stop, calendarList().list
+and new_batch_http_request) over in-memory synthetic calendars, for
+benchmarks and offline testing.
+"""
+
+import copy
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+import httplib2
+import pytz
+from googleapiclient.errors import HttpError
+from calendar_client import event_bounds
+from config import TIMEZONE
+
+
+def generate_calendar(days=30, start_date=None, events_per_day=8,
+                      all_day_ratio=0.05, overlap_ratio=0.1, timezones=None,
+                      color_ids=None, seed=0, id_prefix='evt'):
+    """
+    Generate synthetic events
+
+    Events are spread over the waking hours of each day; a share of them
+    are all-day events or overlap the previous event, and event times are
+    written in a mix of UTC offsets.
+
+    Args:
+        days: Number of days to generate
+        start_date: First day (default: 2024-01-01)
+        events_per_day: Average number of events per day
+        all_day_ratio: Share of all-day events
+        overlap_ratio: Share of timed events that overlap the previous one
+        timezones: Timezone names used to write event times (default: TIMEZONE)
+        color_ids: Color IDs to draw from; None means no color
+        seed: Random seed
+        id_prefix: Prefix for event IDs
+
+    Returns:
+        List of event dictionaries ordered by start time
+    """
+    rng = random.Random(seed)
+    local_tz = pytz.timezone(TIMEZONE)
+    zones = [pytz.timezone(name) for name in (timezones or [TIMEZONE])]
+    colors = color_ids or ['5', '10', '7', None, '11']
+    start_date = start_date or datetime(2024, 1, 1)
+
+    events = []
+    for day in range(days):
+        date = start_date + timedelta(days=day)
+        cursor = local_tz.localize(date + timedelta(hours=7))
+        previous = None
+
+        for _ in range(rng.randint(0, 2 * events_per_day)):
+            event = {
+                'id': f'{id_prefix}{len(events)}',
+                'status': 'confirmed',
+                'summary': f'Event {len(events)}'
+            }
+            color = rng.choice(colors)
+            if color is not None:
+                event['colorId'] = color
+
+            if rng.random() < all_day_ratio:
+                event['start'] = {'date': date.strftime('%Y-%m-%d')}
+                event['end'] = {
+                    'date': (date + timedelta(days=1)).strftime('%Y-%m-%d')}
+                events.append(event)
+                continue
+
+            if previous is not None and rng.random() < overlap_ratio:
+                start = previous + timedelta(minutes=rng.choice([15, 30]))
+            else:
+                start = cursor + timedelta(minutes=rng.choice([0, 15, 30, 60]))
+            end = start + timedelta(minutes=rng.choice([15, 30, 45, 60, 90, 120]))
+
+            zone = rng.choice(zones)
+            event['start'] = {'dateTime': start.astimezone(zone).isoformat()}
+            event['end'] = {'dateTime': end.astimezone(zone).isoformat()}
+            events.append(event)
+
+            previous = start
+            cursor = max(cursor, end)
+
+    return sorted(events, key=lambda event: event_bounds(event, local_tz)[0])
+
+
+class FakeCalendarService:
+    """
+    In-memory Calendar API service
+
+    Supports time range queries with pagination, incremental sync tokens
+    (including cancelled events) and batch requests. Request counts are
+    recorded, an optional per-request latency simulates the network and an
+    optional quota answers excess requests with 403 rateLimitExceeded.
+
+    Push channels opened with events().watch receive webhook notifications
+    like the real API's: a 'sync' message when opened and an 'exists'
+    message whenever add_event or delete_event changes the calendar.
+    Notifications are POSTed synchronously, so a receiver has been notified
+    when those methods return.
+    """
+
+    def __init__(self, calendars, page_size=250, latency=0.0, quota_qps=None):
+        """
+        Args:
+            calendars: Dictionary mapping calendar IDs to event lists
+            page_size: Default maximum events per page
+            latency: Seconds to sleep per executed request
+            quota_qps: Requests allowed in any one second window; None
+                means unlimited
+        """
+        self.local_tz = pytz.timezone(TIMEZONE)
+        self.page_size = page_size
+        self.latency = latency
+        self.quota_qps = quota_qps
+        self.lock = threading.Lock()
+        self.version = 1
+        self.request_count = 0
+        self.rejected_count = 0
+        self.recent_requests = []
+        self.calendars = {
+            calendar_id: {event['id']: self._entry(event) for event in events}
+            for calendar_id, events in calendars.items()
+        }
+
+        # Channel ID to channel dictionary of open push channels
+        self.watch_channels = {}
+        self.notification_count = 0
+        self.notification_failures = 0
+
+    def events(self):
+        return _EventsResource(self)
+
+    def channels(self):
+        return _ChannelsResource(self)
+
+    def calendarList(self):
+        return _CalendarListResource(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _BatchRequest(self, callback)
+
+    def add_event(self, calendar_id, event):
+        """Add or replace an event, as seen by the next incremental sync"""
+        with self.lock:
+            self.version += 1
+            self.calendars.setdefault(calendar_id, {})[event['id']] = (
+                self._entry(event))
+        self.notify(calendar_id)
+
+    def delete_event(self, calendar_id, event_id):
+        """Cancel an event, as seen by the next incremental sync"""
+        with self.lock:
+            self.version += 1
+            event = self.calendars[calendar_id][event_id][0]
+            self.calendars[calendar_id][event_id] = self._entry(
+                dict(event, status='cancelled'))
+        self.notify(calendar_id)
+
+    def notify(self, calendar_id, state='exists'):
+        """
+        Send a notification to every open channel watching a calendar
+
+        Args:
+            calendar_id: Calendar whose channels to notify
+            state: X-Goog-Resource-State of the notification
+
+        Returns:
+            Number of notifications the receivers acknowledged
+        """
+        now = time.time()
+        with self.lock:
+            channels = [
+                channel for channel in self.watch_channels.values()
+                if channel['calendarId'] == calendar_id and channel['expiration'] > now
+            ]
+        return self._deliver(channels, state)
+
+    def _deliver(self, channels, state):
+        """POST a notification to each channel's address"""
+        delivered = 0
+        for channel in channels:
+            with self.lock:
+                channel['messageNumber'] += 1
+                message_number = channel['messageNumber']
+            request = urllib.request.Request(channel['address'], data=b'', method='POST', headers={
+                'X-Goog-Channel-ID': channel['id'],
+                'X-Goog-Channel-Token': channel['token'],
+                'X-Goog-Channel-Expiration': time.strftime(
+                    '%a, %d %b %Y %H:%M:%S GMT', time.gmtime(channel['expiration'])),
+                'X-Goog-Resource-ID': channel['resourceId'],
+                'X-Goog-Resource-URI': channel['resourceUri'],
+                'X-Goog-Resource-State': state,
+                'X-Goog-Message-Number': str(message_number)
+            })
+            try:
+                with urllib.request.urlopen(request, timeout=5):
+                    delivered += 1
+            except (urllib.error.URLError, OSError):
+                with self.lock:
+                    self.notification_failures += 1
+
+        with self.lock:
+            self.notification_count += delivered
+        return delivered
+
+    def _entry(self, event):
+        """Stored form of an event: (event, version, start, end)"""
+        start, end = event_bounds(event, self.local_tz)
+        return copy.deepcopy(event), self.version, start, end
+
+    def _list(self, calendarId, timeMin=None, timeMax=None, syncToken=None,
+              pageToken=None, maxResults=None, showDeleted=False, **params):
+        """Answer an events().list call without simulated latency"""
+        with self.lock:
+            self._check_quota()
+            self.request_count += 1
+            entries = list(self.calendars.get(calendarId, {}).values())
+            version = self.version
+
+        if syncToken is not None:
+            # Incremental sync returns every change, including cancellations
+            entries = [entry for entry in entries if entry[1] > int(syncToken)]
+        elif not showDeleted:
+            entries = [entry for entry in entries
+                       if entry[0].get('status') != 'cancelled']
+
+        time_min = _parse_time(timeMin)
+        time_max = _parse_time(timeMax)
+        entries = [
+            entry for entry in entries
+            if (time_min is None or entry[3] > time_min)
+            and (time_max is None or entry[2] < time_max)
+        ]
+
+        if params.get('orderBy') == 'startTime':
+            entries.sort(key=lambda entry: entry[2])
+
+        events = [entry[0] for entry in entries]
+
+        offset = int(pageToken or 0)
+        limit = maxResults or self.page_size
+        page = {'items': copy.deepcopy(events[offset:offset + limit])}
+        if offset + limit < len(events):
+            page['nextPageToken'] = str(offset + limit)
+        else:
+            page['nextSyncToken'] = str(version)
+
+        return page
+
+    def _check_quota(self):
+        """Raise a rate limit error if the quota window is full (lock held)"""
+        if self.quota_qps is None:
+            return
+
+        now = time.monotonic()
+        self.recent_requests = [t for t in self.recent_requests if t > now - 1.0]
+        if len(self.recent_requests) >= self.quota_qps:
+            self.rejected_count += 1
+            content = json.dumps({'error': {
+                'code': 403,
+                'message': 'Rate Limit Exceeded',
+                'errors': [{'reason': 'rateLimitExceeded'}]
+            }}).encode('utf-8')
+            raise HttpError(httplib2.Response({'status': 403}), content)
+        self.recent_requests.append(now)
+
+
+class _FakeRequest:
+    def __init__(self, service, function):
+        self.service = service
+        self.function = function
+
+    def execute(self, http=None):
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        return self.function()
+
+
+class _EventsResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, **params):
+        return _FakeRequest(self.service, lambda: self.service._list(**params))
+
+    def watch(self, calendarId, body, **params):
+        service = self.service
+
+        def execute():
+            with service.lock:
+                service._check_quota()
+                service.request_count += 1
+                if calendarId not in service.calendars:
+                    raise HttpError(httplib2.Response({'status': 404}), b'Not Found')
+                ttl = float(body.get('params', {}).get('ttl', 7 * 24 * 3600))
+                channel = service.watch_channels[body['id']] = {
+                    'id': body['id'],
+                    'calendarId': calendarId,
+                    'address': body['address'],
+                    'token': body.get('token', ''),
+                    'resourceId': f'resource-{calendarId}',
+                    'resourceUri': ('https://www.googleapis.com/calendar/v3/calendars/'
+                                    f'{calendarId}/events?alt=json'),
+                    'expiration': time.time() + ttl,
+                    'messageNumber': 0
+                }
+
+            # The API confirms a new channel with a 'sync' message
+            service._deliver([channel], 'sync')
+            return {
+                'kind': 'api#channel',
+                'id': channel['id'],
+                'resourceId': channel['resourceId'],
+                'resourceUri': channel['resourceUri'],
+                'token': channel['token'],
+                'expiration': str(int(channel['expiration'] * 1000))
+            }
+        return _FakeRequest(service, execute)
+
+
+class _ChannelsResource:
+    def __init__(self, service):
+        self.service = service
+
+    def stop(self, body):
+        service = self.service
+
+        def execute():
+            with service.lock:
+                service._check_quota()
+                service.request_count += 1
+                channel = service.watch_channels.get(body['id'])
+                if channel is None or channel['resourceId'] != body.get('resourceId'):
+                    raise HttpError(httplib2.Response({'status': 404}), b'Not Found')
+                del service.watch_channels[body['id']]
+            return ''
+        return _FakeRequest(service, execute)
+
+
+class _CalendarListResource:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, **params):
+        def execute():
+            with self.service.lock:
+                self.service._check_quota()
+                self.service.request_count += 1
+            return {'items': [
+                {'id': calendar_id, 'summary': calendar_id,
+                 'primary': calendar_id == 'primary'}
+                for calendar_id in self.service.calendars
+            ]}
+        return _FakeRequest(self.service, execute)
+
+
+class _BatchRequest:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self.requests))
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self, http=None):
+        # One simulated round trip for the whole batch
+        if self.service.latency:
+            time.sleep(self.service.latency)
+
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.function(), None
+            except Exception as e:
+                response, exception = None, e
+            callback(request_id, response, exception)
+
+
+def _parse_time(value):
+    if value is None:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
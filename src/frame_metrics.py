@@ -0,0 +1,131 @@
+"""
+Vectorized metrics calculation with pandas/NumPy
+"""
+
+import numpy as np
+import pandas as pd
+from events import ALL_DAY_HOURS
+
+# Nanoseconds per hour
+NS_PER_HOUR = 3600 * 10**9
+
+
+def events_to_frame(tracker, events):
+    """
+    Load events into a columnar frame
+
+    Args:
+        tracker: TimeTracker whose category table the events' ids refer to
+        events: Iterable of CompactEvents
+
+    Returns:
+        DataFrame with start/end (UTC nanoseconds), all_day, category,
+        deep_work and duration (hours) columns
+    """
+    starts = []
+    ends = []
+    all_day = []
+    category_ids = []
+
+    for event in events:
+        starts.append(event.start)
+        ends.append(event.end)
+        all_day.append(event.all_day)
+        category_ids.append(event.category_id)
+
+    categories = tracker.categories
+    names = np.array(categories.names, dtype=object)
+    deep_work = np.array(categories.deep_work, dtype=bool)
+    category_ids = np.array(category_ids, dtype=np.int64)
+
+    start = _to_ns(starts)
+    end = _to_ns(ends)
+    all_day = np.array(all_day, dtype=bool)
+
+    return pd.DataFrame({
+        'category': names[category_ids],
+        'start': start,
+        'end': end,
+        'all_day': all_day,
+        'deep_work': deep_work[category_ids],
+        'duration': np.where(all_day, ALL_DAY_HOURS, (end - start) / NS_PER_HOUR)
+    })
+
+
+def frame_daily_metrics(frame, days, bounds):
+    """
+    Calculate daily metrics from an event frame with groupby operations
+
+    Produces the same dictionaries as TimeTracker.calculate_daily_metrics:
+    an event counts in full on every local day it overlaps, and Chores &
+    Misc is the span of timed events minus the other categories' hours.
+
+    Args:
+        frame: DataFrame built by events_to_frame
+        days: List of consecutive datetime objects, one per day
+        bounds: Local midnights as epoch seconds, len(days) + 1 entries
+
+    Returns:
+        List of daily metrics dictionaries, one per day
+    """
+    num_days = len(days)
+    bounds_ns = _to_ns(bounds)
+
+    # Every day an event overlaps: event end > day start and event start < day end
+    first = np.maximum(
+        np.searchsorted(bounds_ns, frame['start'].to_numpy(), side='right') - 1, 0)
+    last = np.minimum(
+        np.searchsorted(bounds_ns, frame['end'].to_numpy(), side='left') - 1,
+        num_days - 1)
+    counts = np.maximum(last - first + 1, 0)
+
+    rows = np.repeat(np.arange(len(frame)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    expanded = frame.iloc[rows].reset_index(drop=True)
+    expanded['day'] = np.repeat(first, counts) + offsets
+
+    non_chores = expanded[expanded['category'] != 'Chores & Misc']
+    category_hours = non_chores.groupby(
+        ['day', 'category'], sort=False)['duration'].sum()
+    non_chores_total = non_chores.groupby('day')['duration'].sum()
+    deep_work_hours = expanded[expanded['deep_work']].groupby('day')[
+        'duration'].sum()
+
+    timed = expanded[~expanded['all_day']].groupby('day')
+    first_start = timed['start'].min()
+    last_end = timed['end'].max()
+    span = (last_end - first_start) / NS_PER_HOUR
+    chores = (span - non_chores_total.reindex(span.index, fill_value=0)).clip(lower=0)
+
+    per_day = [{} for _ in range(num_days)]
+    for (day, category), hours in category_hours.items():
+        per_day[day][category] = float(hours)
+    for day, hours in chores.items():
+        per_day[day]['Chores & Misc'] = float(hours)
+
+    deep_work = deep_work_hours.to_dict()
+    first_times = pd.to_datetime(first_start, utc=True).to_dict()
+    last_times = pd.to_datetime(last_end, utc=True).to_dict()
+
+    return [
+        {
+            'date': date,
+            'category_hours': per_day[i],
+            'deep_work_hours': float(deep_work.get(i, 0)),
+            'total_hours': sum(per_day[i].values()),
+            'first_event_time': _to_datetime(first_times.get(i)),
+            'last_event_time': _to_datetime(last_times.get(i))
+        }
+        for i, date in enumerate(days)
+    ]
+
+
+def _to_datetime(timestamp):
+    """Convert a pandas Timestamp to a datetime, keeping None"""
+    return timestamp.to_pydatetime() if timestamp is not None else None
+
+
+def _to_ns(seconds):
+    """Convert epoch seconds to integer nanoseconds without float rounding"""
+    micros = np.rint(np.array(seconds, dtype=np.float64) * 10**6).astype(np.int64)
+    return micros * 1000
@@ -0,0 +1,331 @@
+"""
+Incrementally maintained metrics for the current days
+"""
+
+import heapq
+import threading
+import weakref
+from collections import defaultdict
+from datetime import datetime, timedelta
+import pytz
+from events import ALL_DAY_HOURS
+from instrumentation import perf
+from metrics import TimeTracker, _overlapped_days
+from config import AUTO_REFRESH_INTERVAL, TIMEZONE
+
+
+class IncrementalMetrics:
+    """
+    Daily metrics of a window of days kept current from event changes
+
+    The window's events are loaded once from the event store; after that,
+    every added, changed or removed event reported by the store adjusts the
+    days it overlaps, so keeping today's numbers current costs
+    O(changed events) instead of a recompute. Each day keeps its category
+    and deep work totals as sums, and the first start and last end of its
+    timed events in heaps with lazy deletion, so removing the event that
+    defined the day's span is cheap too.
+
+    Results match TimeTracker.calculate_daily_metrics with the 'sum'
+    overlap policy (up to float rounding).
+    """
+
+    def __init__(self, tracker, days):
+        """
+        Args:
+            tracker: TimeTracker with an event store whose calendars and
+                category configuration to use; it is not modified
+            days: List of consecutive datetime objects, one per day
+        """
+        client = tracker.client
+        if client.event_store is None:
+            raise ValueError("IncrementalMetrics requires a CalendarClient with an event store")
+
+        # A tracker of its own, as changes are applied from whichever
+        # thread syncs the store
+        self.tracker = TimeTracker(client, tracker.calendar_ids, overlap_policy='sum')
+        self.config_version = self.tracker.config_version()
+        self.days = [datetime.combine(day, datetime.min.time()) for day in days]
+
+        local_tz = pytz.timezone(TIMEZONE)
+        self.bounds = [
+            local_tz.localize(self.days[0] + timedelta(days=i)).timestamp()
+            for i in range(len(self.days) + 1)
+        ]
+
+        self.lock = threading.Lock()
+        self.events = {}
+        self.accumulators = [_IncrementalDay(self.tracker) for _ in self.days]
+        self.applied = 0
+        self.loaded = False
+        self.closed = False
+
+        # Subscribed weakly: a window nobody uses any more, e.g. one of an
+        # ended dashboard session, is freed and unsubscribed instead of
+        # following changes for as long as the (shared) store lives
+        listener = _weak_listener(self.apply)
+        client.event_store.subscribe_events(listener)
+        self._unsubscribe = weakref.finalize(
+            self, client.event_store.unsubscribe, listener)
+
+    def matches(self, tracker, days):
+        """Check whether this window is current for a tracker and days"""
+        return (not self.closed
+                and self.tracker.calendar_ids == list(tracker.calendar_ids)
+                and self.config_version == tracker.config_version()
+                and tracker.overlap_policy == 'sum'
+                and all(datetime.combine(day, datetime.min.time()) in self.days
+                        for day in days))
+
+    def load(self):
+        """Load the window's events from the event store, syncing first"""
+        client = self.tracker.client
+        for calendar_id in self.tracker.calendar_ids:
+            client.ensure_synced(calendar_id)
+
+        # Read the store directly, as a sync started while the lock is held
+        # would deadlock on its change notification
+        with self.lock:
+            if self.loaded:
+                return
+            with perf.stage('incremental_load'):
+                for calendar_id in self.tracker.calendar_ids:
+                    events = client.event_store.get_events(
+                        calendar_id, self.bounds[0], self.bounds[-1])
+                    self._apply(calendar_id, [(None, event) for event in events])
+            self.loaded = True
+
+    def refresh(self, max_age=AUTO_REFRESH_INTERVAL):
+        """
+        Sync calendars last synced more than max_age seconds ago
+
+        Changed events reach apply() through the event store.
+        """
+        self.load()
+        for calendar_id in self.tracker.calendar_ids:
+            self.tracker.client.ensure_synced(calendar_id, max_age)
+
+    def apply(self, calendar_id, changes):
+        """
+        Apply changed events (event store listener)
+
+        Args:
+            calendar_id: Calendar the events belong to
+            changes: List of (old, new) event dictionaries; old is None for
+                added events and new is None for removed ones
+        """
+        if calendar_id not in self.tracker.calendar_ids:
+            return
+
+        with self.lock:
+            if self.loaded:
+                self._apply(calendar_id, changes)
+
+    def close(self):
+        """Stop receiving changes"""
+        self.closed = True
+        self._unsubscribe()
+
+    def daily_metrics(self, date):
+        """
+        Get the metrics of a day in the window
+
+        Returns:
+            Dictionary like TimeTracker.calculate_daily_metrics
+        """
+        i = self.days.index(datetime.combine(date, datetime.min.time()))
+        with self.lock:
+            return self.accumulators[i].result(date)
+
+    def days_metrics(self):
+        """Get the metrics of every day in the window"""
+        with self.lock:
+            return [
+                accumulator.result(day)
+                for accumulator, day in zip(self.accumulators, self.days)
+            ]
+
+    def weekly_metrics(self):
+        """
+        Get the metrics of a seven day window
+
+        Returns:
+            Dictionary like TimeTracker.calculate_weekly_metrics
+        """
+        daily_metrics = self.days_metrics()
+        category_hours = defaultdict(float)
+        for day_metrics in daily_metrics:
+            for category, hours in day_metrics['category_hours'].items():
+                category_hours[category] += hours
+
+        return {
+            'start_date': self.days[0],
+            'end_date': self.days[-1],
+            'category_hours': dict(category_hours),
+            'deep_work_hours': sum(day['deep_work_hours'] for day in daily_metrics),
+            'total_hours': sum(category_hours.values()),
+            'daily_metrics': daily_metrics
+        }
+
+    def _apply(self, calendar_id, changes):
+        """Apply changes with the lock held"""
+        added = []
+        for old, new in changes:
+            event_id = (old or new)['id']
+            previous = self.events.pop((calendar_id, event_id), None)
+            if previous is not None:
+                for i in _overlapped_days(self.bounds, previous):
+                    self.accumulators[i].remove(previous)
+            if new is not None:
+                added.append(dict(new, calendarId=calendar_id))
+
+        for event, compact in zip(added, self.tracker.compact_events(added)):
+            days = _overlapped_days(self.bounds, compact)
+            if not days:
+                continue
+            self.events[(calendar_id, event['id'])] = compact
+            for i in days:
+                self.accumulators[i].add(compact)
+
+        self.applied += len(changes)
+        perf.count('incremental_changes', len(changes))
+
+
+def _weak_listener(method):
+    """Store listener calling a bound method without keeping its object alive"""
+    method_ref = weakref.WeakMethod(method)
+
+    def listener(calendar_id, changes):
+        method = method_ref()
+        if method is not None:
+            method(calendar_id, changes)
+
+    return listener
+
+
+class _IncrementalDay:
+    """
+    Metrics of one day that support removing events
+
+    Mirrors the day accumulator of TimeTracker, keeping totals in seconds
+    and a count per category so categories whose events are all removed
+    disappear again.
+    """
+
+    def __init__(self, tracker):
+        self.categories = tracker.categories
+        self.chores_id = tracker.categories.intern('Chores & Misc')
+        self.category_seconds = defaultdict(float)
+        self.category_counts = defaultdict(int)
+        self.deep_work_seconds = 0.0
+        self.non_chores_seconds = 0.0
+        self.count = 0
+
+        # First start and last end of the day's timed events
+        self.starts = _LazyHeap()
+        self.ends = _LazyHeap(largest=True)
+
+    def add(self, event):
+        self._update(event, 1)
+        if not event.all_day:
+            self.starts.push(event.start)
+            self.ends.push(event.end)
+
+    def remove(self, event):
+        self._update(event, -1)
+        if not event.all_day:
+            self.starts.remove(event.start)
+            self.ends.remove(event.end)
+
+    def _update(self, event, sign):
+        category_id = event.category_id
+        seconds = ALL_DAY_HOURS * 3600 if event.all_day else event.end - event.start
+        self.count += sign
+
+        if category_id != self.chores_id:
+            self.category_counts[category_id] += sign
+            if self.category_counts[category_id]:
+                self.category_seconds[category_id] += sign * seconds
+            else:
+                del self.category_counts[category_id]
+                del self.category_seconds[category_id]
+            self.non_chores_seconds += sign * seconds
+
+        if self.categories.is_deep_work(category_id):
+            self.deep_work_seconds += sign * seconds
+
+        if not self.count:
+            # Drop rounding residue once the day is empty
+            self.deep_work_seconds = self.non_chores_seconds = 0.0
+
+    def result(self, date):
+        category_hours = {
+            self.categories.name(category_id): seconds / 3600
+            for category_id, seconds in self.category_seconds.items()
+        }
+        first_event_time = last_event_time = None
+
+        first, last = self.starts.top(), self.ends.top()
+        if first is not None:
+            category_hours['Chores & Misc'] = max(
+                0, (last - first - self.non_chores_seconds) / 3600)
+            first_event_time = datetime.fromtimestamp(first, pytz.utc)
+            last_event_time = datetime.fromtimestamp(last, pytz.utc)
+
+        return {
+            'date': date,
+            'category_hours': category_hours,
+            'deep_work_hours': self.deep_work_seconds / 3600,
+            'total_hours': sum(category_hours.values()),
+            'first_event_time': first_event_time,
+            'last_event_time': last_event_time
+        }
+
+
+class _LazyHeap:
+    """
+    Heap of numbers whose removals are applied lazily
+
+    Removed values are remembered and only popped once they reach the top,
+    so push, remove and top are O(log n) amortized.
+    """
+
+    def __init__(self, largest=False):
+        self.sign = -1 if largest else 1
+        self.heap = []
+        self.removed = defaultdict(int)
+        self.size = 0
+
+    def push(self, value):
+        heapq.heappush(self.heap, self.sign * value)
+        self.size += 1
+
+    def remove(self, value):
+        self.removed[self.sign * value] += 1
+        self.size -= 1
+
+        # Rebuild once removed entries dominate, bounding memory
+        if len(self.heap) > 2 * self.size + 16:
+            self._compact()
+
+    def top(self):
+        """Smallest (or largest) value, or None if empty"""
+        heap = self.heap
+        while heap and self.removed.get(heap[0]):
+            self._forget(heapq.heappop(heap))
+        return self.sign * heap[0] if heap else None
+
+    def _forget(self, key):
+        self.removed[key] -= 1
+        if not self.removed[key]:
+            del self.removed[key]
+
+    def _compact(self):
+        kept = []
+        for key in self.heap:
+            if self.removed.get(key):
+                self._forget(key)
+            else:
+                kept.append(key)
+        heapq.heapify(kept)
+        self.heap = kept
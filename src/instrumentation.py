@@ -0,0 +1,123 @@
+"""
+Lightweight performance instrumentation
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from config import PERF_ENABLED, PERF_LOG_PATH
+
+# Shared no-op context returned by stage() while disabled
+_NULL_STAGE = nullcontext()
+
+
+class Instrumentation:
+    """
+    Per-stage timers and counters
+
+    Stages nest: each stage records its total time and its self time (total
+    minus time spent in nested stages on the same thread), so e.g. event
+    aggregation can be told apart from the API requests it waits on. While
+    disabled, stage() and count() return immediately.
+    """
+
+    def __init__(self, enabled=PERF_ENABLED, log_path=PERF_LOG_PATH):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """Clear all recorded timings and counters"""
+        with self.lock:
+            self.stages = defaultdict(lambda: {
+                'calls': 0, 'total_s': 0.0, 'self_s': 0.0, 'max_s': 0.0})
+            self.counters = defaultdict(int)
+
+    def stage(self, name):
+        """Context manager timing a named stage"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def count(self, name, value=1):
+        """Add value to a named counter"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += value
+
+    def snapshot(self):
+        """
+        Get the recorded metrics
+
+        Returns:
+            Dictionary with 'stages' (calls, total_s, self_s and max_s per
+            stage), 'counters' and 'hit_rates', the latter computed for every
+            '<name>_hits' / '<name>_misses' counter pair
+        """
+        with self.lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            counters = dict(self.counters)
+
+        hit_rates = {}
+        for name, hits in counters.items():
+            if name.endswith('_hits'):
+                prefix = name[:-len('_hits')]
+                lookups = hits + counters.get(f'{prefix}_misses', 0)
+                hit_rates[prefix] = hits / lookups if lookups else 0.0
+
+        return {'stages': stages, 'counters': counters, 'hit_rates': hit_rates}
+
+    def write_log(self, **context):
+        """Append the current snapshot as a JSON line to log_path, if set"""
+        if not self.enabled or not self.log_path:
+            return
+
+        record = dict(context, timestamp=time.time(), **self.snapshot())
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, name, elapsed, self_time):
+        with self.lock:
+            stage = self.stages[name]
+            stage['calls'] += 1
+            stage['total_s'] += elapsed
+            stage['self_s'] += self_time
+            stage['max_s'] = max(stage['max_s'], elapsed)
+
+
+class _Stage:
+    __slots__ = ('perf', 'name', 'started', 'child_time')
+
+    def __init__(self, perf, name):
+        self.perf = perf
+        self.name = name
+
+    def __enter__(self):
+        self.perf._stack().append(self)
+        self.child_time = 0.0
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        stack = self.perf._stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_time += elapsed
+        self.perf._record(self.name, elapsed, elapsed - self.child_time)
+        return False
+
+
+# Process-wide instrumentation used by the client, metrics and dashboard
+perf = Instrumentation()
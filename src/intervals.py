@@ -0,0 +1,179 @@
+"""
+Sweep-line interval accounting for overlapping events
+"""
+
+from bisect import bisect_right
+
+# Overlap policies for TimeTracker
+OVERLAP_POLICIES = ('sum', 'priority', 'proportional')
+
+
+def sweep(intervals):
+    """
+    Split intervals into disjoint elementary segments
+
+    Sorts the interval endpoints once and walks them in order, so n
+    intervals take O(n log n) plus the size of the output.
+
+    Args:
+        intervals: Iterable of (start, end, item) tuples; empty or negative
+            intervals are ignored
+
+    Yields:
+        (start, end, active) tuples in time order, where active is a tuple
+        of the items covering [start, end), in the order they started.
+        Gaps where nothing is active are skipped.
+    """
+    points = []
+    for index, (start, end, item) in enumerate(intervals):
+        if end > start:
+            # Ends sort before starts at the same time, so back-to-back
+            # events never appear to overlap
+            points.append((start, 1, index, item))
+            points.append((end, 0, index, item))
+    points.sort(key=lambda point: point[:3])
+
+    active = {}
+    previous = None
+    for time, is_start, index, item in points:
+        if active and time > previous:
+            yield previous, time, tuple(active.values())
+
+        if is_start:
+            active[index] = item
+        else:
+            del active[index]
+        previous = time
+
+
+class IntervalIndex:
+    """
+    Point and range queries over a fixed set of intervals
+
+    Built from the elementary segments of a sweep, so "what was active at
+    time T" is a binary search over segment starts.
+    """
+
+    def __init__(self, intervals):
+        """
+        Args:
+            intervals: Iterable of (start, end, item) tuples
+        """
+        self.starts = []
+        self.ends = []
+        self.active = []
+        for start, end, active in sweep(intervals):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.active.append(active)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def at(self, time):
+        """
+        Get the items active at a point in time
+
+        Args:
+            time: Point in time, in the same unit as the interval bounds
+
+        Returns:
+            Tuple of items whose interval contains time (start inclusive,
+            end exclusive)
+        """
+        i = bisect_right(self.starts, time) - 1
+        if i < 0 or time >= self.ends[i]:
+            return ()
+        return self.active[i]
+
+    def overlapping(self, start, end):
+        """
+        Get the items active at any time in [start, end)
+
+        Returns:
+            List of distinct items, in order of first activity
+        """
+        seen = {}
+        i = max(bisect_right(self.starts, start) - 1, 0)
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.ends[i] > start:
+                for item in self.active[i]:
+                    seen.setdefault(id(item), item)
+            i += 1
+        return list(seen.values())
+
+
+def account_days(events, bounds, policy, rank):
+    """
+    Attribute the time of timed events to days and categories
+
+    Each day's events are clipped to the day, and time covered by several
+    events at once is counted only once in total:
+
+    - 'priority': overlapping time goes to the event whose category ranks
+      highest (lowest rank); ties go to the event that started first
+    - 'proportional': overlapping time is split evenly between the events
+
+    All-day events are skipped; they are accounted separately by the caller.
+
+    Args:
+        events: Iterable of CompactEvents
+        bounds: Day boundaries as epoch seconds, len(days) + 1 entries
+        policy: 'priority' or 'proportional'
+        rank: Function mapping a category id to its priority rank
+
+    Returns:
+        List with one (category_seconds, first, last) tuple per day:
+        category_seconds maps category ids to attributed seconds, and
+        first/last are the earliest start and latest end of the day's
+        clipped events (None for days without timed events)
+    """
+    if policy not in ('priority', 'proportional'):
+        raise ValueError(f"Unknown overlap policy: {policy}")
+
+    num_days = len(bounds) - 1
+    days = [({}, None, None) for _ in range(num_days)]
+
+    intervals = (
+        (event.start, event.end, event)
+        for event in events if not event.all_day
+    )
+
+    # After splitting, every segment lies within a single day
+    for start, end, active in _split(sweep(intervals), bounds):
+        day = bisect_right(bounds, start) - 1
+        if day < 0 or day >= num_days:
+            continue
+
+        category_seconds, first, last = days[day]
+        length = end - start
+
+        if policy == 'priority':
+            winner = min(active, key=lambda event: (
+                rank(event.category_id), event.start))
+            category_seconds[winner.category_id] = (
+                category_seconds.get(winner.category_id, 0) + length)
+        else:
+            share = length / len(active)
+            for event in active:
+                category_seconds[event.category_id] = (
+                    category_seconds.get(event.category_id, 0) + share)
+
+        days[day] = (
+            category_seconds,
+            start if first is None else first,
+            end
+        )
+
+    return days
+
+
+def _split(segments, bounds):
+    """Split segments at day boundaries"""
+    for start, end, active in segments:
+        i = bisect_right(bounds, start)
+        while i < len(bounds) and bounds[i] < end:
+            yield start, bounds[i], active
+            start = bounds[i]
+            i += 1
+        yield start, end, active
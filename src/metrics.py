@@ -2,19 +2,90 @@
 Metrics calculation for time tracking
 """
 
+import hashlib
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
 from collections import defaultdict
-import pandas as pd
-from config import COLOR_CATEGORIES, DEEP_WORK_CATEGORIES
+import pytz
+from calendar_client import event_bounds
+from config import (COLOR_CATEGORIES, CALENDAR_CATEGORIES, CATEGORY_RULES,
+                    DEEP_WORK_CATEGORIES, TIMEZONE, TRACKED_CALENDARS, METRICS_ENGINE,
+                    OVERLAP_POLICY, CATEGORY_PRIORITY, ALL_DAY_EVENT_HOURS)
+from events import CategoryTable, CompactEvent
+from instrumentation import perf
+from intervals import OVERLAP_POLICIES, IntervalIndex, account_days
+from rules import RuleSet
+
+# Period key and label functions for calculate_range_metrics
+PERIOD_KEYS = {
+    'day': (
+        lambda day: day.date(),
+        lambda day: day.strftime('%Y-%m-%d')
+    ),
+    'week': (
+        lambda day: day.isocalendar()[:2],
+        lambda day: '{}-W{:02d}'.format(*day.isocalendar()[:2])
+    ),
+    'month': (
+        lambda day: (day.year, day.month),
+        lambda day: day.strftime('%Y-%m')
+    ),
+}
 
 
 class TimeTracker:
-    def __init__(self, calendar_client):
+    def __init__(self, calendar_client, calendar_ids=None, engine=METRICS_ENGINE,
+                 rollups=None, overlap_policy=OVERLAP_POLICY, archive=None):
+        if rollups is not None and calendar_client.event_store is None:
+            raise ValueError(
+                "Rollups require a CalendarClient with an event store")
+        if rollups is not None and archive is not None:
+            raise ValueError("Rollups cannot be combined with an archive")
+        if overlap_policy not in OVERLAP_POLICIES:
+            raise ValueError(f"Unknown overlap policy: {overlap_policy}")
+
         self.client = calendar_client
+        self.calendar_ids = list(calendar_ids or TRACKED_CALENDARS)
+        self.engine = engine
+        self.rollups = rollups
+        self.overlap_policy = overlap_policy
+        self.archive = archive
+        self.rules = RuleSet()
+        self.categories = CategoryTable()
+        self._chores_id = self.categories.intern('Chores & Misc')
+
+    def config_version(self):
+        """
+        Get a version string for the category configuration
+
+        Changes whenever the category rules and mappings, DEEP_WORK_CATEGORIES,
+        TIMEZONE or the overlap accounting settings change, so stored or
+        cached metrics computed with another configuration can be detected.
+        """
+        config = repr((
+            CATEGORY_RULES,
+            sorted(COLOR_CATEGORIES.items(), key=repr),
+            sorted(CALENDAR_CATEGORIES.items(), key=repr),
+            sorted(DEEP_WORK_CATEGORIES),
+            TIMEZONE,
+            self.overlap_policy,
+            list(CATEGORY_PRIORITY),
+            ALL_DAY_EVENT_HOURS
+        ))
+        return hashlib.sha1(config.encode()).hexdigest()[:12]
+
+    def scope(self):
+        """Get a key identifying the set of tracked calendars"""
+        return ','.join(sorted(self.calendar_ids))
 
     def categorize_event(self, event):
         """
-        Categorize an event based on its color
+        Categorize an event based on its calendar, color and title
+
+        CATEGORY_RULES are checked first. Events no rule matches are looked
+        up in CALENDAR_CATEGORIES for the event's (calendar, color) pair and
+        then for the calendar's '*' entry, before falling back to
+        COLOR_CATEGORIES.
 
         Args:
             event: Event dictionary from Google Calendar API
@@ -22,12 +93,52 @@ class TimeTracker:
         Returns:
             Category name or 'Uncategorized'
         """
-        color_id = self.client.get_event_color(event)
+        return self.rules.categorize(
+            self.client.get_event_calendar(event),
+            self.client.get_event_color(event),
+            event.get('summary', '')
+        )
 
-        if color_id in COLOR_CATEGORIES:
-            return COLOR_CATEGORIES[color_id]
+    def category_id(self, calendar_id, color_id, summary=None):
+        """
+        Get the interned category id of an event's calendar, color and title
 
-        return 'Uncategorized'
+        Results are memoized by the rule set.
+        """
+        return self.categories.intern(
+            self.rules.categorize(calendar_id, color_id, summary))
+
+    def compact_events(self, events):
+        """
+        Parse API events into CompactEvents
+
+        Each event's time strings are parsed exactly once here; everything
+        downstream works on the epoch times and interned category ids.
+
+        Args:
+            events: Iterable of event dictionaries from Google Calendar API
+
+        Yields:
+            CompactEvent per event, in input order
+        """
+        local_tz = pytz.timezone(TIMEZONE)
+        client = self.client
+        uses_summary = self.rules.uses_summary
+
+        for event in events:
+            start, end = event_bounds(event, local_tz)
+            calendar_id = client.get_event_calendar(event)
+
+            yield CompactEvent(
+                start.timestamp(),
+                end.timestamp(),
+                'dateTime' not in event['start'],
+                self.category_id(
+                    calendar_id,
+                    client.get_event_color(event),
+                    event.get('summary', '') if uses_summary else None),
+                calendar_id
+            )
 
     def calculate_daily_metrics(self, date):
         """
@@ -39,58 +150,181 @@ class TimeTracker:
         Returns:
             Dictionary with category breakdowns and deep work time
         """
+        if self.rollups is not None or self.overlap_policy != 'sum':
+            return self.calculate_days_metrics([date])[0]
+
         start = datetime.combine(date, datetime.min.time())
         end = start + timedelta(days=1)
 
-        events = self.client.get_events(start, end)
-
-        category_hours = defaultdict(float)
-        deep_work_hours = 0
-
-        # Track first and last event times for chores calculation
-        first_event_time = None
-        last_event_time = None
-        non_chores_total = 0
+        with perf.stage('aggregate'):
+            events = self._iter_compact_events(start, end)
 
-        for event in events:
-            category = self.categorize_event(event)
-            duration = self.client.get_event_duration(event)
+            accumulator = _DayAccumulator(self)
+            for event in events:
+                accumulator.add(event)
 
-            # Track event times (skip all-day events)
-            event_start = event['start'].get('dateTime')
-            event_end = event['end'].get('dateTime')
+            return accumulator.result(date)
 
-            if event_start and 'T' in event_start:  # Not an all-day event
-                event_start_dt = datetime.fromisoformat(
-                    event_start.replace('Z', '+00:00'))
-                event_end_dt = datetime.fromisoformat(
-                    event_end.replace('Z', '+00:00'))
+    def calculate_days_metrics(self, days):
+        """
+        Calculate daily metrics for consecutive days with a single fetch
 
-                if first_event_time is None or event_start_dt < first_event_time:
-                    first_event_time = event_start_dt
-                if last_event_time is None or event_end_dt > last_event_time:
-                    last_event_time = event_end_dt
+        Events for the whole window are requested once and split into
+        local-timezone days here, using the same overlap rule as the API's
+        timeMin/timeMax filter, so each entry matches what
+        calculate_daily_metrics would return for that day. With the
+        'pandas' engine the split and aggregation are vectorized.
 
-            # Add duration for non-chores categories
-            if category != 'Chores & Misc':
-                category_hours[category] += duration
-                non_chores_total += duration
+        When rollups are enabled, stored days are reused and only missing
+        or invalidated days are recomputed.
 
-            if category in DEEP_WORK_CATEGORIES:
-                deep_work_hours += duration
+        Args:
+            days: List of consecutive datetime objects, one per day
 
-        # Calculate chores & misc using the formula
-        if first_event_time and last_event_time:
-            total_span = (last_event_time -
-                          first_event_time).total_seconds() / 3600
+        Returns:
+            List of daily metrics dictionaries, one per day
+        """
+        if not days:
+            return []
+
+        if self.rollups is not None:
+            return self._calculate_days_with_rollups(days)
+
+        return self._compute_days_metrics(days)
+
+    def _calculate_days_with_rollups(self, days):
+        """Calculate daily metrics, reusing stored rollups where current"""
+        # Syncing first applies pending changes, invalidating affected days
+        for calendar_id in self.calendar_ids:
+            self.client.ensure_synced(calendar_id)
+
+        scope = self.scope()
+        version = self.config_version()
+        results = self.rollups.get_days(scope, version, days)
+
+        missing = [i for i in range(len(days)) if i not in results]
+        perf.count('rollup_hits', len(results))
+        perf.count('rollup_misses', len(missing))
+        for run in _consecutive_runs(missing):
+            computed = self._compute_days_metrics([days[i] for i in run])
+            self.rollups.put_days(scope, version, computed)
+            results.update(zip(run, computed))
+
+        return [results[i] for i in range(len(days))]
+
+    def _compute_days_metrics(self, days):
+        """Calculate daily metrics for consecutive days from events"""
+        local_tz = pytz.timezone(TIMEZONE)
+        first_day = datetime.combine(days[0], datetime.min.time())
+
+        # Local midnights bounding each day as epoch seconds;
+        # bounds[i] <= day i < bounds[i + 1]
+        bounds = [
+            local_tz.localize(first_day + timedelta(days=i)).timestamp()
+            for i in range(len(days) + 1)
+        ]
+
+        # Events are consumed and parsed page by page as they arrive
+        events = self._iter_compact_events(
+            first_day, first_day + timedelta(days=len(days)))
+
+        if self.overlap_policy != 'sum':
+            return self._overlap_days_metrics(days, bounds, events)
+
+        if self.engine == 'pandas':
+            # pandas and NumPy are only loaded when this engine is used
+            from frame_metrics import events_to_frame, frame_daily_metrics
+
+            with perf.stage('frame_build'):
+                frame = events_to_frame(self, events)
+            with perf.stage('frame_aggregate'):
+                return frame_daily_metrics(frame, days, bounds)
+
+        # Self time of this stage is parsing and aggregation; API requests
+        # made while pages are consumed are recorded as nested stages
+        with perf.stage('aggregate'):
+            accumulators = [_DayAccumulator(self) for _ in days]
+            for event in events:
+                for i in _overlapped_days(bounds, event):
+                    accumulators[i].add(event)
+
+            return [
+                accumulator.result(day)
+                for accumulator, day in zip(accumulators, days)
+            ]
+
+    def _overlap_days_metrics(self, days, bounds, events):
+        """
+        Calculate daily metrics with the 'priority' or 'proportional' policy
+
+        Timed events are clipped to each day and overlapping time is counted
+        once (see intervals.account_days), so the category hours of a day
+        never exceed its span and Chores & Misc is exactly the uncovered
+        time between the first and last event. All-day events add
+        ALL_DAY_EVENT_HOURS to their category on every day they cover,
+        without reducing Chores & Misc.
+        """
+        with perf.stage('aggregate'):
+            events = list(events)
+            priority = {name: i for i, name in enumerate(CATEGORY_PRIORITY)}
+            names = self.categories.names
+
+            accounted = account_days(
+                events,
+                bounds,
+                self.overlap_policy,
+                lambda category_id: priority.get(names[category_id], len(priority))
+            )
+
+            all_day_hours = [defaultdict(float) for _ in days]
+            for event in events:
+                if event.all_day:
+                    for i in _overlapped_days(bounds, event):
+                        all_day_hours[i][event.category_id] += event.duration
+
+            return [
+                self._overlap_day_result(day, *accounted[i], all_day_hours[i])
+                for i, day in enumerate(days)
+            ]
+
+    def _overlap_day_result(self, date, category_seconds, first, last, all_day_hours):
+        """Build a daily metrics dictionary from accounted seconds"""
+        categories = self.categories
+        category_hours = defaultdict(float)
+        deep_work_hours = 0
+        timed_total = 0
+
+        for category_id, seconds in category_seconds.items():
+            if category_id == self._chores_id:
+                continue
+            hours = seconds / 3600
+            category_hours[categories.name(category_id)] += hours
+            timed_total += hours
+            if categories.is_deep_work(category_id):
+                deep_work_hours += hours
+
+        for category_id, hours in all_day_hours.items():
+            if category_id == self._chores_id:
+                continue
+            category_hours[categories.name(category_id)] += hours
+            if categories.is_deep_work(category_id):
+                deep_work_hours += hours
+
+        first_event_time = last_event_time = None
+        if first is not None:
+            # Never negative up to rounding, as overlaps are counted once
             category_hours['Chores & Misc'] = max(
-                0, total_span - non_chores_total)
+                0, (last - first) / 3600 - timed_total)
+            first_event_time = datetime.fromtimestamp(first, pytz.utc)
+            last_event_time = datetime.fromtimestamp(last, pytz.utc)
 
         return {
             'date': date,
             'category_hours': dict(category_hours),
             'deep_work_hours': deep_work_hours,
-            'total_hours': sum(category_hours.values())
+            'total_hours': sum(category_hours.values()),
+            'first_event_time': first_event_time,
+            'last_event_time': last_event_time
         }
 
     def calculate_weekly_metrics(self, start_date):
@@ -103,24 +337,15 @@ class TimeTracker:
         Returns:
             Dictionary with weekly aggregated metrics
         """
-        category_hours = defaultdict(float)
-        deep_work_hours = 0
-        daily_metrics = []
-
-        for i in range(7):
-            day = start_date + timedelta(days=i)
-            day_metrics = self.calculate_daily_metrics(day)
-            daily_metrics.append(day_metrics)
-
-            for category, hours in day_metrics['category_hours'].items():
-                category_hours[category] += hours
-
-            deep_work_hours += day_metrics['deep_work_hours']
+        days = [start_date + timedelta(days=i) for i in range(7)]
+        daily_metrics = self.calculate_days_metrics(days)
+        category_hours, deep_work_hours = self._sum_daily_metrics(
+            daily_metrics)
 
         return {
             'start_date': start_date,
             'end_date': start_date + timedelta(days=6),
-            'category_hours': dict(category_hours),
+            'category_hours': category_hours,
             'deep_work_hours': deep_work_hours,
             'total_hours': sum(category_hours.values()),
             'daily_metrics': daily_metrics
@@ -139,32 +364,111 @@ class TimeTracker:
         """
         from calendar import monthrange
 
-        start_date = datetime(year, month, 1)
         _, last_day = monthrange(year, month)
 
-        category_hours = defaultdict(float)
-        deep_work_hours = 0
-        daily_metrics = []
-
-        for day in range(1, last_day + 1):
-            current_date = datetime(year, month, day)
-            day_metrics = self.calculate_daily_metrics(current_date)
-            daily_metrics.append(day_metrics)
-
-            for category, hours in day_metrics['category_hours'].items():
-                category_hours[category] += hours
-
-            deep_work_hours += day_metrics['deep_work_hours']
+        days = [datetime(year, month, day) for day in range(1, last_day + 1)]
+        daily_metrics = self.calculate_days_metrics(days)
+        category_hours, deep_work_hours = self._sum_daily_metrics(
+            daily_metrics)
 
         return {
             'year': year,
             'month': month,
-            'category_hours': dict(category_hours),
+            'category_hours': category_hours,
             'deep_work_hours': deep_work_hours,
             'total_hours': sum(category_hours.values()),
             'daily_metrics': daily_metrics
         }
 
+    def calculate_range_metrics(self, start_date, end_date, granularity='day'):
+        """
+        Calculate metrics for an arbitrary date range
+
+        The whole range is fetched once and aggregated into periods of the
+        requested granularity, so multi-year ranges cost a single bulk
+        fetch.
+
+        Args:
+            start_date: datetime object for the first day
+            end_date: datetime object for the last day (inclusive)
+            granularity: 'day', 'week' (ISO weeks) or 'month'
+
+        Returns:
+            Dictionary with range totals, daily metrics and per-period metrics
+        """
+        if granularity not in PERIOD_KEYS:
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        start_date = datetime.combine(start_date, datetime.min.time())
+        end_date = datetime.combine(end_date, datetime.min.time())
+        num_days = (end_date - start_date).days + 1
+
+        days = [start_date + timedelta(days=i) for i in range(num_days)]
+        daily_metrics = self.calculate_days_metrics(days)
+        category_hours, deep_work_hours = self._sum_daily_metrics(
+            daily_metrics)
+
+        # Group consecutive days sharing a period key
+        period_key, period_label = PERIOD_KEYS[granularity]
+        periods = []
+        for day_metrics in daily_metrics:
+            key = period_key(day_metrics['date'])
+            if not periods or periods[-1][0] != key:
+                periods.append((key, []))
+            periods[-1][1].append(day_metrics)
+
+        period_metrics = []
+        for _, period_days in periods:
+            period_hours, period_deep_work = self._sum_daily_metrics(
+                period_days)
+            period_metrics.append({
+                'period_start': period_days[0]['date'],
+                'period_end': period_days[-1]['date'],
+                'label': period_label(period_days[0]['date']),
+                'days': len(period_days),
+                'category_hours': period_hours,
+                'deep_work_hours': period_deep_work,
+                'total_hours': sum(period_hours.values())
+            })
+
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'granularity': granularity,
+            'category_hours': category_hours,
+            'deep_work_hours': deep_work_hours,
+            'total_hours': sum(category_hours.values()),
+            'daily_metrics': daily_metrics,
+            'periods': period_metrics
+        }
+
+    def _iter_events(self, start, end):
+        """Iterate over the events of all tracked calendars in a range"""
+        if len(self.calendar_ids) == 1:
+            return self.client.iter_events(start, end, self.calendar_ids[0])
+
+        return iter(self.client.get_events_multi(start, end, self.calendar_ids))
+
+    def _iter_compact_events(self, start, end):
+        """Iterate over CompactEvents in a range, from the archive if set"""
+        if self.archive is not None:
+            return self.archive.compact_events(self, start, end)
+
+        return self.compact_events(self._iter_events(start, end))
+
+    def _sum_daily_metrics(self, daily_metrics):
+        """Add up category and deep work hours across daily metrics"""
+        category_hours = defaultdict(float)
+        deep_work_hours = 0
+
+        for day_metrics in daily_metrics:
+            for category, hours in day_metrics['category_hours'].items():
+                category_hours[category] += hours
+
+            deep_work_hours += day_metrics['deep_work_hours']
+
+        return dict(category_hours), deep_work_hours
+
     def get_events_with_categories(self, start_date, end_date):
         """
         Get all events with their categories for debugging/inspection
@@ -176,16 +480,127 @@ class TimeTracker:
         Returns:
             List of dictionaries with event details
         """
-        events = self.client.get_events(start_date, end_date)
+        events = list(self._iter_events(start_date, end_date))
 
         result = []
-        for event in events:
+        for event, compact in zip(events, self.compact_events(events)):
             result.append({
                 'summary': event.get('summary', 'No Title'),
                 'start': event['start'].get('dateTime', event['start'].get('date')),
-                'duration_hours': self.client.get_event_duration(event),
+                'duration_hours': compact.duration,
                 'color_id': self.client.get_event_color(event),
-                'category': self.categorize_event(event)
+                'calendar_id': compact.calendar_id,
+                'category': self.categories.name(compact.category_id)
             })
 
         return result
+
+    def activity_index(self, start_date, end_date):
+        """
+        Build an index answering "what was I doing at time T"
+
+        Args:
+            start_date: datetime object
+            end_date: datetime object
+
+        Returns:
+            IntervalIndex over epoch seconds whose items are dictionaries
+            with the event's summary, category, calendar, start, end and
+            all-day flag
+        """
+        events = list(self._iter_events(start_date, end_date))
+
+        intervals = []
+        for event, compact in zip(events, self.compact_events(events)):
+            intervals.append((compact.start, compact.end, {
+                'summary': event.get('summary', 'No Title'),
+                'category': self.categories.name(compact.category_id),
+                'calendar_id': compact.calendar_id,
+                'start': datetime.fromtimestamp(compact.start, pytz.utc),
+                'end': datetime.fromtimestamp(compact.end, pytz.utc),
+                'all_day': compact.all_day
+            }))
+
+        return IntervalIndex(intervals)
+
+
+def _overlapped_days(bounds, event):
+    """
+    Indices of the days an event overlaps
+
+    Uses the same rule as the API's timeMin/timeMax filter: an event
+    belongs to a day if it ends after the day starts and starts before
+    the day ends.
+    """
+    first = max(bisect_right(bounds, event.start) - 1, 0)
+    last = min(bisect_left(bounds, event.end) - 1, len(bounds) - 2)
+    return range(first, last + 1)
+
+
+def _consecutive_runs(indices):
+    """Split sorted indices into runs of consecutive values"""
+    runs = []
+    for i in indices:
+        if runs and runs[-1][-1] == i - 1:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    return runs
+
+
+class _DayAccumulator:
+    """Accumulates the CompactEvents of one day into daily metrics"""
+
+    def __init__(self, tracker):
+        self.categories = tracker.categories
+        self.chores_id = tracker._chores_id
+        self.category_hours = defaultdict(float)
+        self.deep_work_hours = 0
+
+        # Track first and last event times (epoch seconds) for chores calculation
+        self.first_event_time = None
+        self.last_event_time = None
+        self.non_chores_total = 0
+
+    def add(self, event):
+        category_id = event.category_id
+        duration = event.duration
+
+        # Track event times (skip all-day events)
+        if not event.all_day:
+            if self.first_event_time is None or event.start < self.first_event_time:
+                self.first_event_time = event.start
+            if self.last_event_time is None or event.end > self.last_event_time:
+                self.last_event_time = event.end
+
+        # Add duration for non-chores categories
+        if category_id != self.chores_id:
+            self.category_hours[category_id] += duration
+            self.non_chores_total += duration
+
+        if self.categories.is_deep_work(category_id):
+            self.deep_work_hours += duration
+
+    def result(self, date):
+        category_hours = {
+            self.categories.name(category_id): hours
+            for category_id, hours in self.category_hours.items()
+        }
+        first_event_time = last_event_time = None
+
+        # Calculate chores & misc using the formula
+        if self.first_event_time is not None:
+            total_span = (self.last_event_time - self.first_event_time) / 3600
+            category_hours['Chores & Misc'] = max(
+                0, total_span - self.non_chores_total)
+            first_event_time = datetime.fromtimestamp(self.first_event_time, pytz.utc)
+            last_event_time = datetime.fromtimestamp(self.last_event_time, pytz.utc)
+
+        return {
+            'date': date,
+            'category_hours': category_hours,
+            'deep_work_hours': self.deep_work_hours,
+            'total_hours': sum(category_hours.values()),
+            'first_event_time': first_event_time,
+            'last_event_time': last_event_time
+        }
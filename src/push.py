@@ -0,0 +1,404 @@
+"""
+Push notifications of calendar changes
+"""
+
+import hmac
+import secrets
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from instrumentation import perf
+from scheduler import AUTH_POLL_INTERVAL
+from config import (PUSH_ADDRESS, PUSH_HOST, PUSH_PORT, PUSH_PATH, PUSH_CHANNEL_TTL,
+                    PUSH_RENEW_MARGIN)
+
+# Seconds to wait before retrying after a failed sync or channel request
+RETRY_INTERVAL = 60
+
+# Resource states that mean a calendar's events changed; 'sync' only
+# confirms that a new channel works
+CHANGE_STATES = {'exists', 'not_exists'}
+
+
+class WebhookReceiver:
+    """
+    HTTP server receiving push notifications in a daemon thread
+
+    The Calendar API delivers a notification as a POST request with an
+    empty body that describes the channel and the change in X-Goog-*
+    headers; any 2xx response acknowledges it. The receiver listens on a
+    local address, so reaching it from the API needs a public HTTPS URL
+    forwarding to it (a reverse proxy or tunnel).
+    """
+
+    def __init__(self, handler, host=PUSH_HOST, port=PUSH_PORT, path=PUSH_PATH):
+        """
+        Args:
+            handler: Function called with each notification's headers (a
+                dictionary with lowercase names), returning the HTTP status
+                to respond with
+            host: Interface to listen on
+            port: Port to listen on; 0 picks a free port
+            path: URL path notifications are posted to
+        """
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.path = path
+        self.server = None
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def url(self):
+        """Local URL of the receiver"""
+        return f'http://{self.host}:{self.port}{self.path}'
+
+    def start(self):
+        """Start listening; raises OSError if the port is taken"""
+        if self.running:
+            return
+        self.server = ThreadingHTTPServer((self.host, self.port), _NotificationHandler)
+        self.server.daemon_threads = True
+        self.server.receiver = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name='push-receiver', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop listening"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+            self.thread = None
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        receiver = self.server.receiver
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        if self.path.split('?', 1)[0] != receiver.path:
+            status = 404
+        else:
+            status = receiver.handler(
+                {name.lower(): value for name, value in self.headers.items()})
+
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # Notifications are counted by PushSync instead of logged
+        pass
+
+
+class PushSync:
+    """
+    Keeps calendars synced from push notifications instead of polling
+
+    An events().watch channel per calendar points at a WebhookReceiver. A
+    notification only says that something in a calendar changed, so each
+    one queues an incremental sync of that calendar alone on a worker
+    thread; notifications arriving while a sync is queued are coalesced
+    into it. The event store then reports the changed events to its
+    listeners (rollups, the metrics cache, incremental metrics), which
+    drop or update only the days those events touch.
+
+    While its channel is open a calendar is in client.watched_calendars,
+    which stretches polling by ensure_synced and PrefetchScheduler to
+    PUSH_FALLBACK_INTERVAL, so an idle calendar costs no API calls except
+    reopening its channel before it expires.
+    """
+
+    def __init__(self, client, calendar_ids, address=PUSH_ADDRESS, receiver=None,
+                 ttl=PUSH_CHANNEL_TTL, renew_margin=PUSH_RENEW_MARGIN,
+                 wait_for_auth=False, clock=time.time):
+        """
+        Args:
+            client: CalendarClient with an event store; use a client of its
+                own or one whose store is shared, as it syncs from the
+                worker thread
+            calendar_ids: Calendars to watch
+            address: Public HTTPS URL forwarding to the receiver (default:
+                the receiver's local URL, which only the fake service can
+                reach)
+            receiver: Running WebhookReceiver shared with other PushSyncs,
+                whose handler passes notifications on to
+                handle_notification (default: a receiver of its own on
+                PUSH_HOST and PUSH_PORT, started and stopped with this
+                object)
+            ttl: Requested channel lifetime in seconds
+            renew_margin: Reopen channels this many seconds before they expire
+            wait_for_auth: Do nothing until the client has been
+                authenticated elsewhere, so no login flow is started from
+                the worker thread
+            clock: Function returning the current epoch time
+        """
+        if client.event_store is None:
+            raise ValueError("PushSync requires a CalendarClient with an event store")
+
+        self.client = client
+        self.calendar_ids = list(calendar_ids)
+        self.owns_receiver = receiver is None
+        self.receiver = receiver or WebhookReceiver(self.handle_notification)
+        self.address = address
+        self.ttl = ttl
+        self.renew_margin = renew_margin
+        self.wait_for_auth = wait_for_auth
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        # Channel ID to channel dictionary; replaced channels stay here
+        # until stopped, so their late notifications are still accepted
+        self.channels = {}
+        self.pending = set()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.notifications = 0
+        self.rejected = 0
+        self.syncs = 0
+        self.changed_events = 0
+        self.last_error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """Start the receiver and the worker thread, which opens the channels"""
+        if self.running:
+            return
+        if self.owns_receiver:
+            self.receiver.start()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name='push-sync', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker thread, close the channels and stop its own receiver
+
+        Closed calendars go back to being polled.
+
+        Args:
+            timeout: Seconds to wait for the worker thread to exit
+                (default: no limit)
+        """
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+        with self.lock:
+            channels = list(self.channels.values())
+        for channel in channels:
+            self._close(channel)
+        if self.owns_receiver:
+            self.receiver.stop()
+
+    def set_calendars(self, calendar_ids):
+        """Change the watched calendars; channels follow on the worker thread"""
+        with self.lock:
+            if list(calendar_ids) == self.calendar_ids:
+                return
+            self.calendar_ids = list(calendar_ids)
+        self.wake.set()
+
+    def handle_notification(self, headers):
+        """
+        Handle a notification (the receiver's handler)
+
+        Args:
+            headers: Request headers with lowercase names
+
+        Returns:
+            HTTP status: 200 if accepted, 404 for an unknown channel and
+            403 for a wrong channel token
+        """
+        with self.lock:
+            channel = self.channels.get(headers.get('x-goog-channel-id'))
+            if channel is None:
+                self.rejected += 1
+                return 404
+            if not hmac.compare_digest(
+                    headers.get('x-goog-channel-token', ''), channel['token']):
+                self.rejected += 1
+                return 403
+
+            self.notifications += 1
+            if headers.get('x-goog-resource-state') in CHANGE_STATES:
+                self.pending.add(channel['calendar_id'])
+                self.wake.set()
+        perf.count('push_notifications')
+        return 200
+
+    def status(self):
+        """Get the open channels, counters and the last error, if any"""
+        with self.lock:
+            channels = {
+                channel['calendar_id']: time.strftime(
+                    '%Y-%m-%d %H:%M:%S', time.localtime(channel['expiration']))
+                for channel in self.channels.values()
+                if channel['expiration'] is not None
+            }
+            return {
+                'running': self.running,
+                'receiver': self.receiver.url,
+                'channels': channels,
+                'notifications': self.notifications,
+                'rejected': self.rejected,
+                'syncs': self.syncs,
+                'changed_events': self.changed_events,
+                'pending': sorted(self.pending),
+                'last_error': self.last_error
+            }
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            if self.wait_for_auth and not self.client.authenticated:
+                self.stop_event.wait(AUTH_POLL_INTERVAL)
+                continue
+
+            try:
+                self._sync_pending()
+                self._update_channels()
+                self.last_error = None
+            except Exception as e:
+                # Keep running; failed syncs stay pending and missing
+                # channels are retried
+                self.last_error = f"{type(e).__name__}: {e}"
+
+            timeout = self._next_renewal() - self.clock()
+            if self.last_error:
+                timeout = min(timeout, RETRY_INTERVAL)
+            self.wake.wait(max(timeout, 0))
+            self.wake.clear()
+
+    def _sync_pending(self):
+        """Sync every calendar with a notification since the last sync"""
+        with self.lock:
+            pending, self.pending = self.pending, set()
+
+        for calendar_id in sorted(pending):
+            if self.stop_event.is_set():
+                return
+            try:
+                with perf.stage('push_sync'):
+                    changed = self.client.sync(calendar_id)
+            except Exception:
+                with self.lock:
+                    self.pending.add(calendar_id)
+                raise
+            self.syncs += 1
+            self.changed_events += changed
+
+    def _update_channels(self):
+        """Open channels for new calendars, reopen expiring ones and close unwatched ones"""
+        now = self.clock()
+        with self.lock:
+            calendar_ids = list(self.calendar_ids)
+            current = {}
+            stale = []
+            # The latest channel of each watched calendar is kept
+            for channel in self.channels.values():
+                previous = current.get(channel['calendar_id'])
+                if channel['calendar_id'] not in calendar_ids:
+                    stale.append(channel)
+                elif previous is None or channel['expiration'] > previous['expiration']:
+                    current[channel['calendar_id']] = channel
+                    if previous is not None:
+                        stale.append(previous)
+                else:
+                    stale.append(channel)
+
+        for channel in stale:
+            self._close(channel)
+
+        for calendar_id in calendar_ids:
+            if self.stop_event.is_set():
+                return
+            channel = current.get(calendar_id)
+            if channel is None:
+                self._open(calendar_id)
+                # Changes made before the channel opened were not notified
+                with self.lock:
+                    self.pending.add(calendar_id)
+                self._sync_pending()
+            elif channel['expiration'] - self.renew_margin <= now:
+                # Channels cannot be extended; the old one is closed on the
+                # next pass, after the new one has been opened
+                self._open(calendar_id)
+                self.wake.set()
+
+    def _open(self, calendar_id):
+        """Open a channel for a calendar"""
+        channel = {
+            'id': str(uuid.uuid4()),
+            'calendar_id': calendar_id,
+            'token': secrets.token_urlsafe(32),
+            'resource_id': None,
+            'expiration': None
+        }
+        # Registered first, since the API confirms the channel with a
+        # 'sync' notification that may arrive before the response
+        with self.lock:
+            self.channels[channel['id']] = channel
+
+        try:
+            response = self.client.watch_events(
+                calendar_id, channel['id'], self.address or self.receiver.url,
+                channel['token'], self.ttl)
+        except Exception:
+            with self.lock:
+                del self.channels[channel['id']]
+            raise
+
+        with self.lock:
+            channel['resource_id'] = response['resourceId']
+            expiration = response.get('expiration')
+            channel['expiration'] = (
+                int(expiration) / 1000 if expiration else self.clock() + self.ttl)
+            self.client.watched_calendars.add(calendar_id)
+
+    def _close(self, channel):
+        """Close a channel, ignoring errors such as an already expired channel"""
+        with self.lock:
+            self.channels.pop(channel['id'], None)
+            if not any(other['calendar_id'] == channel['calendar_id']
+                       for other in self.channels.values()):
+                self.client.watched_calendars.discard(channel['calendar_id'])
+
+        if channel['resource_id'] is not None:
+            try:
+                self.client.stop_channel(channel['id'], channel['resource_id'])
+            except Exception:
+                pass
+
+    def _next_renewal(self):
+        """Epoch time at which the first channel is due to be reopened"""
+        with self.lock:
+            expirations = [channel['expiration'] for channel in self.channels.values()
+                           if channel['expiration'] is not None]
+        if not expirations:
+            return self.clock() + RETRY_INTERVAL
+        return min(expirations) - self.renew_margin
@@ -0,0 +1,289 @@
+"""
+Client-side rate limiting and retries for Google Calendar API requests
+"""
+
+import json
+import random
+import threading
+import time
+from googleapiclient.errors import HttpError
+from instrumentation import perf
+from config import (RATE_LIMIT_QPS, RATE_LIMIT_BURST, RATE_LIMIT_MAX_RETRIES,
+                    RATE_LIMIT_BACKOFF_BASE, RATE_LIMIT_BACKOFF_MAX)
+
+# Adaptive rate: never slow below this share of qps, and recover by this
+# share of qps per successful request
+RATE_LIMIT_MIN_FRACTION = 0.05
+RATE_LIMIT_INCREASE = 0.02
+
+# 403 reasons the Calendar API uses for quota errors
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+
+# Server errors worth retrying
+RETRYABLE_STATUSES = {500, 502, 503, 504}
+
+
+class RateLimitError(Exception):
+    """Raised when a request is still rate limited after all retries"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(error):
+    """Check whether an exception is a Calendar API quota error (403/429)"""
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    return error.resp.status == 403 and bool(_error_reasons(error) & RATE_LIMIT_REASONS)
+
+
+def is_retryable(error):
+    """Check whether a failed request should be retried"""
+    if is_rate_limit_error(error):
+        return True
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def retry_after(error):
+    """Get the Retry-After delay of an HTTP error in seconds, if any"""
+    if not isinstance(error, HttpError):
+        return None
+    try:
+        return max(0.0, float(error.resp.get('retry-after')))
+    except (TypeError, ValueError):
+        # Missing, or an HTTP date, which the Calendar API does not send
+        return None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Tokens refill continuously at rate per second up to burst. A caller that
+    finds the bucket empty sleeps until enough tokens have accumulated, so
+    sustained load is paced at exactly rate requests per second.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = burst
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, blocking until they are available
+
+        Args:
+            tokens: Number of tokens to take; requests larger than burst are
+                allowed and leave the bucket in debt
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+
+            # Reserve the tokens now and wait outside the lock, so callers
+            # queue up in order instead of all waking at the same time
+            delay = max(self.blocked_until - now, -self.tokens / self.rate, 0.0)
+
+        if delay > 0:
+            self.sleep(delay)
+            waited = delay
+        return waited
+
+    def set_rate(self, rate, drain=False):
+        """
+        Change the refill rate
+
+        Args:
+            rate: New tokens per second
+            drain: Also drop any saved up tokens, so the new rate applies
+                immediately instead of after the current burst
+        """
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = rate
+            if drain:
+                self.tokens = min(self.tokens, 0)
+
+    def pause(self, seconds):
+        """Make every caller wait at least seconds from now"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all API calls, with retries
+
+    Retryable failures (quota errors, 5xx and connection errors) are retried
+    with full-jitter exponential backoff. A Retry-After header takes
+    precedence and pauses every caller sharing the limiter, not just the one
+    that was throttled.
+
+    The rate adapts when the real quota is lower than qps: every quota error
+    halves it and every success raises it by a small step back towards qps,
+    so sustained bulk work settles just under the quota ceiling.
+    """
+
+    def __init__(self, qps=RATE_LIMIT_QPS, burst=RATE_LIMIT_BURST,
+                 max_retries=RATE_LIMIT_MAX_RETRIES,
+                 backoff_base=RATE_LIMIT_BACKOFF_BASE,
+                 backoff_max=RATE_LIMIT_BACKOFF_MAX,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.qps = qps
+        self.min_qps = qps * RATE_LIMIT_MIN_FRACTION
+        self.bucket = TokenBucket(qps, burst, clock, sleep)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'throttled': 0,
+            'throttle_wait_s': 0.0,
+            'retries': 0,
+            'rate_limited': 0,
+            'server_errors': 0,
+            'failures': 0
+        }
+
+    def acquire(self, cost=1):
+        """Wait for cost request tokens"""
+        waited = self.bucket.acquire(cost)
+        with self.lock:
+            self.counters['requests'] += cost
+            if waited:
+                self.counters['throttled'] += 1
+                self.counters['throttle_wait_s'] += waited
+        perf.count('rate_limit_wait_s', waited)
+
+    def call(self, function, cost=1):
+        """
+        Call function under the rate limit, retrying retryable failures
+
+        Args:
+            function: Callable performing one API request
+            cost: Number of API calls the request counts as against quota
+                (e.g. the size of a batch request)
+
+        Returns:
+            The function's return value
+
+        Raises:
+            RateLimitError: If the request is still rate limited after
+                max_retries retries
+        """
+        attempt = 0
+        while True:
+            self.acquire(cost)
+            try:
+                result = function()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self.record_error(e)
+                if attempt >= self.max_retries:
+                    self.fail(e)
+                attempt += 1
+                self.backoff(attempt, e)
+            else:
+                self.record_success()
+                return result
+
+    def record_success(self):
+        """Raise an adapted rate one step back towards qps"""
+        rate = self.bucket.rate
+        if rate < self.qps:
+            self.bucket.set_rate(min(self.qps, rate + self.qps * RATE_LIMIT_INCREASE))
+
+    def record_error(self, error, adapt=True):
+        """
+        Count a retryable error
+
+        Args:
+            error: The retryable exception
+            adapt: Halve the rate if it is a quota error; callers that see
+                several errors from one round trip (a batch) pass False and
+                call slow_down() once
+        """
+        with self.lock:
+            if is_rate_limit_error(error):
+                self.counters['rate_limited'] += 1
+            elif isinstance(error, HttpError):
+                self.counters['server_errors'] += 1
+
+        if adapt and is_rate_limit_error(error):
+            self.slow_down()
+
+    def slow_down(self):
+        """Halve the rate and drop saved up tokens after a quota error"""
+        self.bucket.set_rate(max(self.min_qps, self.bucket.rate / 2), drain=True)
+
+    def backoff(self, attempt, error=None):
+        """
+        Sleep before retry number attempt
+
+        Args:
+            attempt: 1 for the first retry, 2 for the second, ...
+            error: The error being retried; its Retry-After is honored
+        """
+        delay = retry_after(error)
+        if delay is not None:
+            self.bucket.pause(delay)
+        else:
+            delay = random.uniform(
+                0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+        with self.lock:
+            self.counters['retries'] += 1
+        perf.count('api_retries')
+        self.sleep(delay)
+
+    def fail(self, error):
+        """Give up on a request, raising RateLimitError for quota errors"""
+        with self.lock:
+            self.counters['failures'] += 1
+        if is_rate_limit_error(error):
+            raise RateLimitError(
+                "Google Calendar API rate limit exceeded after "
+                f"{self.max_retries} retries",
+                retry_after(error)
+            ) from error
+        raise error
+
+    def stats(self):
+        """Get a copy of the counters and the current adapted rate"""
+        with self.lock:
+            return dict(self.counters, current_qps=self.bucket.rate)
+
+
+def _error_reasons(error):
+    """Reasons listed in an HTTP error's JSON body"""
+    try:
+        data = json.loads(error.content.decode('utf-8'))
+        return {item.get('reason') for item in data['error'].get('errors', [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+
+# Process-wide limiter shared by every CalendarClient
+rate_limiter = RateLimiter()
@@ -0,0 +1,173 @@
+"""
+Persistent daily metrics rollups
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+import pytz
+from config import TIMEZONE
+
+
+class RollupStore:
+    """
+    Stored daily metrics keyed by (date, category)
+
+    Rollups live in the event store's SQLite database and are invalidated
+    through its change notifications, so only days touched by changed
+    events are recomputed. Every rollup records the scope (set of
+    calendars) and the category config version it was computed with; rows
+    from another config version are treated as missing. Week, month and
+    range totals are sums over the stored days returned by get_days.
+    """
+
+    def __init__(self, event_store):
+        self.local_tz = pytz.timezone(TIMEZONE)
+        self.conn = event_store.conn
+        self.lock = event_store.lock
+
+        with self.lock, self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS daily_rollups (
+                    scope TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    hours REAL NOT NULL,
+                    PRIMARY KEY (scope, date, category)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS daily_summaries (
+                    scope TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    config_version TEXT NOT NULL,
+                    deep_work_hours REAL NOT NULL,
+                    first_ts REAL,
+                    last_ts REAL,
+                    PRIMARY KEY (scope, date)
+                )
+            ''')
+
+        event_store.subscribe(self.invalidate)
+
+    def get_days(self, scope, config_version, days):
+        """
+        Load stored daily metrics
+
+        Args:
+            scope: Scope key of the tracked calendars
+            config_version: Current category config version
+            days: List of datetime objects
+
+        Returns:
+            Dictionary mapping each stored day's index in days to its
+            daily metrics dictionary; missing or stale days are left out
+        """
+        keys = {day.strftime('%Y-%m-%d'): i for i, day in enumerate(days)}
+        if not keys:
+            return {}
+
+        start_key, end_key = min(keys), max(keys)
+        with self.lock:
+            summaries = self.conn.execute('''
+                SELECT date, deep_work_hours, first_ts, last_ts
+                FROM daily_summaries
+                WHERE scope = ? AND config_version = ? AND date BETWEEN ? AND ?
+            ''', (scope, config_version, start_key, end_key)).fetchall()
+            rows = self.conn.execute('''
+                SELECT date, category, hours FROM daily_rollups
+                WHERE scope = ? AND date BETWEEN ? AND ?
+                ORDER BY date, position
+            ''', (scope, start_key, end_key)).fetchall()
+
+        category_hours = defaultdict(dict)
+        for date_key, category, hours in rows:
+            category_hours[date_key][category] = hours
+
+        result = {}
+        for date_key, deep_work_hours, first_ts, last_ts in summaries:
+            if date_key not in keys:
+                continue
+
+            hours = category_hours.get(date_key, {})
+            result[keys[date_key]] = {
+                'date': days[keys[date_key]],
+                'category_hours': hours,
+                'deep_work_hours': deep_work_hours,
+                'total_hours': sum(hours.values()),
+                'first_event_time': self._from_ts(first_ts),
+                'last_event_time': self._from_ts(last_ts)
+            }
+
+        return result
+
+    def put_days(self, scope, config_version, daily_metrics):
+        """
+        Store daily metrics, replacing existing rollups for those days
+
+        Args:
+            scope: Scope key of the tracked calendars
+            config_version: Category config version the metrics were computed with
+            daily_metrics: List of daily metrics dictionaries
+        """
+        with self.lock, self.conn:
+            for day_metrics in daily_metrics:
+                date_key = day_metrics['date'].strftime('%Y-%m-%d')
+
+                self.conn.execute(
+                    'DELETE FROM daily_rollups WHERE scope = ? AND date = ?',
+                    (scope, date_key))
+                self.conn.executemany('''
+                    INSERT INTO daily_rollups (scope, date, category, position, hours)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    (scope, date_key, category, position, hours)
+                    for position, (category, hours)
+                    in enumerate(day_metrics['category_hours'].items())
+                ])
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO daily_summaries
+                    (scope, date, config_version, deep_work_hours, first_ts, last_ts)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    scope, date_key, config_version,
+                    day_metrics['deep_work_hours'],
+                    self._to_ts(day_metrics['first_event_time']),
+                    self._to_ts(day_metrics['last_event_time'])
+                ))
+
+    def invalidate(self, calendar_id, intervals):
+        """
+        Drop rollups of every local day touched by changed events
+
+        Registered as an event store listener. Rollups of all scopes are
+        dropped for those days, since any scope may include the calendar.
+
+        Args:
+            calendar_id: Calendar the changes belong to
+            intervals: List of (start_ts, end_ts) epoch second tuples
+        """
+        date_keys = set()
+        for start_ts, end_ts in intervals:
+            day = datetime.fromtimestamp(start_ts, self.local_tz).date()
+            last_day = datetime.fromtimestamp(end_ts, self.local_tz).date()
+            while day <= last_day:
+                date_keys.add(day.strftime('%Y-%m-%d'))
+                day += timedelta(days=1)
+
+        self.invalidate_dates(date_keys)
+
+    def invalidate_dates(self, date_keys):
+        """Drop rollups for the given 'YYYY-MM-DD' dates"""
+        params = [(date_key,) for date_key in date_keys]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'DELETE FROM daily_rollups WHERE date = ?', params)
+            self.conn.executemany(
+                'DELETE FROM daily_summaries WHERE date = ?', params)
+
+    def _to_ts(self, value):
+        return value.timestamp() if value is not None else None
+
+    def _from_ts(self, ts):
+        return datetime.fromtimestamp(ts, pytz.utc) if ts is not None else None
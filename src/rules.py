@@ -0,0 +1,242 @@
+"""
+Rule-based event categorization
+"""
+
+import re
+import warnings
+from config import CATEGORY_RULES, CALENDAR_CATEGORIES, COLOR_CATEGORIES
+
+# Maximum memoized (calendar, color, summary) results before the memo is reset
+RULE_CACHE_SIZE = 100000
+
+# Words of a summary or keyword, for keyword matching
+WORD_PATTERN = re.compile(r'\w+')
+
+RULE_KEYS = {'category', 'keywords', 'pattern', 'calendar', 'color'}
+
+# Condition value of a rule without a 'calendar' or 'color' key; None is a
+# real condition ('color': None matches events without a color)
+ANY = object()
+
+# Numbered backreferences and conditional groups, whose group numbers
+# change when a pattern is embedded in the combined alternation
+NUMBERED_GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?\(')
+
+
+def _words(text):
+    """Lowercase words of a text"""
+    return tuple(WORD_PATTERN.findall(text.lower()))
+
+
+class RuleSet:
+    """
+    Categorizes events by calendar, color and summary
+
+    CATEGORY_RULES are checked in order and the first match wins; events
+    no rule matches fall back to CALENDAR_CATEGORIES and then to
+    COLOR_CATEGORIES, as before rules existed.
+
+    The rules are compiled once. For every (calendar, color) pair seen, the
+    rules applying to it are selected once and combined into a word trie
+    for the keywords and a single alternation regex for the patterns, so
+    categorizing a summary is one pass over its words plus one regex
+    search, however many rules there are (patterns that cannot be
+    combined, see _combinable, are searched on their own). Results are
+    memoized per (calendar, color, summary), as recurring events repeat
+    summaries.
+    """
+
+    def __init__(self, rules=CATEGORY_RULES, calendar_categories=CALENDAR_CATEGORIES,
+                 color_categories=COLOR_CATEGORIES):
+        """
+        Args:
+            rules: List of rule dictionaries (see CATEGORY_RULES in config.py)
+            calendar_categories: (calendar ID, color ID) to category mapping
+            color_categories: Color ID to category mapping
+        """
+        self.rules = [_compile_rule(i, rule) for i, rule in enumerate(rules)]
+        self.calendar_categories = calendar_categories
+        self.color_categories = color_categories
+        self.uses_summary = any(rule.words or rule.pattern for rule in self.rules)
+        self._matchers = {}
+        self._memo = {}
+
+    def categorize(self, calendar_id, color_id, summary=None):
+        """
+        Get the category of an event
+
+        Args:
+            calendar_id: ID of the event's calendar
+            color_id: Color ID of the event, or None
+            summary: Title of the event; ignored unless rules use it
+
+        Returns:
+            Category name or 'Uncategorized'
+        """
+        key = (calendar_id, color_id, summary if self.uses_summary else None)
+        category = self._memo.get(key)
+        if category is None:
+            matcher = self._matchers.get(key[:2])
+            if matcher is None:
+                matcher = self._matchers[key[:2]] = _PairMatcher(
+                    [rule for rule in self.rules if rule.applies_to(calendar_id, color_id)],
+                    self._fallback(calendar_id, color_id))
+
+            if len(self._memo) >= RULE_CACHE_SIZE:
+                self._memo.clear()
+            category = self._memo[key] = matcher.match(summary or '')
+        return category
+
+    def _fallback(self, calendar_id, color_id):
+        """Category of a (calendar, color) pair when no rule matches"""
+        if self.calendar_categories:
+            for key in ((calendar_id, color_id), (calendar_id, '*')):
+                if key in self.calendar_categories:
+                    return self.calendar_categories[key]
+
+        if color_id in self.color_categories:
+            return self.color_categories[color_id]
+
+        return 'Uncategorized'
+
+
+class _Rule:
+    """A validated rule with its keywords split into words and its pattern compiled"""
+
+    def __init__(self, index, category, words, pattern, calendar, color):
+        self.index = index
+        self.category = category
+        self.words = words
+        self.pattern = pattern
+        self.calendar = calendar
+        self.color = color
+
+    def applies_to(self, calendar_id, color_id):
+        """Check the rule's calendar and color conditions"""
+        return ((self.calendar is ANY or self.calendar == calendar_id)
+                and (self.color is ANY or self.color == color_id))
+
+
+def _compile_rule(index, rule):
+    """Validate a rule dictionary and convert it to a _Rule"""
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown keys in category rule {index}: {', '.join(sorted(unknown))}")
+    if 'category' not in rule:
+        raise ValueError(f"Category rule {index} has no category")
+    if 'keywords' in rule and 'pattern' in rule:
+        raise ValueError(f"Category rule {index} has both keywords and a pattern")
+
+    words = [_words(keyword) for keyword in rule.get('keywords', [])]
+    if any(not keyword for keyword in words):
+        raise ValueError(f"Category rule {index} has a keyword without words")
+
+    pattern = rule.get('pattern')
+    if pattern is not None:
+        try:
+            pattern = re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern in category rule {index}: {e}") from e
+
+    return _Rule(index, rule['category'], words, pattern,
+                 rule.get('calendar', ANY), rule.get('color', ANY))
+
+
+def _combinable(pattern):
+    """
+    Check whether a compiled pattern can join a combined alternation
+
+    Patterns with named groups (which could clash with the rule groups),
+    numbered group references or inline global flags such as (?i) only
+    keep their meaning on their own, so they are searched separately.
+    """
+    if pattern.groupindex or NUMBERED_GROUP_REFERENCE.search(pattern.pattern):
+        return False
+    with warnings.catch_warnings():
+        # Before Python 3.11 misplaced global flags only warn, but apply to
+        # the whole combined expression
+        warnings.simplefilter('error')
+        try:
+            re.compile(f'(?:{pattern.pattern})', re.IGNORECASE)
+        except (re.error, Warning):
+            return False
+    return True
+
+
+class _PairMatcher:
+    """Combined matcher of the rules applying to one (calendar, color) pair"""
+
+    def __init__(self, rules, fallback):
+        # A rule without summary conditions always matches, so later rules
+        # can never win
+        self.default = (float('inf'), fallback)
+        for rule in rules:
+            if not rule.words and not rule.pattern:
+                self.default = (rule.index, rule.category)
+                rules = [r for r in rules if r.index < rule.index]
+                break
+
+        # Trie over keyword words; a node's None entry holds the lowest
+        # index of the rules having a keyword that ends there
+        self.trie = {}
+        self.categories = {}
+        for rule in rules:
+            self.categories[rule.index] = rule.category
+            for keyword in rule.words:
+                node = self.trie
+                for word in keyword:
+                    node = node.setdefault(word, {})
+                node[None] = min(node.get(None, rule.index), rule.index)
+
+        # One alternation of the patterns that can be combined; the group
+        # that matched names the rule. The others are searched one by one.
+        self.patterns = [rule for rule in rules if rule.pattern]
+        combined = [rule for rule in self.patterns if _combinable(rule.pattern)]
+        self.combined = None
+        if combined:
+            try:
+                self.combined = re.compile('|'.join(
+                    f'(?P<r{rule.index}>{rule.pattern.pattern})' for rule in combined),
+                    re.IGNORECASE)
+            except re.error:
+                combined = []
+        self.separate = {rule.index for rule in self.patterns} - {
+            rule.index for rule in combined}
+
+    def match(self, summary):
+        """Category of the first rule matching a summary, or the fallback"""
+        best = self.default[0]
+
+        if self.trie:
+            words = _words(summary)
+            for start in range(len(words)):
+                node = self.trie
+                for word in words[start:]:
+                    node = node.get(word)
+                    if node is None:
+                        break
+                    index = node.get(None)
+                    if index is not None and index < best:
+                        best = index
+
+        if self.patterns and self.patterns[0].index < best:
+            found = None
+            if self.combined is not None:
+                found = self.combined.search(summary)
+                if found is not None:
+                    best = min(best, int(found.lastgroup[1:]))
+
+            # A match of one pattern can hide overlapping matches of
+            # others, so after a combined match every earlier pattern is
+            # checked; otherwise only the separate ones can still match
+            for rule in self.patterns:
+                if rule.index >= best:
+                    break
+                if ((found is not None or rule.index in self.separate)
+                        and rule.pattern.search(summary)):
+                    best = rule.index
+                    break
+
+        if best == self.default[0]:
+            return self.default[1]
+        return self.categories[best]
@@ -0,0 +1,180 @@
+"""
+Background sync and prefetch of recently viewed periods
+"""
+
+import threading
+import time
+from calendar import monthrange
+from datetime import datetime, timedelta
+from instrumentation import perf
+from config import PREFETCH_INTERVAL, PREFETCH_WINDOWS
+
+# Seconds between checks while waiting for authentication
+AUTH_POLL_INTERVAL = 5
+
+
+def prefetch_windows(today, names=PREFETCH_WINDOWS):
+    """
+    Date windows to keep warm
+
+    Args:
+        today: datetime or date of the current day
+        names: Window names out of 'today', 'this_week', 'this_month',
+            'previous_week' and 'previous_month'
+
+    Returns:
+        List of (name, days) tuples, days being consecutive datetime objects
+    """
+    today = datetime.combine(today, datetime.min.time())
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    previous_month_start = (month_start - timedelta(days=1)).replace(day=1)
+
+    ranges = {
+        'today': (today, 1),
+        'this_week': (week_start, 7),
+        'this_month': (month_start, monthrange(today.year, today.month)[1]),
+        'previous_week': (week_start - timedelta(days=7), 7),
+        'previous_month': (
+            previous_month_start,
+            monthrange(previous_month_start.year, previous_month_start.month)[1]
+        ),
+    }
+
+    windows = []
+    for name in names:
+        if name not in ranges:
+            raise ValueError(f"Unknown prefetch window: {name}")
+        start, num_days = ranges[name]
+        windows.append((name, [start + timedelta(days=i) for i in range(num_days)]))
+    return windows
+
+
+class PrefetchScheduler:
+    """
+    Periodically syncs the event store and warms rollups in a daemon thread
+
+    Each run syncs every tracked calendar (except those kept current by
+    push notifications) and computes the daily metrics of
+    the configured windows through the tracker's rollups, so the common
+    views are answered from stored rollups without waiting on the API.
+    """
+
+    def __init__(self, tracker, interval=PREFETCH_INTERVAL, windows=PREFETCH_WINDOWS,
+                 wait_for_auth=False, clock=datetime.now):
+        """
+        Args:
+            tracker: TimeTracker with rollups; use a tracker of its own, as
+                it is used from the scheduler thread
+            interval: Seconds between runs
+            windows: Names of the windows to prefetch (see prefetch_windows)
+            wait_for_auth: Skip runs until the tracker's client has been
+                authenticated elsewhere, so no login flow is started from
+                the background thread
+            clock: Function returning the current datetime
+        """
+        if tracker.rollups is None:
+            raise ValueError("PrefetchScheduler requires a TimeTracker with rollups")
+
+        self.tracker = tracker
+        self.interval = interval
+        self.windows = windows
+        self.wait_for_auth = wait_for_auth
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.runs = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """Start the scheduler thread; the first run starts immediately"""
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self._loop, name='prefetch-scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the scheduler thread
+
+        A run in progress finishes its current calendar or window first.
+
+        Args:
+            timeout: Seconds to wait for the thread to exit (default: no limit)
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def run_once(self):
+        """
+        Sync the tracked calendars and warm the configured windows
+
+        Returns:
+            Number of changed events applied by the sync, or None if the
+            run was skipped or stopped
+        """
+        client = self.tracker.client
+        if self.wait_for_auth and not client.authenticated:
+            return None
+
+        started = time.perf_counter()
+        changed = 0
+        with perf.stage('prefetch'):
+            for calendar_id in list(self.tracker.calendar_ids):
+                if self.stop_event.is_set():
+                    return None
+                # Calendars with push channels only need the fallback sync
+                if client.sync_due(calendar_id, 0):
+                    changed += client.sync(calendar_id)
+
+            for _, days in prefetch_windows(self.clock(), self.windows):
+                if self.stop_event.is_set():
+                    return None
+                self.tracker.calculate_days_metrics(days)
+
+        self.runs += 1
+        self.last_run = self.clock()
+        self.last_duration = time.perf_counter() - started
+        return changed
+
+    def status(self):
+        """Get run counters and the last error, if any"""
+        return {
+            'running': self.running,
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'last_duration_s': self.last_duration,
+            'last_error': self.last_error
+        }
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            if self.wait_for_auth and not self.tracker.client.authenticated:
+                self.stop_event.wait(min(self.interval, AUTH_POLL_INTERVAL))
+                continue
+
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                # Keep running; the next run retries
+                self.last_error = f"{type(e).__name__}: {e}"
+            self.stop_event.wait(self.interval)
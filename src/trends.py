@@ -0,0 +1,203 @@
+"""
+Rolling windows, period comparisons and streaks over daily aggregates
+"""
+
+from datetime import datetime, timedelta
+from itertools import accumulate
+from config import STREAK_MIN_DEEP_WORK_HOURS, TREND_COMPARISON_PERIODS, TREND_WINDOWS
+
+# Series names of the daily totals; the other series are categories
+DEEP_WORK = 'Deep Work'
+TOTAL = 'Total Hours'
+
+
+def history_days(shown_days, windows=TREND_WINDOWS, periods=TREND_COMPARISON_PERIODS):
+    """
+    Number of days to load so every shown day has full windows and baselines
+
+    Args:
+        shown_days: Days shown in rolling charts
+        windows: Rolling window lengths in days
+        periods: Comparison periods before the current one
+
+    Returns:
+        Number of days
+    """
+    longest = max(windows)
+    return max(shown_days + longest - 1, (periods + 1) * longest)
+
+
+def load_series(tracker, end_date, days):
+    """
+    Load a DailySeries of the days up to end_date
+
+    With rollups, stored daily aggregates are reused and only missing days
+    are computed.
+
+    Args:
+        tracker: TimeTracker
+        end_date: Last day of the series
+        days: Number of days
+
+    Returns:
+        DailySeries
+    """
+    end_date = datetime.combine(end_date, datetime.min.time())
+    return DailySeries(tracker.calculate_days_metrics(
+        [end_date - timedelta(days=days - 1 - i) for i in range(days)]))
+
+
+class DailySeries:
+    """
+    Daily totals of consecutive days with prefix sums
+
+    Built once from daily metrics; the sum of any window of days is then
+    the difference of two prefix sums, so rolling averages, comparisons
+    with earlier periods and window totals cost O(1) per point however
+    long the window is. Besides DEEP_WORK and TOTAL there is a series per
+    category, with 0 on days without it.
+    """
+
+    def __init__(self, daily_metrics):
+        """
+        Args:
+            daily_metrics: List of daily metrics dictionaries of consecutive
+                days (see TimeTracker.calculate_days_metrics)
+        """
+        self.dates = [day['date'] for day in daily_metrics]
+        self.categories = sorted({
+            category for day in daily_metrics for category in day['category_hours']})
+
+        self.values = {
+            DEEP_WORK: [day['deep_work_hours'] for day in daily_metrics],
+            TOTAL: [day['total_hours'] for day in daily_metrics]
+        }
+        for category in self.categories:
+            self.values[category] = [
+                day['category_hours'].get(category, 0.0) for day in daily_metrics]
+
+        # prefix[name][i] is the sum of the first i days
+        self.prefix = {
+            name: list(accumulate(values, initial=0.0))
+            for name, values in self.values.items()
+        }
+
+    def __len__(self):
+        return len(self.dates)
+
+    def index(self, date):
+        """Position of a day in the series; raises ValueError if outside it"""
+        i = (datetime.combine(date, datetime.min.time())
+             - datetime.combine(self.dates[0], datetime.min.time())).days
+        if not 0 <= i < len(self.dates):
+            raise ValueError(f"{date:%Y-%m-%d} is outside the series")
+        return i
+
+    def window_sum(self, name, end, days):
+        """
+        Sum of a series over the days days ending at index end (inclusive)
+
+        Returns:
+            Hours, or None if the window starts before the series
+        """
+        start = end - days + 1
+        if start < 0 or end >= len(self.dates):
+            return None
+        prefix = self.prefix.get(name)
+        if prefix is None:
+            return 0.0
+        return prefix[end + 1] - prefix[start]
+
+    def rolling_mean(self, name, days):
+        """
+        Mean hours per day over the days days ending at each day
+
+        Returns:
+            List with one value per day; None where the window would start
+            before the series
+        """
+        return [
+            None if total is None else total / days
+            for total in (self.window_sum(name, end, days) for end in range(len(self.dates)))
+        ]
+
+    def compare(self, name, end, days, periods=TREND_COMPARISON_PERIODS, step=None):
+        """
+        Compare a window with the same window in earlier periods
+
+        For example days=3, step=7 on a Wednesday compares this Monday to
+        Wednesday with Monday to Wednesday of each of the previous weeks.
+
+        Args:
+            name: Series name
+            end: Index of the window's last day
+            days: Window length in days
+            periods: Number of earlier windows forming the baseline
+            step: Days between windows (default: days, i.e. back to back)
+
+        Returns:
+            Dictionary with the current window's hours, the earlier
+            windows' hours (most recent first; only those inside the
+            series), their mean as the baseline, and the change from the
+            baseline in hours and percent (None without a baseline)
+        """
+        step = step or days
+        current = self.window_sum(name, end, days)
+        previous = []
+        for period in range(1, periods + 1):
+            total = self.window_sum(name, end - period * step, days)
+            if total is None:
+                break
+            previous.append(total)
+
+        baseline = sum(previous) / len(previous) if previous else None
+        change = None if baseline is None or current is None else current - baseline
+        return {
+            'current': current,
+            'previous': previous,
+            'baseline': baseline,
+            'change': change,
+            'change_pct': change / baseline * 100 if change is not None and baseline else None
+        }
+
+    def streaks(self, name=DEEP_WORK, threshold=STREAK_MIN_DEEP_WORK_HOURS, last_day_open=False):
+        """
+        Runs of consecutive days with at least threshold hours
+
+        Args:
+            name: Series name
+            threshold: Hours a day needs to extend a streak
+            last_day_open: The last day is still in progress, so if it has
+                not reached the threshold yet the current streak ends the
+                day before instead of being broken
+
+        Returns:
+            Dictionary with the current streak's length and first day, the
+            longest streak's length, first and last day (None if there is
+            no streak), and a list with the length of the streak ending at
+            each day (0 on days below the threshold)
+        """
+        lengths = []
+        run = 0
+        longest, longest_end = 0, None
+        for i, hours in enumerate(self.values.get(name, [0.0] * len(self.dates))):
+            run = run + 1 if hours >= threshold else 0
+            lengths.append(run)
+            if run > longest:
+                longest, longest_end = run, i
+
+        current = lengths[-1] if lengths else 0
+        if not current and last_day_open and len(lengths) > 1:
+            current = lengths[-2]
+            current_end = len(lengths) - 2
+        else:
+            current_end = len(lengths) - 1
+
+        return {
+            'current': current,
+            'current_start': self.dates[current_end - current + 1] if current else None,
+            'longest': longest,
+            'longest_start': self.dates[longest_end - longest + 1] if longest else None,
+            'longest_end': self.dates[longest_end] if longest else None,
+            'lengths': lengths
+        }
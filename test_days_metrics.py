@@ -0,0 +1,154 @@
+"""
+Offline test that range metrics match the per-day path
+Compares TimeTracker.calculate_days_metrics with calculate_daily_metrics
+day by day over synthetic calendars, around a DST transition
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+import pytz
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from calendar_client import CalendarClient
+from config import TIMEZONE
+from fake_calendar import FakeCalendarService, generate_calendar
+from metrics import TimeTracker
+
+CALENDARS = ['primary', 'work']
+DAYS_BEFORE = 5
+DAYS_AFTER = 5
+
+
+def check(condition, message):
+    """Print a check result and fail the test if it does not hold"""
+    print(f"   {'✓' if condition else '✗'} {message}")
+    if not condition:
+        raise AssertionError(message)
+
+
+def dst_transition_day(local_tz, year=2026):
+    """First day of a year that is not 24 hours long locally, or None without DST"""
+    day = datetime(year, 1, 1)
+    while day.year == year:
+        start = local_tz.localize(day)
+        end = local_tz.localize(day + timedelta(days=1))
+        if end.timestamp() - start.timestamp() != 24 * 3600:
+            return day
+        day += timedelta(days=1)
+    return None
+
+
+def edge_events(local_tz, transition):
+    """Events around the transition day that the day split must handle"""
+    def timed(event_id, start, hours):
+        start = local_tz.localize(start)
+        end = local_tz.normalize(start + timedelta(hours=hours))
+        return {
+            'id': event_id,
+            'status': 'confirmed',
+            'summary': event_id,
+            'colorId': '10',
+            'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': end.isoformat()}
+        }
+
+    return [
+        # All-day event covering the day before, the transition day and the day after
+        {
+            'id': 'all-day-multi',
+            'status': 'confirmed',
+            'summary': 'Conference',
+            'colorId': '5',
+            'start': {'date': (transition - timedelta(days=1)).strftime('%Y-%m-%d')},
+            'end': {'date': (transition + timedelta(days=2)).strftime('%Y-%m-%d')}
+        },
+        # Crosses local midnight into the transition day
+        timed('across-midnight', transition - timedelta(hours=2), 4),
+        # Spans the clock change itself
+        timed('across-dst', transition + timedelta(minutes=30), 3),
+        # Crosses the following midnight
+        timed('across-next-midnight', transition + timedelta(hours=23), 2)
+    ]
+
+
+def run():
+    local_tz = pytz.timezone(TIMEZONE)
+    transition = dst_transition_day(local_tz) or datetime(2026, 3, 8)
+    first_day = transition - timedelta(days=DAYS_BEFORE)
+    days = [first_day + timedelta(days=i) for i in range(DAYS_BEFORE + DAYS_AFTER + 1)]
+
+    primary = generate_calendar(
+        days=len(days), start_date=first_day, seed=1,
+        timezones=['UTC', TIMEZONE, 'Asia/Kolkata'])
+    work = generate_calendar(days=len(days), start_date=first_day, seed=2, id_prefix='w')
+    service = FakeCalendarService({
+        'primary': primary + edge_events(local_tz, transition),
+        'work': work
+    })
+    plain_service = FakeCalendarService({'primary': primary, 'work': work})
+
+    print(f"1. Building the window around {transition:%Y-%m-%d}...")
+    day_lengths = {
+        (local_tz.localize(day + timedelta(days=1)).timestamp()
+         - local_tz.localize(day).timestamp()) / 3600
+        for day in days
+    }
+    if dst_transition_day(local_tz):
+        check(day_lengths != {24.0}, f"the window has a DST transition day ({TIMEZONE})")
+    else:
+        print(f"   ℹ {TIMEZONE} has no DST; checking the edge events only")
+
+    for engine in ['python', 'pandas']:
+        print(f"2. Comparing per-day and range results ({engine} engine)...")
+        tracker = TimeTracker(CalendarClient(service=service), CALENDARS, engine=engine)
+        by_range = tracker.calculate_days_metrics(days)
+        by_day = [tracker.calculate_daily_metrics(day) for day in days]
+
+        check(len(by_range) == len(days), f"{len(days)} days returned")
+        mismatched = [
+            f"{day:%Y-%m-%d}" for day, ranged, single in zip(days, by_range, by_day)
+            if ranged != single
+        ]
+        check(not mismatched, "every day is identical"
+              + (f" (differs: {', '.join(mismatched)})" if mismatched else ""))
+
+        # The edge events must change the days they touch, or the
+        # comparison would not cover them
+        without = TimeTracker(
+            CalendarClient(service=plain_service), CALENDARS, engine=engine
+        ).calculate_days_metrics(days)
+        touched = [
+            f"{day:%Y-%m-%d}" for day, ranged, plain in zip(days, by_range, without)
+            if ranged != plain
+        ]
+        expected = [f"{day:%Y-%m-%d}" for day in days[DAYS_BEFORE - 1:DAYS_BEFORE + 2]]
+        check(touched == expected,
+              "the multi-day all-day and cross-midnight events count on "
+              f"{', '.join(expected)}")
+
+
+def test_days_metrics_match_daily():
+    run()
+
+
+def main():
+    print("=" * 60)
+    print("Calendar Time Tracker - Range Metrics Test")
+    print("=" * 60)
+    print()
+
+    try:
+        test_days_metrics_match_daily()
+    except AssertionError:
+        return False
+
+    print()
+    print("✓ Range metrics match the per-day path")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
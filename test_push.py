@@ -0,0 +1,157 @@
+"""
+Offline test of push-notification sync
+Runs FakeCalendarService -> PushSync -> EventStore -> MetricsCache end to end
+without credentials or network access
+"""
+
+import sys
+import os
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+import pytz
+
+# Add src directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from cache import MetricsCache
+from calendar_client import CalendarClient
+from config import TIMEZONE
+from event_store import EventStore
+from fake_calendar import FakeCalendarService, generate_calendar
+from metrics import TimeTracker
+from push import PushSync, WebhookReceiver
+
+CALENDARS = ['primary', 'work']
+DAYS = 14
+
+
+def wait_until(condition, timeout=10):
+    """Poll condition until it is true or timeout seconds have passed"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def check(condition, message):
+    """Print a check result and fail the test if it does not hold"""
+    print(f"   {'✓' if condition else '✗'} {message}")
+    if not condition:
+        raise AssertionError(message)
+
+
+def post(url, headers):
+    """POST an empty notification and return the HTTP status"""
+    request = urllib.request.Request(url, data=b'', headers=headers, method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def run(path):
+    local_tz = pytz.timezone(TIMEZONE)
+    first_day = datetime.combine(datetime.now(), datetime.min.time()) - timedelta(days=DAYS // 2)
+    days = [first_day + timedelta(days=i) for i in range(DAYS)]
+    changed_day = days[DAYS // 2]
+
+    service = FakeCalendarService({
+        'primary': generate_calendar(days=DAYS, start_date=first_day, seed=1),
+        'work': generate_calendar(days=DAYS, start_date=first_day, seed=2, id_prefix='w')
+    })
+    store = EventStore(path)
+    client = CalendarClient(event_store=store, service=service)
+    tracker = TimeTracker(client, CALENDARS)
+    cache = MetricsCache()
+    store.subscribe(cache.invalidate_events)
+
+    print("1. Caching daily metrics...")
+    for day in days:
+        cache.put(('Daily', day), tracker.calculate_daily_metrics(day), 3600, day, day)
+    check(cache.stats()['size'] == DAYS, f"{DAYS} days cached")
+
+    print("2. Opening push channels...")
+    receiver = WebhookReceiver(lambda headers: push.handle_notification(headers), port=0)
+    push = PushSync(client, CALENDARS, receiver=receiver)
+    receiver.start()
+    push.start()
+    try:
+        check(wait_until(lambda: client.watched_calendars == set(CALENDARS) and not push.pending),
+              "a channel is open for every calendar")
+        requests = service.request_count
+        for calendar_id in CALENDARS:
+            client.ensure_synced(calendar_id, 0)
+        check(service.request_count == requests, "watched calendars are not polled")
+
+        print("3. Changing an event...")
+        syncs = push.syncs
+        start = local_tz.localize(changed_day + timedelta(hours=21))
+        service.add_event('work', {
+            'id': 'pushed',
+            'status': 'confirmed',
+            'summary': 'Pushed change',
+            'colorId': '10',
+            'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': (start + timedelta(hours=1)).isoformat()}
+        })
+        check(wait_until(lambda: push.syncs > syncs and not push.pending),
+              "the notification triggered a sync")
+        check(push.changed_events >= 1, "the sync applied the changed event")
+        check(any(event['id'] == 'pushed' for event in store.get_events(
+            'work', start.timestamp(), start.timestamp() + 3600)), "the event store has the event")
+
+        cached_days = {key[1] for key in cache.entries}
+        check([day for day in days if day not in cached_days] == [changed_day],
+              f"only {changed_day:%Y-%m-%d} was dropped from the metrics cache")
+
+        print("4. Rejecting forged notifications...")
+        channel_id = next(iter(push.channels))
+        rejected = push.rejected
+        check(post(receiver.url, {
+            'X-Goog-Channel-ID': channel_id,
+            'X-Goog-Channel-Token': 'forged',
+            'X-Goog-Resource-State': 'exists'
+        }) == 403, "a wrong channel token gets 403")
+        check(post(receiver.url, {
+            'X-Goog-Channel-ID': 'unknown',
+            'X-Goog-Resource-State': 'exists'
+        }) == 404, "an unknown channel gets 404")
+        check(push.rejected == rejected + 2 and not push.pending,
+              "rejected notifications are counted and trigger no sync")
+    finally:
+        push.stop()
+        receiver.stop()
+
+    check(not client.watched_calendars and not service.watch_channels,
+          "stopping closes every channel")
+
+
+def test_push_notifications():
+    with tempfile.TemporaryDirectory() as directory:
+        run(os.path.join(directory, 'events.db'))
+
+
+def main():
+    print("=" * 60)
+    print("Calendar Time Tracker - Push Notification Test")
+    print("=" * 60)
+    print()
+
+    try:
+        test_push_notifications()
+    except AssertionError:
+        return False
+
+    print()
+    print("✓ Push notifications work offline")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)